@@ -8,7 +8,9 @@
 #TODO https://github.com/FlongyDev/py-rpn калькулятор
 #TODO о, можно игнорировать только от того, кто нахуй послал! можно тегать его и тогда он будет включаться
 
+import bisect
 import functools
+import itertools
 import logging
 import os
 import signal
@@ -23,7 +25,10 @@ from watchdog.events import FileSystemEventHandler
 from watchdog.observers import Observer
 
 from src.currency_formatter import CurrencyFormatter
-from src.currency_parser import CurrencyParser
+from src.currency_parser import ENGINE_COMBINED, ENGINE_SCAN, CurrencyParser
+from src.regex_backends import BACKEND_RE2
+from src.parse_cache import ParseStateTable
+from src.chat_profiles import ChatProfiles
 from src.exchange_rates_manager import ExchangeRatesManager
 from src.settings import settings
 from src.statistics_manager import StatisticsManager
@@ -60,8 +65,8 @@ TOKEN_PLACEHOLDER = "<BOT_TOKEN>"
 
 # The apilayer key and the InfluxDB token travel in request HEADERS rather than in the
 # URL, so they have never leaked the way the bot token did. They are covered anyway:
-# _fetch_usd_rates puts the whole API response body into the text of the exception it
-# raises, and an API that ever echoes the key back would put it straight into the log.
+# ApilayerProvider.fetch puts the whole API response body into the text of the exception
+# it raises, and an API that ever echoes the key back would put it straight into the log.
 API_KEY_PLACEHOLDER = "<API_KEY>"
 INFLUX_TOKEN_PLACEHOLDER = "<INFLUX_TOKEN>"
 
@@ -292,7 +297,25 @@ bot = telebot.TeleBot(settings.bot_token)
 
 
 rates_manager = ExchangeRatesManager()
-currency_parser = CurrencyParser()
+currency_parser = CurrencyParser(
+    engine=ENGINE_SCAN if settings.parser_regex_backend == BACKEND_RE2 else ENGINE_COMBINED,
+    regex_backend=settings.parser_regex_backend,
+    profile=settings.parser_profiling,
+    cache_entries=settings.parse_cache_entries,
+    cache_bytes=settings.parse_cache_bytes,
+    workers=settings.parse_workers,
+    deadline=settings.parse_deadline,
+)
+# The last inline parse per user: the next keystroke only rescans what it changed.
+inline_parse_states = (
+    ParseStateTable(settings.inline_state_entries, settings.inline_state_ttl)
+    if settings.inline_state_entries > 0 else None
+)
+# Group chats parsed with only the currencies they write about, see src/chat_profiles.py.
+chat_profiles = (
+    ChatProfiles(currency_parser, settings.chat_profile_entries, settings.chat_profile_refresh)
+    if settings.chat_profile_entries > 0 else None
+)
 currency_formatter = CurrencyFormatter()
 statistics_manager = StatisticsManager()
 user_settings_manager = UserSettingsManager()
@@ -319,8 +342,76 @@ def _reply_in_chunks(message, text):
         bot.send_message(message.chat.id, part)
 
 
+def _format_cache_stats(stats):
+    """The /stats line about the parse result cache, or nothing when it is off."""
+    if stats is None:
+        return ""
+    return (
+        f"Кэш разбора: попаданий {stats['hits']}, промахов {stats['misses']}, "
+        f"вытеснено {stats['evictions']} "
+        f"({stats['entries']}/{stats['max_entries']} записей, "
+        f"{stats['bytes'] // 1024}/{stats['max_bytes'] // 1024} КиБ)\n"
+    )
+
+
+def _format_pool_stats(stats):
+    """The /stats line about the parse worker pool, or nothing when parsing is in-process."""
+    if stats is None:
+        return ""
+    return (
+        f"Пул разбора: {stats['workers']} процессов, {'исправен' if stats['healthy'] else 'НЕИСПРАВЕН'}; "
+        f"задач {stats['submitted']}, по таймауту {stats['timeouts']}, "
+        f"разобрано в боте {stats['fallbacks']}, перезапусков {stats['restarts']}, "
+        f"замен зависшего пула {stats['recycles']}\n"
+    )
+
+
+def _format_chat_profile_stats(stats):
+    """The /stats line about per-chat parsing, or nothing when it is off."""
+    if stats is None:
+        return ""
+    return (
+        f"Разбор по профилю чата: {stats['chats']} чатов; по своим валютам {stats['subset_parses']}, "
+        f"полностью {stats['full_parses']}, из них после подозрения на пропуск {stats['fallbacks']}\n"
+    )
+
+
+def _format_provider_stats(stats):
+    """The /stats lines about the rate providers, in the order the next update asks them."""
+    lines = []
+    for provider in stats:
+        latency = "—" if provider['latency'] is None else f"{provider['latency'] * 1000:.0f} мс"
+        lines.append(
+            f"Курсы из {provider['name']}: запросов {provider['requests']}, ошибок {provider['failures']}, "
+            f"выиграно {provider['wins']}, задержка {latency}\n"
+        )
+    return "".join(lines)
+
+
+def _format_leadership(role):
+    """The /stats line about leader election; nothing while it is off."""
+    if role is None:
+        return ""
+    if role == "leader":
+        return "Обновление курсов: ведущий процесс\n"
+    return "Обновление курсов: ведомый процесс (курсы из кэша ведущего)\n"
+
+
+def _parse_inline_query(query):
+    """find_currency_matches() of an inline query, incremental per user when enabled.
+
+    Telegram sends a new inline query for nearly every character typed, so the
+    previous query of the same user is almost always this one minus a keystroke.
+    """
+    if inline_parse_states is None:
+        return currency_parser.find_currency_matches(query.query)
+    state = currency_parser.parse_incremental(query.query, inline_parse_states.get(query.from_user.id))
+    inline_parse_states.put(query.from_user.id, state)
+    return list(state.matches)
+
+
 def _collect_rates(found_currencies, user_currencies):
-    """Fetch exactly the rates the formatter is going to use.
+    """Fetch exactly the rates the formatter is going to use, as one RateTable.
 
     The fallback is `default_currencies`, the same list format_conversion() falls back
     to when no user settings exist — using `target_currencies` (the whole reference
@@ -328,7 +419,7 @@ def _collect_rates(found_currencies, user_currencies):
     for every amount found, on every keystroke in inline mode.
 
     USD is always included: format_conversion()'s "more than a million dollars" guard
-    looks up `<source>_USD` in this dict, and it must not silently misfire just because
+    looks up the <source> -> USD rate, and it must not silently misfire just because
     the user configured a currency list without the dollar in it.
     """
     targets = list(user_currencies) if user_currencies else list(currency_formatter.default_currencies)
@@ -336,21 +427,13 @@ def _collect_rates(found_currencies, user_currencies):
         targets.append('USD')
 
     # Over the set of source CURRENCIES, not over the amounts: a message with twelve
-    # sums in roubles asked the manager for the same twelve rates twelve times (each
-    # call takes the manager's lock) and wrote the same key into `rates` twelve times.
-    # dict.fromkeys instead of set(): it keeps the order the currencies were found in,
-    # which keeps the number of get_rate calls predictable in tests and in the log.
+    # sums in roubles does not need the same rates twelve times. dict.fromkeys instead
+    # of set(): it keeps the order the currencies were found in.
     sources = dict.fromkeys(curr for _amount, curr, _original in found_currencies)
 
-    rates = {}
-    for curr in sources:
-        for target in targets:
-            if target == curr:
-                continue
-            rate = rates_manager.get_rate(curr, target)
-            if rate:
-                rates[f"{curr}_{target}"] = rate
-    return rates
+    # One call, one snapshot: every line of the reply is converted with the same
+    # rates even when an update lands halfway, and nothing takes a lock.
+    return rates_manager.get_rates(sources, targets)
 
 
 def _is_forwarded(message):
@@ -370,6 +453,34 @@ def _is_forwarded(message):
     return any(getattr(message, field, None) is not None for field in legacy_fields)
 
 
+# Message entities whose text is never an amount to convert: links and addresses, code,
+# and the @names, #tags and /commands. Their digits are the main source of false matches
+# ("example.com/item/100-usd", a pasted log line), and skipping them is less to scan.
+EXCLUDED_ENTITY_TYPES = frozenset({
+    'url', 'email', 'phone_number', 'mention', 'hashtag', 'bot_command', 'code', 'pre',
+})
+
+
+def _excluded_spans(text, entities):
+    """(start, end) offsets into `text` of the entities the parser should not read.
+
+    Telegram counts entity offsets in UTF-16 code units, where a character outside the
+    Basic Multilingual Plane (most emoji) takes two; Python indexes code points. The
+    offsets are mapped back only when the text has such a character.
+    """
+    entities = [entity for entity in entities or () if entity.type in EXCLUDED_ENTITY_TYPES]
+    if not entities or not text:
+        return None
+    if len(text.encode('utf-16-le')) == 2 * len(text):
+        return [(entity.offset, entity.offset + entity.length) for entity in entities]
+    # UTF-16 offset of the start of every character, and of the end of the text.
+    units = list(itertools.accumulate((2 if ord(char) > 0xFFFF else 1 for char in text), initial=0))
+    return [
+        (bisect.bisect_left(units, entity.offset), bisect.bisect_left(units, entity.offset + entity.length))
+        for entity in entities
+    ]
+
+
 @bot.message_handler(commands=['start', 'help'])
 def send_welcome(message):
     """Handle /start and /help.
@@ -494,8 +605,14 @@ def send_statistics(message):
             f"Всего обычных запросов: {stats['total_requests']}\n"
             f"Всего инлайн-запросов: {stats['total_inline_requests']}\n"
             f"Уникальных пользователей: {stats['unique_users']}\n"
-            f"Уникальных чатов: {stats['unique_chats']}\n\n"
-            f"Топ-{stat_limit} пользователей:\n"
+            f"Уникальных чатов: {stats['unique_chats']}\n"
+            f"Текстов без сумм, отсеянных до разбора: {currency_parser.prefilter_rejections()}\n"
+            + _format_cache_stats(currency_parser.cache_stats())
+            + _format_pool_stats(currency_parser.pool_stats())
+            + _format_chat_profile_stats(chat_profiles.stats() if chat_profiles is not None else None)
+            + _format_leadership(rates_manager.leadership())
+            + _format_provider_stats(rates_manager.provider_stats())
+            + f"\nТоп-{stat_limit} пользователей:\n"
             + "\n".join(f"{('@' + user['username']) if user.get('username') else user['display_name']}: "
                         f"{user['total_requests']} (обычных: {user['requests']}, инлайн: {user['inline_requests']}) "
                         f"[активность: {user['last_active_str']}]"
@@ -505,6 +622,19 @@ def send_statistics(message):
                         for chat in stats['top_chats'])
         )
 
+        # Only with PARSER_PROFILING on: which patterns cost the most, and how many
+        # never matched at all — the candidates for pruning or reordering.
+        profile = currency_parser.pattern_profile()
+        if profile is not None:
+            costliest = sorted(profile, key=lambda row: row['seconds'], reverse=True)[:stat_limit]
+            response += (
+                f"\n\nТоп-{stat_limit} шаблонов по времени разбора:\n"
+                + "\n".join(f"#{row['row']} {row['currency']}: {row['seconds'] * 1000:.1f} мс, "
+                            f"совпадений {row['matches']}, оставлено {row['survived']}"
+                            for row in costliest)
+                + f"\nШаблонов без единого совпадения: {sum(1 for row in profile if not row['matches'])}"
+            )
+
         _reply_in_chunks(message, response)
 
     except telebot.apihelper.ApiTelegramException as e:
@@ -518,7 +648,7 @@ def handle_inline_query(query):
     try:
         # With the positions, not just the triples: the "Дополняй" result below splices
         # the conversions into the original text and needs to know where each match was.
-        found_matches = currency_parser.find_currency_matches(query.query)
+        found_matches = _parse_inline_query(query)
         # m[:3] rather than naming the fields: CurrencyMatch orders them so that the
         # first three are exactly what find_currencies returns, and this stays true
         # if the field order ever changes.
@@ -660,7 +790,7 @@ def handle_photo(message):
     # ApiTelegramException / Exception split as the command handlers), so nothing can
     # escape into the polling loop from either of them.
     if message.caption:
-        return parse_text(message.caption, message)
+        return parse_text(message.caption, message, message.caption_entities)
     else:
         return None
 
@@ -668,9 +798,9 @@ def handle_photo(message):
 def handle_message(message):
     # content_types defaults to ['text'], so photos never reach this handler —
     # they go to handle_photo above.
-    return parse_text(message.text, message)
+    return parse_text(message.text, message, message.entities)
 
-def parse_text(text, message):
+def parse_text(text, message, entities=None):
     try:
         is_group_chat = message.chat.type in ['group', 'supergroup']
         # `from_user` is None when the replied-to message was posted on behalf of a
@@ -713,7 +843,12 @@ def parse_text(text, message):
                 bot.reply_to(message, "Ну и конвертируйте сами теперь!!")
                 return
 
-        found_currencies = currency_parser.find_currencies(text)
+        # Links, code and the like are cut out before parsing; see EXCLUDED_ENTITY_TYPES.
+        exclude = _excluded_spans(text, entities)
+        if is_group_chat and chat_profiles is not None:
+            found_currencies = chat_profiles.find_currencies(message.chat.id, text, exclude)
+        else:
+            found_currencies = currency_parser.find_currencies(text, exclude)
 
         if not found_currencies:
             if not is_group_chat:
@@ -811,7 +946,7 @@ def shutdown_managers():
     """
     # Rates first: it is the only one that may be in the middle of an outbound HTTP
     # request, and close() waits for that thread with a timeout.
-    for name in ("rates_manager", "statistics_manager", "user_settings_manager"):
+    for name in ("rates_manager", "statistics_manager", "user_settings_manager", "currency_parser"):
         manager = globals().get(name)
         if manager is None:
             continue
@@ -0,0 +1,177 @@
+"""Case folding done once per text, so the parser's patterns can run without IGNORECASE.
+
+Under re.IGNORECASE every literal and every class of a pattern compares
+unicode_tolower() of the text's character, plus the few extra pairs `re` knows about
+("ı"/"i", "ſ"/"s", "ς"/"σ", the old Cyrillic "ᲁ"/"д"), and ~150 patterns do that again
+for every character they look at. fold_text() maps each character of a message once
+to the representative of its IGNORECASE class, fold_pattern() does the same to the
+literals of a pattern, and the folded pattern then matches the folded text
+case-sensitively exactly where the original matched the original text.
+
+The fold is one character for one, so an offset into the folded text is the same
+offset into the original — matches index the text the caller passed with no offset
+map. That is also why it is neither str.casefold() ("ß" becomes "ss") nor a Unicode
+normalisation: both change lengths, and both would make the patterns accept text
+they do not accept today.
+"""
+
+import functools
+import re
+import sys
+from re import _casefix  # pyright: ignore[reportAttributeAccessIssue]
+from typing import Dict, Optional, Tuple
+import _sre
+
+
+def _representative(lower: int) -> int:
+    """The member of lower's IGNORECASE class the fold maps the whole class to.
+
+    Where the class has one, the lowercase of its uppercase: "σ" for "σ" and "ς",
+    "i" for "i" and "ı" — the character str.lower() gives for most of the class, so
+    that the fast path of fold_text() rarely has to give way.
+    """
+    members = (lower,) + _casefix._EXTRA_CASES.get(lower, ())
+    if len(members) == 1:
+        return lower
+    candidates = set()
+    for member in members:
+        upper = chr(member).upper()
+        candidates.add(_sre.unicode_tolower(ord(upper)) if len(upper) == 1 else None)
+    if len(candidates) == 1 and None not in candidates:
+        return candidates.pop()
+    return min(members)
+
+
+@functools.lru_cache(maxsize=None)
+def _tables() -> Tuple[Dict[int, int], 're.Pattern']:
+    """The fold as a str.translate() table, and a regex for the characters where
+    str.lower() gives something else. Built on first use, in ~0.1 s."""
+    representatives = {lower: _representative(lower) for lower in _casefix._EXTRA_CASES}
+    fold = {}
+    irregular = []
+    for code in range(sys.maxunicode + 1):
+        lower = _sre.unicode_tolower(code)
+        folded = representatives.get(lower, lower)
+        if folded != code:
+            fold[code] = folded
+        # str.lower() is unicode_tolower() for every character but "İ", whose full
+        # lowercase is two characters; it differs from the fold where that picks
+        # another member of the class.
+        if folded != lower:
+            irregular.append(code)
+    # "İ" for the above, and "Σ": it lowercases to "ς" at the end of a word and to
+    # "σ" elsewhere, and str.lower() cannot be asked which one it chose.
+    irregular += [0x0130, 0x03A3]
+    pattern = re.compile('[' + ''.join(re.escape(chr(code)) for code in sorted(set(irregular))) + ']')
+    return fold, pattern
+
+
+def fold_text(text: str) -> str:
+    """`text` with every character replaced by the representative of its IGNORECASE class.
+
+    str.lower() where it folds the same way — all but a few hundred characters, none
+    of them in ordinary Russian or English text — and the character table otherwise,
+    which is an order of magnitude slower.
+    """
+    fold, irregular = _tables()
+    if irregular.search(text) is None:
+        return text.lower()
+    return text.translate(fold)
+
+
+def fold_char(char: str) -> str:
+    return chr(_tables()[0].get(ord(char), ord(char)))
+
+
+# Escapes that stand for a character class or an anchor: case plays no part in them.
+_CLASS_ESCAPES = frozenset('dDsSwWbBAZ')
+
+
+def fold_pattern(pattern: str) -> Tuple[str, Optional[str]]:
+    """The pattern for folded text, and the text its case-sensitive tail has to match.
+
+    Literals and the members of character classes are folded; escapes, group syntax
+    and quantifiers are copied. A `(?-i:...)` group — the ISO code of a generated
+    row, which must keep its case ("5 KWD", not "5 kwd") — cannot be said in a pattern
+    that never sees case, so it is folded as well and returned as the second value:
+    the caller keeps a match only if the original text ends in it. That is only
+    sound at the end of the pattern, where nothing after the code consumes anything,
+    and only for plain literals; anything else the table does not use is refused with
+    ValueError rather than folded wrongly.
+    """
+    out = []
+    exact = None
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if char == '\\':
+            escaped = pattern[index + 1]
+            if escaped.isalnum() and escaped not in _CLASS_ESCAPES:
+                raise ValueError(f"Cannot fold the escape \\{escaped} in {pattern!r}")
+            out.append(_folded_literal(pattern[index:index + 2], escaped))
+            index += 2
+        elif char == '[':
+            end, members = _class_members(pattern, index)
+            out.append(members)
+            index = end
+        elif pattern.startswith('(?-i:', index):
+            end = pattern.index(')', index)
+            literal = pattern[index + 5:end]
+            if re.escape(literal) != literal or pattern[end + 1:] not in ('', r'\b'):
+                raise ValueError(f"Cannot fold the case-sensitive group in {pattern!r}: only a literal at the end is supported")
+            exact = literal
+            out.append(re.escape(''.join(fold_char(letter) for letter in literal)))
+            index = end + 1
+        elif pattern.startswith('(?', index):
+            header = re.match(r'\(\?(?:P<\w+>|[:=!]|<[=!])', pattern[index:])
+            if header is None:
+                raise ValueError(f"Cannot fold the group at {index} of {pattern!r}")
+            out.append(header.group(0))
+            index += len(header.group(0))
+        else:
+            out.append(char if char in '.^$*+?{}|()' else _folded_literal(char, char))
+            index += 1
+    return ''.join(out), exact
+
+
+def _folded_literal(source: str, char: str) -> str:
+    """`source`, the spelling of `char` in a pattern, for folded text. A character
+    the fold keeps keeps its spelling, so a folded pattern contains the unfolded
+    pieces it was built from (the amount regex) verbatim."""
+    if source[0] == '\\' and char.isalnum():
+        return source
+    folded = fold_char(char)
+    return source if folded == char else re.escape(folded)
+
+
+def _class_members(pattern: str, start: int) -> Tuple[int, str]:
+    """The character class at `start` with its members folded, and where it ends."""
+    out = ['[']
+    index = start + 1
+    if pattern[index] == '^':
+        out.append('^')
+        index += 1
+    first = True
+    while first or pattern[index] != ']':
+        first = False
+        char = pattern[index]
+        if char == '\\':
+            escaped = pattern[index + 1]
+            if escaped.isalnum() and escaped not in _CLASS_ESCAPES:
+                raise ValueError(f"Cannot fold the escape \\{escaped} in {pattern!r}")
+            out.append(_folded_literal(pattern[index:index + 2], escaped))
+            index += 2
+            continue
+        if pattern[index + 1] == '-' and pattern[index + 2] != ']':
+            low, high = ord(char), ord(pattern[index + 2])
+            # A range folds member by member; only one no member of which folds is
+            # kept as it is.
+            if any(ord(fold_char(chr(code))) != code for code in range(low, high + 1)):
+                raise ValueError(f"Cannot fold the range {char}-{pattern[index + 2]} in {pattern!r}")
+            out.append(pattern[index:index + 3])
+            index += 3
+            continue
+        out.append(_folded_literal(char, char))
+        index += 1
+    out.append(']')
+    return index + 1, ''.join(out)
@@ -0,0 +1,114 @@
+"""Per-chat currency profiles, and parsing a chat's messages with only its currencies.
+
+A group chat writes about the same two or three currencies for months. The full
+pattern table still runs over every one of its messages — ~150 rows on the scan
+engine — although the rows of a currency nobody in that chat has ever mentioned
+almost never match there. So each chat gets a profile of the currencies its full
+parses found, and once that has seen enough, its messages are parsed by a variant of
+the parser with only those rows (CurrencyParser.variant).
+
+A variant can miss what the full table would find. Two things bound that:
+
+    fallback   every variant parse is checked by the variant's suspect pattern
+               (CurrencyParser.may_have_missed); where a left-out row could have
+               matched, the message is parsed again by the full parser
+    refresh    every `refresh_every`-th message of a chat is parsed in full anyway,
+               and what it finds is added to the profile
+
+Profiles hold currency codes and counters, never message text, and are bounded by
+chat count: past `max_chats` the least recently active chat is dropped.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from src.currency_parser import CurrencyMatch, CurrencyParser
+
+# A chat whose full parses found more currencies than this is always parsed in full:
+# its variant would be close to the whole table, and every distinct set is a
+# sub-parser to build and keep.
+MAX_PROFILE_CURRENCIES = 8
+
+
+class _Profile:
+    __slots__ = ('currencies', 'matches', 'since_full')
+
+    def __init__(self) -> None:
+        self.currencies: Set[str] = set()
+        # Matches seen in full parses, and messages parsed since the last full parse.
+        self.matches = 0
+        self.since_full = 0
+
+
+class ChatProfiles:
+    """Which currencies each chat writes about, and the parser that follows from it."""
+
+    def __init__(self, parser: CurrencyParser, max_chats: int, refresh_every: int = 50, min_matches: int = 3):
+        if max_chats <= 0 or refresh_every <= 0 or min_matches <= 0:
+            raise ValueError(f"Chat profile bounds must be positive, got {max_chats} chats, "
+                             f"a refresh every {refresh_every} messages and {min_matches} matches")
+        self.parser = parser
+        self.max_chats = max_chats
+        self.refresh_every = refresh_every
+        self.min_matches = min_matches
+        # Least recently active first.
+        self._profiles: "OrderedDict[Hashable, _Profile]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'subset_parses': 0, 'full_parses': 0, 'fallbacks': 0}
+
+    def find_currency_matches(self, chat_id: Hashable, text: str,
+                              exclude: Optional[Iterable[Tuple[int, int]]] = None) -> List[CurrencyMatch]:
+        """The parser's find_currency_matches(text, exclude), with the chat's variant where it has one."""
+        exclude = None if exclude is None else list(exclude)
+        with self._lock:
+            profile = self._profiles.get(chat_id)
+            if profile is None:
+                profile = self._profiles[chat_id] = _Profile()
+                while len(self._profiles) > self.max_chats:
+                    self._profiles.popitem(last=False)
+            self._profiles.move_to_end(chat_id)
+            subset = None
+            if (profile.matches >= self.min_matches and profile.since_full + 1 < self.refresh_every
+                    and profile.currencies and len(profile.currencies) <= MAX_PROFILE_CURRENCIES):
+                subset = frozenset(profile.currencies)
+                profile.since_full += 1
+
+        if subset is not None:
+            variant = self.parser.variant(subset)
+            matches = variant.find_currency_matches(text, exclude)
+            if not variant.may_have_missed(text, matches, exclude):
+                self._count('subset_parses')
+                return matches
+            self._count('fallbacks')
+
+        matches = self.parser.find_currency_matches(text, exclude)
+        self._count('full_parses')
+        with self._lock:
+            profile.currencies.update(match.currency_code for match in matches)
+            profile.matches += len(matches)
+            profile.since_full = 0
+        return matches
+
+    def find_currencies(self, chat_id: Hashable, text: str,
+                        exclude: Optional[Iterable[Tuple[int, int]]] = None) -> List[Tuple[float, str, str]]:
+        """find_currency_matches() as the parser's find_currencies() shapes it."""
+        return [match[:3] for match in self.find_currency_matches(chat_id, text, exclude)]
+
+    def currencies(self, chat_id: Hashable) -> Set[str]:
+        """The currencies the chat's full parses have found so far."""
+        with self._lock:
+            profile = self._profiles.get(chat_id)
+            return set() if profile is None else set(profile.currencies)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters, chats=len(self._profiles))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._profiles)
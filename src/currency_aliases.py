@@ -0,0 +1,185 @@
+"""How currencies are written in chat, as data, and the pattern rows compiled from it.
+
+Every currency the parser knows by name lists its aliases here as plain text — no
+regex. `compile_alias_rows()` turns the table into the hand-written half of the
+parser's pattern table: at most one row per currency and position, each unit a trie
+of all its aliases, so that "доллар", "долларов" and "доллара" are one `доллар(?:ов|а)?`
+that reads the shared letters once. An alias added to a currency extends that
+currency's rows; it never adds a row, and so never another pass over the text.
+
+Forms are spelled out with braces, `'доллар{ов,а,}'` being "долларов", "доллара" and
+"доллар"; an empty choice is allowed. Aliases compare case-insensitively, as the rows
+are run, so "usd" and "USD" are one alias and listing both is harmless.
+"""
+
+import itertools
+import re
+from dataclasses import dataclass
+from typing import Dict, Final, Iterable, List, Tuple
+
+
+@dataclass(frozen=True)
+class Aliases:
+    # After the amount, as a whole word: "5 долларов", "5долларов", not "5 долларовый".
+    words: Tuple[str, ...] = ()
+    # After the amount, with nothing asked of what follows: "5₪", "5 ₪x". The boundary
+    # check of the parser still applies.
+    symbols: Tuple[str, ...] = ()
+    # In front of the amount, which has to end as a whole number: "$5".
+    prefixes: Tuple[str, ...] = ()
+    # Like `words`, but only with whitespace in between: "5 лв", never "5лв".
+    spaced: Tuple[str, ...] = ()
+    # Like `words`, but not as the head of a hyphenated word: "5 реал-мадрид".
+    unhyphenated: Tuple[str, ...] = ()
+    # An amount by themselves, no number needed: "килобакс" is 1000 USD.
+    standalone: Tuple[str, ...] = ()
+
+
+# In table order: where two currencies match at the same place, the one listed first
+# is kept ("5 лей" is MDL, although RON lists it too).
+ALIASES: Final[Dict[str, Aliases]] = {
+    'ILS': Aliases(words=('шекел{ей,я,ь}', 'шек', 'шах', 'ils'), symbols=('₪',)),
+    'GBP': Aliases(words=('фунт{ов,а,}', 'паунд{ов,а,}', 'квид{ов,а,}', 'pound', 'quid', 'gbp', 'gbr'),
+                   symbols=('£',), prefixes=('£',)),
+    'RUB': Aliases(words=('руб{лей,ля,ль}', 'rub'), symbols=('₽',)),
+    'RUBK': Aliases(words=('килоруб{лей,ля,ль}',), standalone=('килоруб{лей,ля,ль}',)),
+    'USD': Aliases(words=('доллар{ов,а,}', 'бакс{ов,а,}', 'usd'), symbols=('$',), prefixes=('$',)),
+    'USDCENT': Aliases(words=('цент{ов,а,}', 'cent', 'cents')),
+    'USDK': Aliases(words=('килобакс{ов,а,}',), standalone=('килобакс{ов,а,}',)),
+    'EUR': Aliases(words=('евро', 'eur'), symbols=('€',), prefixes=('€',)),
+    'EURCENT': Aliases(words=('евроцент{ов,а,}', 'eurocent', 'eurocents')),
+    'EURK': Aliases(words=('килоевро', 'eurk'), standalone=('килоевро{ов,а,}',)),
+    'JPY': Aliases(words=('йен{а,ы,}', 'jpy'), symbols=('¥',), prefixes=('¥',)),
+    'KRW': Aliases(words=('вон{а,ы,}', 'krw'), symbols=('₩',), prefixes=('₩',)),
+    'PLN': Aliases(words=('злот{ый,ых,ого,ые}', 'pln'), symbols=('zł',)),
+    'TRY': Aliases(words=('лир{а,ы,}', 'турецк{ая,ой,их,ую} лир{а,ы,}', 'try'), symbols=('₺', '₤'), prefixes=('₤', '₺')),
+    'CZK': Aliases(words=('крон{а,ы,}', 'чешск{ая,ой,их,ую} крон{а,ы,}', 'czk'), symbols=('Kč',)),
+    'UAH': Aliases(words=('гривн{а,ы,}', 'гривен', 'грн', 'uah'), symbols=('₴',)),
+    'BYN': Aliases(words=('белорусск{их,ого,ий,ие} руб{лей,ля,ль}', 'беларуск{их,ого,ий,ие} руб{лей,ля,ль}', 'byn'),
+                   symbols=('Br',)),
+    'AMD': Aliases(words=('драм{ов,а,}',)),
+    'CNY': Aliases(words=('юан{ей,я,ь}', 'cny')),
+    'GEL': Aliases(words=('лари', 'gel')),
+    'RSD': Aliases(words=('динар{ов,а,}', 'rsd')),
+    'THB': Aliases(words=('бат{ов,а,}', 'thb')),
+    'KZT': Aliases(words=('тенге', 'тг', 'kzt')),
+    'CAD': Aliases(words=('канадск{их,ого,ий} доллар{ов,а,}', 'cad')),
+    'MXN': Aliases(words=('песо', 'мексиканск{их,ого,ий,ое} песо', 'mxn')),
+    'ARS': Aliases(words=('аргентинск{их,ого,ий,ое} песо', 'ars')),
+    'MDL': Aliases(words=('ле{й,я,и,ев}', 'молдавск{их,ого,ий} ле{й,я,ев}', 'mdl')),
+    'RON': Aliases(words=('румынск{их,ого,ий} ле{й,я,ев}', 'ле{й,я,ев}', 'leu', 'ron', 'рон{ов,а,}')),
+    'VND': Aliases(words=('донг{ов,а,}', 'vnd', 'dd'), symbols=('₫',)),
+    # "лв" only after whitespace ("5 лв", not "5лв").
+    'BGN': Aliases(words=('лев{ов,а,}', 'болгарск{их,ого,ий} лев{ов,а,}', 'bgn'), spaced=('лв',)),
+    'AED': Aliases(words=('дирхам{ов,а,}', 'aed'), symbols=('د.إ', 'dh')),
+    'PHP': Aliases(words=('филиппинск{их,ого,ий,ое} песо', 'piso', 'php'), symbols=('₱',), prefixes=('₱',)),
+    # Tajikistani somoni
+    'TJS': Aliases(words=('сомони', 'tjs')),
+    # Uzbekistani so'm (sum) and som (user requested mapping to UZS)
+    'UZS': Aliases(words=('сум{ов,а,}', 'сом{ов,а,}', 'uzs')),
+    # Brazilian real. Listing "brl" here makes _already_matched() in the parser drop
+    # the generated ISO fallback for BRL, so this row REPLACES it — the code now
+    # matches in any case ("brl", "Brl"), a deliberate widening of the strictly
+    # case-sensitive fallback ("brl" is not an English word). "риал"/"риял"
+    # (SAR/IRR/QAR) are different words and are NOT matched.
+    # Known trade-off: "Реал" the football club is indistinguishable from the
+    # currency — same compromise as "5 вон" (KRW) or "5 лей" (MDL). Refusing the
+    # hyphenated head removes only the hyphenated spelling ("5 реал-мадрид"); "3 Реал
+    # Мадрид" and "Барселона 3:1 Реал" still parse as BRL. It also drops any
+    # hyphenated continuation after the bare form ("5 реалов-то", "5 реалов-2024") —
+    # accepted; the adjective form ("бразильских реалов-то") still matches.
+    'BRL': Aliases(words=('бразильск{их,ого,ий} реал{ов,а,}', 'brl'), unhyphenated=('реал{ов,а,}',)),
+}
+
+
+def expand(alias: str) -> List[str]:
+    """Every form a braced alias stands for, in order: 'лир{а,ы,}' -> лира, лиры, лир."""
+    parts = re.split(r'\{([^{}]*)\}', alias)
+    choices = [[part] if index % 2 == 0 else part.split(',') for index, part in enumerate(parts)]
+    return [''.join(form) for form in itertools.product(*choices)]
+
+
+def _key(char: str) -> str:
+    # The rows run with IGNORECASE, which compares one lowercase character to another.
+    lower = char.lower()
+    return lower if len(lower) == 1 else char
+
+
+def _escape(char: str) -> str:
+    return char if char == ' ' else re.escape(char)
+
+
+def trie_pattern(aliases: Iterable[str]) -> str:
+    """One group-free regex matching exactly the given forms, shared prefixes factored.
+
+    Forms that differ only in case are one path. At every fork the longer branches
+    come first and a form that ends there is the last, empty choice — the greedy order
+    the hand-factored `доллар(?:ов|а|)` had; the branches of a fork start with
+    different characters, so their order among themselves cannot change a match.
+    """
+    trie: dict = {}
+    for alias in aliases:
+        for form in expand(alias):
+            node = trie
+            for char in form:
+                node = node.setdefault(_key(char), {})
+            node[''] = {}
+    return _node_pattern(trie)
+
+
+def _node_pattern(node: dict) -> str:
+    # Siblings whose continuations are the same regex share it behind one class:
+    # "белорусских", "белорусский", "белорусские" + " рублей" is и[хйе] рубл(?:ей|[яь]).
+    groups: Dict[str, List[str]] = {}
+    for char, child in node.items():
+        if char:
+            groups.setdefault(_node_pattern(child), []).append(char)
+    optional = '?' if '' in node else ''
+    if not groups:
+        return ''
+    branches = [
+        (_escape(chars[0]) if len(chars) == 1 else f"[{''.join(re.escape(char) for char in chars)}]") + rest
+        for rest, chars in groups.items()
+    ]
+    if len(branches) == 1 and not optional:
+        return branches[0]
+    if len(branches) == 1 and not next(iter(groups)):
+        # One character or one class: an atom, quantifiable as it is.
+        return branches[0] + optional
+    return f"(?:{'|'.join(branches)}){optional}"
+
+
+def compile_alias_rows(number: str, aliases: Dict[str, Aliases] = ALIASES) -> List[Tuple[str, str]]:
+    """The pattern rows for the alias table: (currency, pattern), in table order.
+
+    `number` is the parser's amount regex with its `amount` group. Per currency, in
+    this order and only where it has such aliases:
+        <prefix><amount>\\b
+        <amount>\\s*(?:<word>\\b|<unhyphenated>(?!-\\w)\\b|<symbol>)
+        <amount>\\s+<spaced>\\b
+        (?P<amount>)<standalone>\\b
+    trie_pattern never returns a bare top-level `|`, so a unit takes its `\\b` as it is.
+    A currency's prefix and suffix rows cannot start at the same character — one
+    starts on a symbol, the other on a digit — so keeping them apart changes no
+    tie-break; they are apart because each needs its own `amount` group.
+    """
+    rows: List[Tuple[str, str]] = []
+    for currency, entry in aliases.items():
+        if entry.prefixes:
+            rows.append((currency, fr'{trie_pattern(entry.prefixes)}{number}\b'))
+        units: List[str] = []
+        if entry.words:
+            units.append(fr'{trie_pattern(entry.words)}\b')
+        if entry.unhyphenated:
+            units.append(fr'{trie_pattern(entry.unhyphenated)}(?!-\w)\b')
+        if entry.symbols:
+            units.append(trie_pattern(entry.symbols))
+        if units:
+            unit = units[0] if len(units) == 1 else f"(?:{'|'.join(units)})"
+            rows.append((currency, fr'{number}\s*{unit}'))
+        if entry.spaced:
+            rows.append((currency, fr'{number}\s+{trie_pattern(entry.spaced)}\b'))
+        if entry.standalone:
+            rows.append((currency, fr'(?P<amount>){trie_pattern(entry.standalone)}\b'))
+    return rows
+
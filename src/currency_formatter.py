@@ -3,12 +3,13 @@
 # pylance: disable=reportMissingImports, reportMissingModuleSource, reportGeneralTypeIssues
 # type: ignore
 
-from typing import List, Tuple, Dict, Optional
+from typing import List, Tuple, Dict, Optional, Union
 from decimal import Decimal, ROUND_HALF_UP
 import logging
 import os
 
 from src.currencies import CURRENCIES
+from src.rate_table import RateTable, lookup_rate
 
 logging.basicConfig(
     level=logging.INFO,
@@ -70,8 +71,12 @@ class CurrencyFormatter:
         else:
             return f"{currency.flag} {formatted} {currency.symbol}"
 
-    def format_conversion(self, currency_data: Tuple[float, str, str], rates: Dict[str, float], mode: str, user_currencies: Optional[List[str]] = None) -> str:
-        """Format currency conversion result into message"""
+    def format_conversion(self, currency_data: Tuple[float, str, str], rates: Union[RateTable, Dict[str, float]], mode: str, user_currencies: Optional[List[str]] = None) -> str:
+        """Format currency conversion result into message.
+
+        `rates` is the RateTable of the reply (see bot._collect_rates), or a plain
+        {"SRC_TGT": rate} dict.
+        """
         amount, currency_code, original = currency_data
         currency = CURRENCIES[currency_code]
 
@@ -93,7 +98,7 @@ class CurrencyFormatter:
             if currency_code == 'USD':
                 usd_amount = Decimal(str(amount))
             else:
-                rate = rates.get(f"{currency_code}_USD")
+                rate = lookup_rate(rates, currency_code, 'USD')
                 if rate:
                     usd_amount = Decimal(str(amount)) * Decimal(str(rate))
             if usd_amount is not None and usd_amount >= RICH_JOKE_THRESHOLD_USD:
@@ -123,7 +128,7 @@ class CurrencyFormatter:
                 continue
                 
             try:
-                rate = rates.get(f"{currency_code}_{target_curr}")
+                rate = lookup_rate(rates, currency_code, target_curr)
                 if rate is None:
                     continue
                     
@@ -143,7 +148,7 @@ class CurrencyFormatter:
             
         return message
     
-    def format_multiple_conversions(self, currency_list: List[Tuple[float, str, str]], rates: Dict[str, float], mode: str = 'chat', user_currencies: Optional[List[str]] = None) -> Optional[str]:
+    def format_multiple_conversions(self, currency_list: List[Tuple[float, str, str]], rates: Union[RateTable, Dict[str, float]], mode: str = 'chat', user_currencies: Optional[List[str]] = None) -> Optional[str]:
         """Format multiple currency conversions.
 
         None (not an empty string) for an empty list — the callers in bot.py treat a
@@ -3,12 +3,29 @@
 # pylance: disable=reportMissingImports, reportMissingModuleSource, reportGeneralTypeIssues
 # type: ignore
 
+import copy
+import hashlib
+import json
 import re
-from typing import List, NamedTuple, Optional, Tuple
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from re import _casefix, _constants as _sre_constants, _parser as _sre_parser
+from typing import Dict, FrozenSet, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple, Union
+import _sre
 import logging
 import os
 
+from src.case_folding import fold_char, fold_pattern, fold_text
 from src.currencies import CURRENCIES
+from src.currency_aliases import compile_alias_rows, trie_pattern
+from src.parse_cache import ParseCache, text_key
+from src.parse_pool import ParsePool, ParseTimeout, parse_in_processes
+from src import regex_backends
+from src.regex_backends import BACKEND_RE, BACKEND_RE2, BACKENDS, Re2Pattern, re2_incompatibility, translate_for_re2
 
 logging.basicConfig(
     level=logging.INFO,
@@ -31,6 +48,512 @@ AMBIGUOUS_CODES = frozenset({'ALL', 'BOB', 'CUP', 'MAD', 'MOP', 'PEN', 'SOS', 'T
 # input must degrade to "no currencies found" instead of burning CPU in the handler.
 MAX_TEXT_LENGTH = 4096
 
+# Matching engines find_currency_matches() can run on. They differ in how they walk
+# the text, never in what they return: every engine produces exactly the CurrencyMatch
+# list of the reference scan for every input.
+#   scan      the reference: one finditer() per row of the pattern table, ~150 full
+#             passes over every message.
+#   combined  one pass of a locator built from the whole table, with the rows tried
+#             only where it hits; see _raw_matches_combined for how it stays exact.
+#   tokens    walks the text once, reads every number once and picks the rows that
+#             can follow it from dictionaries keyed by the character after it; its
+#             cost grows with the numbers in the message, not with the table.
+ENGINE_SCAN = 'scan'
+ENGINE_COMBINED = 'combined'
+ENGINE_TOKENS = 'tokens'
+ENGINES = (ENGINE_SCAN, ENGINE_COMBINED, ENGINE_TOKENS)
+
+# How find_currency_matches_many() may spread a batch: over threads of this process
+# (the parse holds the GIL, so this mostly overlaps with whatever else the process
+# waits on) or over worker processes started for the batch (real parallelism, paid for
+# with a worker start-up and with pickling every text and result).
+BATCH_THREADS = 'threads'
+BATCH_PROCESSES = 'processes'
+BATCH_FAN_OUTS = (BATCH_THREADS, BATCH_PROCESSES)
+
+# The derived half of the pattern table — which ISO codes get a generated "<amount>
+# <CODE>" row, in what order — is a pure function of the hand-written rows, the amount
+# regex, the currency reference and AMBIGUOUS_CODES, but deriving it means probing
+# every hand-written row with every code. So it is derived once, when the image is
+# built (`python -m src.currency_parser`, see the Dockerfile), and stored here under a
+# hash of everything it depends on. A missing or stale file only means probing again.
+# The RE2 translation of every row is stored next to it: translating means asking
+# `re` about whole classes of characters, over every code point there is.
+PATTERN_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pattern_table.json')
+
+# Rows that stand for a multiple or a fraction of another currency ("5к$", "50
+# центов"): a match of one is reported in the currency it maps to.
+PSEUDO_CURRENCIES = {
+    'USDK': 'USD',
+    'EURK': 'EUR',
+    'RUBK': 'RUB',
+    'USDCENT': 'USD',
+    'EURCENT': 'EUR',
+}
+
+# Sub-parsers CurrencyParser.variant() keeps built, least recently used dropped first.
+# A variant shares the compiled rows of its parser and costs about a millisecond to
+# build, so this only bounds the memory of its own small regexes, and is set above the
+# number of distinct currency sets the chat profiles of a busy bot use.
+VARIANT_LIMIT = 512
+
+# How many leading characters of a row's unit (or prefix) a variant looks for to
+# notice that a row it left out could have matched; see _suspect_pattern.
+SUSPECT_PREFIX_LENGTH = 3
+_FOLDED_K = fold_char('к')
+
+# The generated row. (?-i:...) switches IGNORECASE off for the code itself: matching
+# codes case-insensitively would turn ordinary words into currency amounts ("3 top",
+# "5 mad", "2 all", "8 cup"). The compiled rows run on folded text, where the code
+# is lowercase as well; its case is checked on the original, see _with_exact_tails.
+_FALLBACK_PATTERN = r'{number}\s*(?-i:{code})\b'
+
+# A raw match as the engines produce it: (start, end, currency, amount text, matched
+# text, row of the pattern table it came from).
+_RawMatch = Tuple[int, int, str, str, str, int]
+
+# Characters past the end of a match a row can still look at: its `\b`, `(?!\w)` and
+# `(?!-\w)` lookaheads read up to two, the rest is slack. parse_incremental keeps this
+# far away from an edit on top of the widest unit.
+INCREMENTAL_LOOKAHEAD = 4
+
+# Characters before a streaming window's start kept as context: the amount's `(?<!\d)`
+# and _select_matches look one character back, the slack is for rows that may look
+# further one day.
+STREAM_CONTEXT = 8
+
+# Rows of the pattern table per pre-check block of the combined engine. Smaller blocks
+# rule out more rows per failed check but cost more checks at every hit.
+COMBINED_BLOCK_SIZE = 16
+
+
+# The tokens engine indexes the rows of the table by the characters they can start
+# with. Keys are ('=', char) for a character that has to match exactly and ('~', char)
+# for its lowercase form under IGNORECASE — the same folding `re` itself compares
+# with, including the extra case pairs it knows about (so "ᲁоллар" with the old
+# Cyrillic "ᲁ" is indexed where "доллар" is). The rows themselves run case-sensitively
+# on folded text and are indexed by '=' keys; '~' keys are left to the amount regex.
+def _char_keys(char: str) -> Tuple[Tuple[str, str], Tuple[str, str]]:
+    """Both keys a character of the text is looked up under."""
+    return ('=', char), ('~', chr(_sre.unicode_tolower(ord(char))))
+
+
+def _literal_keys(code: int, ignorecase: bool) -> Set[Tuple[str, str]]:
+    if not ignorecase:
+        return {('=', chr(code))}
+    lower = _sre.unicode_tolower(code)
+    return {('~', chr(lower))} | {('~', chr(_sre.unicode_tolower(extra))) for extra in _casefix._EXTRA_CASES.get(lower, ())}
+
+
+def _set_keys(items, ignorecase: bool) -> Optional[Set[Tuple[str, str]]]:
+    """Keys of a character class; None when it is too wide to index."""
+    keys = set()
+    for op, value in items:
+        if op is _sre_constants.LITERAL:
+            keys |= _literal_keys(value, ignorecase)
+        elif op is _sre_constants.RANGE and value[1] - value[0] <= 256:
+            for code in range(value[0], value[1] + 1):
+                keys |= _literal_keys(code, ignorecase)
+        else:
+            return None
+    return keys
+
+
+def _first_keys(items, ignorecase: bool) -> Tuple[Optional[Set[Tuple[str, str]]], bool]:
+    """Keys of every character a parsed regex can start its match with.
+
+    Returns (keys, can_match_empty). keys is None when the regex can start with
+    characters that cannot be listed (\\w, a negated class, a wide range) — such a row
+    has to be tried everywhere. Lookarounds and anchors consume nothing and are
+    skipped: they only narrow what matches, and the keys are allowed to be too many,
+    never too few.
+    """
+    keys = set()
+    for op, value in items:
+        if op in (_sre_constants.AT, _sre_constants.ASSERT, _sre_constants.ASSERT_NOT):
+            continue
+        if op is _sre_constants.LITERAL:
+            return keys | _literal_keys(value, ignorecase), False
+        if op is _sre_constants.IN:
+            found = _set_keys(value, ignorecase)
+            return (None if found is None else keys | found), False
+        if op is _sre_constants.SUBPATTERN:
+            _, add_flags, del_flags, sub = value
+            sub_ignorecase = (ignorecase or bool(add_flags & re.IGNORECASE)) and not del_flags & re.IGNORECASE
+            found, empty = _first_keys(sub.data, sub_ignorecase)
+        elif op is _sre_constants.ATOMIC_GROUP:
+            found, empty = _first_keys(value.data, ignorecase)
+        elif op is _sre_constants.BRANCH:
+            found, empty = set(), False
+            for alternative in value[1]:
+                branch, branch_empty = _first_keys(alternative.data, ignorecase)
+                if branch is None:
+                    return None, False
+                found |= branch
+                empty = empty or branch_empty
+        elif op in (_sre_constants.MAX_REPEAT, _sre_constants.MIN_REPEAT, _sre_constants.POSSESSIVE_REPEAT):
+            found, empty = _first_keys(value[2].data, ignorecase)
+            empty = empty or value[0] == 0
+        else:
+            return None, False
+        if found is None:
+            return None, False
+        keys |= found
+        if not empty:
+            return keys, False
+    return keys, True
+
+
+def _consumed_keys(items, ignorecase: bool) -> Tuple[Set[Tuple[str, str]], bool]:
+    """Keys of every character a parsed regex can consume, and whether that includes \\d.
+
+    Only what the amount regex is built from is understood; anything else is refused
+    with ValueError, so a change to the amount grammar cannot silently make the tokens
+    engine read numbers shorter than the patterns do.
+    """
+    keys, digits = set(), False
+    for op, value in items:
+        if op in (_sre_constants.AT, _sre_constants.ASSERT, _sre_constants.ASSERT_NOT):
+            continue
+        if op is _sre_constants.LITERAL:
+            keys |= _literal_keys(value, ignorecase)
+        elif op is _sre_constants.IN:
+            for item_op, item in value:
+                if item_op is _sre_constants.CATEGORY and item is _sre_constants.CATEGORY_DIGIT:
+                    digits = True
+                else:
+                    found = _set_keys([(item_op, item)], ignorecase)
+                    if found is None:
+                        raise ValueError(f"Cannot index {item_op} {item} of the amount regex")
+                    keys |= found
+        else:
+            if op is _sre_constants.SUBPATTERN:
+                subs = [value[3]]
+            elif op is _sre_constants.ATOMIC_GROUP:
+                subs = [value]
+            elif op is _sre_constants.BRANCH:
+                subs = value[1]
+            elif op in (_sre_constants.MAX_REPEAT, _sre_constants.MIN_REPEAT, _sre_constants.POSSESSIVE_REPEAT):
+                subs = [value[2]]
+            else:
+                raise ValueError(f"Cannot index {op} of the amount regex")
+            for sub in subs:
+                found, sub_digits = _consumed_keys(sub.data, ignorecase)
+                keys |= found
+                digits = digits or sub_digits
+    return keys, digits
+
+
+def _skip_leading_space(unit: str) -> str:
+    """The unit half of a row without the `\\s*` or `\\s+` it starts with.
+
+    Lazy and possessive forms are left alone: they would not be the plain run of
+    whitespace both callers take it for.
+    """
+    if unit[:3] in (r'\s*', r'\s+') and unit[3:4] not in ('?', '+'):
+        return unit[3:]
+    return unit
+
+
+def _literal_prefixes(items, limit: int) -> Optional[Set[str]]:
+    """The first `limit` characters of everything a parsed regex can match.
+
+    Shorter matches are listed whole. None when the regex can start with characters
+    that cannot be listed (\\w, a negated class, a wide range) or with too many
+    combinations of them. Lookarounds and anchors are skipped: the prefixes may be
+    too many, never too few.
+    """
+    prefixes = {''}
+    for op, value in items:
+        if all(len(prefix) >= limit for prefix in prefixes):
+            break
+        if op in (_sre_constants.AT, _sre_constants.ASSERT, _sre_constants.ASSERT_NOT):
+            continue
+        if op is _sre_constants.LITERAL:
+            options = {chr(value)}
+        elif op is _sre_constants.IN:
+            options = set()
+            for item_op, item in value:
+                if item_op is _sre_constants.LITERAL:
+                    options.add(chr(item))
+                elif item_op is _sre_constants.RANGE and item[1] - item[0] <= 64:
+                    options.update(chr(code) for code in range(item[0], item[1] + 1))
+                else:
+                    return None
+        elif op is _sre_constants.SUBPATTERN:
+            options = _literal_prefixes(value[3].data, limit)
+        elif op is _sre_constants.ATOMIC_GROUP:
+            options = _literal_prefixes(value.data, limit)
+        elif op is _sre_constants.BRANCH:
+            options = set()
+            for alternative in value[1]:
+                branch = _literal_prefixes(alternative.data, limit)
+                if branch is None:
+                    return None
+                options |= branch
+        elif op in (_sre_constants.MAX_REPEAT, _sre_constants.MIN_REPEAT, _sre_constants.POSSESSIVE_REPEAT):
+            low, high, sub = value
+            once = _literal_prefixes(sub.data, limit)
+            if once is None:
+                return None
+            options, repeated = set(), {''}
+            for count in range(min(high, limit) + 1):
+                if count >= low:
+                    options |= repeated
+                repeated = {(head + tail)[:limit] for head in repeated for tail in once}
+            if high > limit:
+                options |= repeated
+        else:
+            return None
+        if options is None:
+            return None
+        prefixes = {(prefix + option)[:limit] if len(prefix) < limit else prefix
+                    for prefix in prefixes for option in options}
+        if len(prefixes) > 4096:
+            return None
+    return prefixes
+
+
+def _row_lead(number: str, pattern: str) -> Tuple[bool, Optional[Set[str]]]:
+    """Where a match of a row can be recognised: (after an amount, first characters).
+
+    A row with a prefix or without an amount is recognised by the first characters of
+    its match, one with only a unit by those of the unit after the amount. None when
+    they cannot be listed. Lowercase, as the rows run with IGNORECASE.
+    """
+    if number not in pattern:
+        head, after_amount = pattern.replace('(?P<amount>)', ''), False
+    else:
+        prefix, unit = pattern.split(number, 1)
+        # A match starts at the prefix when there is one, so that is all to look for.
+        head, after_amount = (prefix, False) if prefix else (_skip_leading_space(unit), True)
+    found = _literal_prefixes(_sre_parser.parse(head).data, SUSPECT_PREFIX_LENGTH)
+    if found is None or '' in found:
+        return after_amount, None
+    return after_amount, {prefix.lower() for prefix in found}
+
+
+def _suspect_pattern(leads: Iterable[Tuple[bool, Optional[Set[str]]]]) -> str:
+    """A cheap regex that hits wherever one of the rows of `leads` (their _row_lead())
+    could match.
+
+    Every hit is the last digit of an amount followed by the first characters of a
+    unit, or the first characters of a prefix or of an amount-less word: a place a
+    match of the row would cover. It also hits where no row matches ("5 кил" of "5
+    килограмм" for the "кило…" rows), which only costs the caller a full parse. A
+    row whose beginning cannot be listed turns every digit, or every character, into
+    a hit. Meant to be compiled with IGNORECASE.
+    """
+    units, starts = set(), set()
+    every_digit = False
+    for after_amount, found in leads:
+        if found is None and not after_amount:
+            return r'(?s:.)'
+        if found is None:
+            every_digit = True
+        else:
+            (units if after_amount else starts).update(found)
+    branches = [r'\d'] if every_digit else []
+    if units and not every_digit:
+        # The amount ends in a digit or in its "к" suffix.
+        branches.append(r'\dк?\s*' + trie_pattern(sorted(units)))
+    if starts:
+        branches.append(trie_pattern(sorted(starts)))
+    return '|'.join(branches) or r'(?!)'
+
+
+def _contested_rows(leads: List[Tuple[bool, Optional[Set[str]]]], kept: Set[int]) -> List[int]:
+    """The rows not in `kept` that could tie with a later row that is, by their
+    _row_lead() in `leads`.
+
+    Two rows that read the same characters from the same place ("лей" is Moldovan and
+    Romanian) produce matches that start together, and the full table keeps the one
+    of the earlier row. A variant that has only the later one finds a match there as
+    well — the wrong one — so the place is suspect even though a match covers it.
+    Units also tie one character apart, across the amount's "к" suffix: "5крон" is
+    5 крон to the CZK row and 5к рон to the RON row.
+    """
+    def prefixes_overlap(a, b):
+        return a.startswith(b) or b.startswith(a)
+
+    def overlap(first, second):
+        if first[0] != second[0]:
+            return False
+        if first[1] is None or second[1] is None:
+            return True
+        return any(
+            prefixes_overlap(a, b) or first[0] and (prefixes_overlap(a, _FOLDED_K + b) or prefixes_overlap(_FOLDED_K + a, b))
+            for a in first[1] for b in second[1]
+        )
+
+    return [
+        index for index in range(len(leads))
+        if index not in kept and any(later > index and overlap(leads[index], leads[later]) for later in kept)
+    ]
+
+
+class _LeadIndex:
+    """Which rows of a table could match where, for may_have_missed() of its variants.
+
+    Built once per table: one regex that hits wherever any row could match (the
+    suspect pattern of the whole table), and the rows behind each hit looked up by
+    the folded characters there. A variant then only keeps the sets of row numbers it
+    left out, instead of compiling suspect patterns of its own.
+    """
+
+    def __init__(self, leads: List[Tuple[bool, Optional[Set[str]]]]):
+        # Zero-width, so that hits may overlap: "$5 лв" has one at "$" and one at "5".
+        self.finder = re.compile(f'(?=(?:{_suspect_pattern(leads)}))', re.IGNORECASE)
+        # Folded first characters of a unit (after an amount) or of a match -> rows.
+        self._units: Dict[str, Set[int]] = {}
+        self._starts: Dict[str, Set[int]] = {}
+        self._after_digit: Set[int] = set()
+        self._anywhere: Set[int] = set()
+        for row, (after_amount, found) in enumerate(leads):
+            if found is None:
+                (self._after_digit if after_amount else self._anywhere).add(row)
+                continue
+            for prefix in found:
+                (self._units if after_amount else self._starts).setdefault(fold_text(prefix), set()).add(row)
+
+    def rows_at(self, folded: str, position: int) -> Set[int]:
+        """The rows whose lead the finder could have hit at `position` of the folded text."""
+        rows = self._anywhere | self._prefixed(self._starts, folded, position)
+        if folded[position].isdecimal():
+            rows |= self._after_digit
+            # The amount ends in a digit or in its "к" suffix, whitespace may follow.
+            ends = [position + 1]
+            if folded.startswith(_FOLDED_K, position + 1):
+                ends.append(position + 2)
+            for unit in ends:
+                while unit < len(folded) and folded[unit].isspace():
+                    unit += 1
+                rows |= self._prefixed(self._units, folded, unit)
+        return rows
+
+    @staticmethod
+    def _prefixed(index: Dict[str, Set[int]], folded: str, position: int) -> Set[int]:
+        rows: Set[int] = set()
+        for length in range(1, SUSPECT_PREFIX_LENGTH + 1):
+            found = index.get(folded[position:position + length])
+            if found:
+                rows |= found
+        return rows
+
+
+def text_segments(length: int, exclude: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """The (start, end) of the parts of a text of `length` characters outside `exclude`.
+
+    The excluded spans may come in any order, overlap, or reach past the text; empty
+    segments are left out.
+    """
+    segments = []
+    position = 0
+    for start, end in sorted(exclude):
+        start, end = max(0, min(start, length)), max(0, min(end, length))
+        if start > position:
+            segments.append((position, start))
+        position = max(position, end)
+    if position < length:
+        segments.append((position, length))
+    return segments
+
+
+def _pattern_table_key(number: str, linear_number: str, handwritten: List[Tuple[str, str]]) -> str:
+    """Hash of everything the derived half of the pattern table depends on.
+
+    The Python version is part of it: the probing is done by `re`, and a build
+    artifact from another interpreter is not evidence of what this one would find.
+    So is the source of src/regex_backends.py, which the stored translations come from.
+    """
+    with open(regex_backends.__file__, 'rb') as f:
+        translator = hashlib.sha256(f.read()).hexdigest()
+    sources = {
+        'python': list(sys.version_info[:2]),
+        'number': number,
+        'linear_number': linear_number,
+        'translator': translator,
+        'handwritten': handwritten,
+        'fallback': _FALLBACK_PATTERN,
+        'currencies': list(CURRENCIES),
+        'ambiguous': sorted(AMBIGUOUS_CODES),
+    }
+    return hashlib.sha256(json.dumps(sources, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def _probe_fallback_codes(handwritten: List[Tuple[str, str]]) -> List[str]:
+    """The codes that get a generated row, found by probing the hand-written rows.
+
+    Codes whose hand-written pattern already matches the bare "<amount> <CODE>" form
+    are left out: a generated row for them would only add a duplicate pass over the
+    text and a duplicate match that the overlap filter throws away anyway. Probed
+    rather than hardcoded, so the two lists cannot drift apart.
+    """
+    handwritten_res = [re.compile(pattern, re.IGNORECASE) for _, pattern in handwritten]
+
+    def _already_matched(code: str) -> bool:
+        probe = f"1 {code}"
+        for compiled in handwritten_res:
+            found = compiled.search(probe)
+            if found and found.group(0) == probe:
+                return True
+        return False
+
+    return [
+        currency.code
+        for currency in CURRENCIES.values()
+        if currency.code not in AMBIGUOUS_CODES and not _already_matched(currency.code)
+    ]
+
+
+def _re2_table_path(path: str) -> str:
+    """Where the RE2 translations of the artifact at `path` are stored.
+
+    A file of its own: spelled-out Unicode classes make it megabytes, and only a
+    parser on the re2 backend has any use for it.
+    """
+    return os.path.splitext(path)[0] + '.re2.json'
+
+
+def _load_pattern_table(path: str, key: str, field: str, kind: type) -> Optional[Union[list, dict]]:
+    """`field` of the build artifact at `path`, or None if it is missing or stale."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            table = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable pattern table {path}: {e}")
+        return None
+    if not isinstance(table, dict) or table.get('key') != key or not isinstance(table.get(field), kind):
+        logger.info(f"Pattern table {path} does not match the patterns, probing instead")
+        return None
+    return table[field]
+
+
+def _write_json(path: str, content: dict) -> None:
+    """Written to a temporary file and moved into place, so a parser starting meanwhile
+    reads either the old file or the new one, never half of one."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.pattern_table.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(content, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def write_pattern_table(path: str = PATTERN_TABLE_PATH) -> str:
+    """Probe the table once and store the result where CurrencyParser looks for it,
+    and the RE2 translation of every row next to it (see _re2_table_path). Returns the key.
+    """
+    parser = CurrencyParser(pattern_table_path=None)
+    _write_json(_re2_table_path(path), {'key': parser.pattern_table_key, 're2': parser._re2_translations_of_table()})
+    _write_json(path, {'key': parser.pattern_table_key, 'fallback_codes': parser.fallback_codes})
+    return parser.pattern_table_key
+
 
 class CurrencyMatch(NamedTuple):
     """One recognised amount together with where it sits in the source text.
@@ -52,10 +575,47 @@ class CurrencyMatch(NamedTuple):
     end: int
 
 
+class ParseState(NamedTuple):
+    """One parse of a text, kept so that the next edit of it can be parsed incrementally.
+
+    `spans` are the (start, end) of every raw match the engine produced, rejected ones
+    included: they tell parse_incremental where the text can be cut without splitting
+    something a pattern has already claimed. None when there are none to go by — the
+    text was over MAX_TEXT_LENGTH, came from the cache or missed the parse deadline —
+    and the next edit is then parsed in full.
+    """
+
+    text: str
+    matches: List[CurrencyMatch]
+    spans: Optional[List[Tuple[int, int]]]
+
+
 class CurrencyParser:
-    def __init__(self):
+    def __init__(self, engine: str = ENGINE_COMBINED, profile: bool = False, cache_entries: int = 0, cache_bytes: int = 0,
+                 workers: int = 0, deadline: float = 2.0, pattern_table_path: Optional[str] = PATTERN_TABLE_PATH,
+                 regex_backend: str = BACKEND_RE, currencies: Optional[Iterable[str]] = None):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown parser engine: {engine!r}, expected one of: {', '.join(ENGINES)}")
+        if regex_backend not in BACKENDS:
+            raise ValueError(f"Unknown regex backend: {regex_backend!r}, expected one of: {', '.join(BACKENDS)}")
+        # The combined and tokens engines are ways of sparing the backtracking engine
+        # work; on the automaton the plain scan is the guarantee — rows × text length.
+        if regex_backend == BACKEND_RE2 and engine != ENGINE_SCAN:
+            raise ValueError(f"The {BACKEND_RE2} regex backend runs the {ENGINE_SCAN!r} engine only, got {engine!r}")
+        self.engine = engine
+        self.regex_backend = regex_backend
+        # Results of recent texts, see src/parse_cache.py. Off unless both budgets are
+        # given; 0 in either is the off switch, as in the settings.
+        self._cache = ParseCache(cache_entries, cache_bytes) if cache_entries > 0 and cache_bytes > 0 else None
+        # Told apart in a cache shared with variants, see text_key.
+        self._cache_scope = ''
+        # Worker processes for the engine, see src/parse_pool.py. Built last, once the
+        # arguments are known to be valid. Parses that run in a worker are not profiled.
+        self._pool: Optional[ParsePool] = None
+        self._owns_pool = True
+
         # Amount pattern. Four details here are load-bearing for *performance*, not
-        # only for correctness: this regex is embedded in ~170 patterns, each of which
+        # only for correctness: this regex is embedded in ~150 patterns, each of which
         # is run over every incoming message, and `re` does not release the GIL — a slow
         # scan freezes the whole bot process, not just the calling thread.
         #
@@ -84,143 +644,323 @@ class CurrencyParser:
         # only parses if the engine may give the "к" back so that "крон" can match.
         self.number = r'(?P<amount>(?:\d{1,3}+(?:[., ]\d{3}(?!\d)){0,6}|(?<!\d)\d++)(?:[.,]\d+)?(?:к)?)'
 
-        handwritten = [
-            ('ILS',     fr'{self.number}\s*(?:шекел(?:ей|я|ь)|шек|шах|ils|ILS|₪)\b'),
-            ('ILS',     fr'{self.number}\s*₪'),
-    
-            ('GBP',     fr'(?:£){self.number}\b'),
-            ('GBP',     fr'{self.number}\s*(?:фунт(?:ов|а|)|паунд(?:ов|а|)|квид(?:ов|а|)|pound|quid|gbp|GBP|gbr|GBR|£)\b'),
-            ('GBP',     fr'{self.number}\s*£'),
-    
-            ('RUB',     fr'{self.number}\s*(?:руб(?:лей|ля|ль)|₽|rub|RUB)\b'),
-            ('RUB',     fr'{self.number}\s*₽'),
-            ('RUBK',     fr'{self.number}\s*(?:килоруб(?:лей|ля|ль))\b'),
-            ('RUBK',     r'(?P<amount>)килоруб(?:лей|ля|ль)\b'),
-                
-            ('USD',     fr'\${self.number}\b'),
-            ('USD',     fr'{self.number}\s*(?:доллар(?:ов|а|)|бакс(?:ов|а|)|usd|USD|\$)\b'),
-            ('USD',     fr'{self.number}\s*\$'),
-            ('USDCENT', fr'{self.number}\s*(?:цент(?:ов|а|)|cent|cents)\b'),
-            ('USDK',     fr'{self.number}\s*(?:килобакс(?:ов|а|))\b'),
-            ('USDK',     r'(?P<amount>)килобакс(?:ов|а|)\b'),
-
-            ('EUR',     fr'€{self.number}\b'),
-            ('EUR',     fr'{self.number}\s*(?:евро|eur|EUR|€)\b'),
-            ('EUR',     fr'{self.number}\s*€'),
-            ('EURCENT', fr'{self.number}\s*(?:евроцент(?:ов|а|)|eurocent|eurocents)\b'),
-            ('EURK',     fr'{self.number}\s*(?:килоевро|eurk|EURK)\b'),
-            ('EURK',     r'(?P<amount>)килоевро(?:ов|а|)\b'),
-
-            ('JPY',     fr'¥{self.number}\b'),
-            ('JPY',     fr'{self.number}\s*(?:йен(?:а|ы|)|¥|jpy|JPY)\b'),
-            ('JPY',     fr'{self.number}\s*¥'),
-
-            ('KRW',     fr'{self.number}\s*(?:вон(?:а|ы|)|krw|KRW|₩)\b'),
-            ('KRW',     fr'{self.number}\s*₩'),
-            ('KRW',     fr'₩{self.number}\b'),
-
-            ('PLN',     fr'{self.number}\s*(?:злот(?:ый|ых|ого|ые)|pln|PLN|zł)\b'),
-            ('PLN',     fr'{self.number}\s*zł'),
-
-            ('TRY',     fr'{self.number}\s*(?:лир(?:а|ы|)|турецк(?:ая|ой|их|ую) лир(?:а|ы|)|try|TRY|₺|₤)\b'),
-            ('TRY',     fr'{self.number}\s*₺'),
-            ('TRY',     fr'{self.number}\s*₤'),
-            ('TRY',     fr'₤{self.number}\b'),
-            ('TRY',     fr'₺{self.number}\b'),
-
-            ('CZK',     fr'{self.number}\s*(?:крон(?:а|ы|)|чешск(?:ая|ой|их|ую) крон(?:а|ы|)|czk|CZK|Kč|Kč)\b'),
-            ('CZK',     fr'{self.number}\s*Kč'),
-
-            ('UAH',     fr'{self.number}\s*(?:гривн(?:а|ы|)|гривен|грн|uah|UAH|₴)\b'),
-            ('UAH',     fr'{self.number}\s*₴'),
-
-            ('BYN',     fr'{self.number}\s*(?:белорусск(?:их|ого|ий|ие) руб(?:лей|ля|ль)|беларуск(?:их|ого|ий|ие) руб(?:лей|ля|ль)|byn|BYN|Br)\b'),
-            ('BYN',     fr'{self.number}\s*Br'),
-            ('AMD',     fr'{self.number}\s*(?:драм(?:ов|а|))\b'),
-            ('CNY',     fr'{self.number}\s*(?:юан(?:ей|я|ь)|cny|CNY)\b'),
-            ('GEL',     fr'{self.number}\s*(?:лари|gel|GEL)\b'),
-            ('RSD',     fr'{self.number}\s*(?:динар(?:ов|а|)|rsd|RSD)\b'),
-            ('THB',     fr'{self.number}\s*(?:бат(?:ов|а|)|thb|THB)\b'),
-            ('KZT',     fr'{self.number}\s*(?:тенге|тг|kzt|KZT)\b'),
-            ('CAD',     fr'{self.number}\s*(?:канадск(?:их|ого|ий) доллар(?:ов|а|)|cad|CAD)\b'),
-            ('MXN',     fr'{self.number}\s*(?:песо|мексиканск(?:их|ого|ий|ое) песо|mxn|MXN)\b'),
-
-            ('ARS',     fr'{self.number}\s*(?:аргентинск(?:их|ого|ий|ое) песо|ars|ARS)\b'),
-
-            ('MDL',     fr'{self.number}\s*(?:ле(?:й|я|и)|mdl|MDL)\b'),
-            ('MDL',     fr'{self.number}\s*(?:молдавск(?:их|ого|ий) ле(?:й|я|ев)|ле(?:й|я|ев)|mdl|MDL)\b'),
-
-            ('RON',     fr'{self.number}\s*(?:румынск(?:их|ого|ий) ле(?:й|я|ев)|ле(?:й|я|ев)|leu|RON)\b'),
-            ('RON',     fr'{self.number}\s*(?:рон(?:ов|а|))\b'),
-            
-            ('VND',     fr'{self.number}\s*(?:донг(?:ов|а|)|vnd|VND|₫|dd)\b'),
-            ('VND',     fr'{self.number}\s*₫'),
-
-            ('BGN',     fr'{self.number}\s*(?:лев(?:ов|а|)|болгарск(?:их|ого|ий) лев(?:ов|а|)|bgn|BGN|(?<!\w)лв(?!\w))\b'),
-            ('BGN',     fr'{self.number}\s*(?<!\w)лв(?!\w)'),
-
-            ('AED',     fr'{self.number}\s*(?:дирхам(?:ов|а|)|aed|AED|د.إ|dh)\b'),
-            ('AED',     fr'{self.number}\s*د.إ'),
-            ('AED',     fr'{self.number}\s*dh'),
-
-            ('PHP',     fr'{self.number}\s*(?:филиппинск(?:их|ого|ий|ое) песо|piso|php|PHP|₱)\b'),
-            ('PHP',     fr'{self.number}\s*₱'),
-            ('PHP',     fr'₱{self.number}\b'),
-
-            # Tajikistani somoni
-            ('TJS',     fr'{self.number}\s*(?:сомони|tjs|TJS)\b'),
-
-            # Uzbekistani so'm (sum) and som (user requested mapping to UZS)
-            ('UZS',     fr'{self.number}\s*(?:сум(?:ов|а|)|сом(?:ов|а|)|uzs|UZS)\b'),
-
-            # Brazilian real. The adjective branch comes first for readability only:
-            # the branches start with disjoint prefixes ("бразильск" vs "реал"), so
-            # their order cannot affect matching. Including "BRL" here makes
-            # _already_matched() drop the generated ISO fallback for BRL, so this
-            # pattern REPLACES it — under IGNORECASE the code now matches in any case
-            # ("brl", "Brl"), a deliberate widening of the strictly case-sensitive
-            # fallback ("brl" is not an English word). "риал"/"риял" (SAR/IRR/QAR)
-            # are different words and are NOT matched.
-            # Known trade-off: "Реал" the football club is indistinguishable from the
-            # currency under IGNORECASE — same compromise as "5 вон" (KRW) or "5 лей"
-            # (MDL). The (?!-\w) guard on the bare form removes only the hyphenated
-            # spelling ("5 реал-мадрид"); "3 Реал Мадрид" and "Барселона 3:1 Реал"
-            # still parse as BRL. The guard also drops any hyphenated continuation
-            # after the bare form ("5 реалов-то", "5 реалов-2024" — digits are \w) —
-            # accepted; the adjective form ("бразильских реалов-то") still matches.
-            ('BRL',     fr'{self.number}\s*(?:бразильск(?:их|ого|ий) реал(?:ов|а|)|реал(?:ов|а|)(?!-\w)|brl|BRL)\b'),
-        ]
+        # The same amount for the re2 backend, which cannot backtrack and so needs none
+        # of the above but the bound on the groups — that one is about what an amount
+        # is, not about speed. Dropping the rest changes no match: the possessive
+        # quantifiers and the (?!\d) only refuse what nothing after the amount could
+        # continue anyway, and the lookbehind only matters where a scan resumes right
+        # after a digit, which the end of a match never is. tests/parser/
+        # test_regex_backends.py holds the two backends to the same results.
+        self.linear_number = r'(?P<amount>(?:\d{1,3}(?:[., ]\d{3}){0,6}|\d+)(?:[.,]\d+)?(?:к)?)'
 
-        # Codes whose hand-written pattern already matches the bare "<amount> <CODE>"
-        # form. Generating a fallback for them would only add a duplicate pass over
-        # the text and a duplicate match that the overlap filter throws away anyway.
-        # Detected by probing rather than hardcoded, so the two lists cannot drift apart.
-        handwritten_res = [re.compile(p, re.IGNORECASE) for _, p in handwritten]
-
-        def _already_matched(code: str) -> bool:
-            probe = f"1 {code}"
-            for compiled in handwritten_res:
-                found = compiled.search(probe)
-                if found and found.group(0) == probe:
-                    return True
-            return False
+        # The named currencies, compiled from the alias table in src/currency_aliases.py:
+        # one row per currency and position, every unit a trie of its aliases.
+        handwritten = compile_alias_rows(self.number)
 
         # Fallback: "<amount> <ISO CODE>" for every known currency that no hand-written
         # pattern covers yet, so the long tail (KWD, CHF, NOK, ...) parses without a
-        # hand-written regex.
-        # (?-i:...) switches IGNORECASE off for the code itself: matching codes
-        # case-insensitively would turn ordinary words into currency amounts
-        # ("3 top", "5 mad", "2 all", "8 cup").
-        self.patterns = handwritten + [
-            (currency.code, rf'{self.number}\s*(?-i:{currency.code})\b')
-            for currency in CURRENCIES.values()
-            if currency.code not in AMBIGUOUS_CODES and not _already_matched(currency.code)
-        ]
+        # hand-written regex. Which codes those are comes from the build artifact when
+        # it matches this table, from probing otherwise (see PATTERN_TABLE_PATH).
+        self.pattern_table_key = _pattern_table_key(self.number, self.linear_number, handwritten)
+        codes = None
+        if pattern_table_path:
+            codes = _load_pattern_table(pattern_table_path, self.pattern_table_key, 'fallback_codes', list)
+        if codes is None:
+            codes = _probe_fallback_codes(handwritten)
+        self.fallback_codes = codes
+        # Re2Pattern source of a row -> its translate_for_re2(), from the artifact.
+        self._re2_translations: Dict[str, Tuple[str, List[str]]] = {}
+        if pattern_table_path and regex_backend == BACKEND_RE2:
+            self._re2_translations = _load_pattern_table(
+                _re2_table_path(pattern_table_path), self.pattern_table_key, 're2', dict) or {}
+        self._pattern_table_path = pattern_table_path
+        self._set_table(handwritten + [
+            (code, _FALLBACK_PATTERN.format(number=self.number, code=code)) for code in codes
+        ], currencies, profile)
+
+        if regex_backend == BACKEND_RE2:
+            # Checked and compiled now rather than on the first message: a row the
+            # backend cannot run has to stop the start, not a reply.
+            unsupported = self.regex_backend_report(regex_backend)
+            if unsupported:
+                rows = '; '.join(f"row {entry['row']} ({entry['currency']}): {entry['reason']}" for entry in unsupported)
+                raise ValueError(f"The {regex_backend} regex backend cannot run {len(unsupported)} rows of the table: {rows}")
+            self._ensure_compiled()
+
+        if workers > 0:
+            self._pool = ParsePool(workers, deadline, engine, regex_backend=regex_backend)
+
+    def _set_table(self, patterns: List[Tuple[str, str]], currencies: Optional[Iterable[str]], profile: bool) -> None:
+        """Take `patterns` as the table, and set up everything derived from it.
+
+        With `currencies`, only the rows that report one of them ("USD" takes the cent
+        and "кило…" rows along), in table order: a parser for some currencies only,
+        see variant().
+        """
+        self.patterns = patterns
+        self.currencies = None if currencies is None else frozenset(currencies)
+        if self.currencies is not None:
+            self.patterns = [
+                (currency, pattern) for currency, pattern in self.patterns
+                if PSEUDO_CURRENCIES.get(currency, currency) in self.currencies
+            ]
+            if not self.patterns:
+                raise ValueError(f"No row of the pattern table reports any of: {', '.join(sorted(self.currencies))}")
+        # Set on a variant by the parser that built it: the lead index of that
+        # parser's table, and the rows of it the variant left out — where one of those
+        # could have matched is suspect. None on a parser that has the whole table.
+        self._lead_index: Optional[_LeadIndex] = None
+        self._left_out: Optional[FrozenSet[int]] = None
+        # The left-out rows that could tie with a row the variant kept, see _contested_rows.
+        self._tied: FrozenSet[int] = frozenset()
+        self._variants: "OrderedDict[frozenset, CurrencyParser]" = OrderedDict()
+        self._variants_lock = threading.Lock()
+        # _row_lead() of every row and the _LeadIndex of them, for variants; on first use.
+        self._row_leads: Optional[List[Tuple[bool, Optional[Set[str]]]]] = None
+        self._own_lead_index: Optional[_LeadIndex] = None
+
+        # Compiled on first use, not here: see _ensure_compiled.
+        self._compiled: Optional[List[Tuple[str, re.Pattern]]] = None
+        self._compile_lock = threading.Lock()
+
+        self._raw_matches = {
+            ENGINE_SCAN: self._raw_matches_scan,
+            ENGINE_COMBINED: self._raw_matches_combined,
+            ENGINE_TOKENS: self._raw_matches_tokens,
+        }[self.engine]
+
+        # The prefilter in front of every engine, derived from the same table: a row
+        # that embeds the amount cannot match a text without a decimal digit (the
+        # symbol-led "$100" rows included), and an amount-less row cannot match a
+        # text that does not contain its leading word. Most chat messages carry no
+        # money at all and are answered here without running a single regex.
+        self._prefilter_words = set()
+        for _, pattern in self.patterns:
+            if self.number in pattern:
+                continue
+            word = re.match(r'\w+', pattern.replace('(?P<amount>)', ''))
+            if word is None:
+                # A row the prefilter cannot describe: keep it honest by turning it off.
+                self._prefilter_words = None
+                break
+            self._prefilter_words.add(word.group(0).casefold())
+        self._prefilter_rejections = 0
+        self._prefilter_lock = threading.Lock()
+
+        # Opt-in per-row counters: [nanoseconds spent, raw matches, matches kept by the
+        # overlap filter]. None when off, and then nothing below takes a timestamp.
+        self._profile = [[0, 0, 0] for _ in self.patterns] if profile else None
+        self._profile_lock = threading.Lock()
+
+    def regex_backend_report(self, backend: str = BACKEND_RE2) -> List[dict]:
+        """The rows of the table `backend` cannot run, and why; empty when it runs them all.
+
+        One dict per such row: `row`, `currency`, `pattern` (as the backend would get
+        it) and `reason`. The stdlib backend runs every pattern there is.
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown regex backend: {backend!r}, expected one of: {', '.join(BACKENDS)}")
+        if backend == BACKEND_RE:
+            return []
+        report = []
+        for row, (currency, pattern) in enumerate(self.patterns):
+            pattern = self._re2_source(fold_pattern(pattern)[0])
+            # A stored translation is one the image build found RE2 to accept.
+            if pattern in self._re2_translations:
+                continue
+            reason = re2_incompatibility(pattern, 0)
+            if reason is not None:
+                report.append({'row': row, 'currency': currency, 'pattern': pattern, 'reason': reason})
+        return report
+
+    def _re2_source(self, folded: str) -> str:
+        """The pattern the re2 backend gets for a folded row: the amount in its linear form."""
+        return folded.replace(self.number, self.linear_number)
+
+    def _re2_translations_of_table(self) -> Dict[str, Tuple[str, List[str]]]:
+        """translate_for_re2() of every row the re2 backend can run, for the build artifact."""
+        translations = {}
+        for _, pattern in self.patterns:
+            pattern = self._re2_source(fold_pattern(pattern)[0])
+            if re2_incompatibility(pattern, 0) is None:
+                translations[pattern] = translate_for_re2(pattern, 0)
+        return translations
+
+    @property
+    def compiled_patterns(self) -> List[Tuple[str, re.Pattern]]:
+        """The pattern table compiled for case-folded text, compiled on first access.
+
+        Case-sensitive patterns, to be run over fold_text() of a text; see
+        _ensure_compiled.
+        """
+        if self._compiled is None:
+            self._ensure_compiled()
+        return self._compiled
+
+    def _ensure_compiled(self) -> None:
+        """Compile the table and build the engine's structures, once.
+
+        Deferred from __init__ so that building a parser — at every container start,
+        and in every worker of the parse pool — costs no regex compilation until the
+        first text that gets past the prefilter. The lock makes the first callers of
+        several threads wait for one compilation instead of racing through their own;
+        the compiled list is published last, so a thread that sees it sees the rest.
+        """
+        with self._compile_lock:
+            if self._compiled is not None:
+                return
+            # The table is written for IGNORECASE and run without it: _parse folds the
+            # text once (src/case_folding.py) and the rows are folded to match, so no
+            # pattern compares case on its own. The ISO codes of the generated rows
+            # keep their case through _exact_tails, checked by _with_exact_tails.
+            if fold_pattern(self.number)[0] != self.number:
+                raise ValueError("The amount regex has to be its own case fold: the engines find it in folded rows")
+            folded = [(curr, *fold_pattern(pattern)) for curr, pattern in self.patterns]
+            self._folded_patterns = [(curr, pattern) for curr, pattern, _ in folded]
+            self._exact_tails = {row: tail for row, (_, _, tail) in enumerate(folded) if tail is not None}
+            if self.regex_backend == BACKEND_RE2:
+                compiled = []
+                for curr, pattern in self._folded_patterns:
+                    source = self._re2_source(pattern)
+                    compiled.append((curr, Re2Pattern(source, 0, self._re2_translations.get(source))))
+            else:
+                compiled = [(curr, re.compile(pattern)) for curr, pattern in self._folded_patterns]
+
+            # Every character the amount regex can consume besides the decimal digits.
+            number_keys, _ = _consumed_keys(_sre_parser.parse(self.number, re.IGNORECASE).data, True)
+            self._number_keys = frozenset(number_keys)
+
+            # How far parse_incremental has to stay away from an edit, see there: the
+            # widest a row can be without its amount and the whitespace before its unit,
+            # and the widest text a row can have in front of its amount. None turns
+            # reuse off — a row whose width `re` cannot bound could look arbitrarily far.
+            unit_widths, prefix_widths = [], [0]
+            for _, pattern in self._folded_patterns:
+                if self.number not in pattern:
+                    unit_widths.append(_sre_parser.parse(pattern).getwidth()[1])
+                    continue
+                prefix, unit = pattern.split(self.number, 1)
+                unit = _skip_leading_space(unit)
+                prefix_widths.append(_sre_parser.parse(prefix).getwidth()[1])
+                unit_widths.append(_sre_parser.parse(unit).getwidth()[1])
+            if max(unit_widths + prefix_widths) >= _sre_constants.MAXREPEAT:
+                self._incremental_margin = None
+            else:
+                self._incremental_margin = max(unit_widths) + INCREMENTAL_LOOKAHEAD
+                self._incremental_prefix = max(prefix_widths)
+
+            self._build_engine()
+            self._compiled = compiled
+
+    def _build_engine(self) -> None:
+        if self.engine == ENGINE_COMBINED:
+            self._build_combined()
+        elif self.engine == ENGINE_TOKENS:
+            self._build_tokens()
 
-        self.compiled_patterns = [
-            (curr, re.compile(pattern, re.IGNORECASE)) 
-            for curr, pattern in self.patterns
+    def _adopt_compiled(self, parent: 'CurrencyParser', rows: List[int]) -> None:
+        """Take the compiled `rows` of `parent`, whose table this one is cut from.
+
+        Only the engine's own structures are built, from the few rows kept; the rows
+        themselves are not compiled again. The incremental margins are the parent's:
+        bounds over the whole table hold for any part of it.
+        """
+        with self._compile_lock:
+            self._folded_patterns = [parent._folded_patterns[row] for row in rows]
+            self._exact_tails = {
+                index: parent._exact_tails[row] for index, row in enumerate(rows) if row in parent._exact_tails
+            }
+            self._number_keys = parent._number_keys
+            self._incremental_margin = parent._incremental_margin
+            if parent._incremental_margin is not None:
+                self._incremental_prefix = parent._incremental_prefix
+            self._build_engine()
+            self._compiled = [parent._compiled[row] for row in rows]
+
+    def _build_combined(self) -> None:
+        # The locator is the whole table as ONE alternation with no capturing groups,
+        # so a single search() finds the next position where any pattern matches. Two
+        # things keep that walk cheap:
+        #   - the ~160 "<amount> <unit>" rows share their amount regex, so it is
+        #     factored out and parsed once per position: "<amount>(?:<unit>|<unit>|…)"
+        #     matches wherever one of the rows would;
+        #   - a lookahead built from the first element of every pattern (`\d`, the
+        #     currency symbols, the amount-less "кило…" words) fails positions where
+        #     nothing can start on one character class. Derived from the table rather
+        #     than hand-written, so a new pattern can never be hidden behind it.
+        # Groups are left out on purpose: `re` saves and restores every group around
+        # each branch it backtracks through, which made a named-group alternation of
+        # the table slower than the ~170 separate passes it replaces.
+        #
+        # The locator only says WHERE. Which rows match there is decided by the rows'
+        # own compiled patterns, behind blocks of the table built the same way: a block
+        # that cannot match at the position rules out all its rows with one call.
+        amount_free = self.number.replace('(?P<amount>', '(?:')
+        leads = []
+        for _, pattern in self._folded_patterns:
+            if self.number in pattern:
+                leads.append(pattern[:pattern.index(self.number)] + r'\d')
+            else:
+                leads.append(pattern.replace('(?P<amount>)', ''))
+        self._locator = re.compile(
+            f"(?={'|'.join(dict.fromkeys(leads))}){self._alternation(range(len(self.patterns)), amount_free)}"
+        )
+        self._blocks = [
+            (re.compile(self._alternation(rows, amount_free)), rows)
+            for rows in (range(first, min(first + COMBINED_BLOCK_SIZE, len(self.patterns)))
+                         for first in range(0, len(self.patterns), COMBINED_BLOCK_SIZE))
         ]
+
+    def _alternation(self, rows: Iterable[int], amount_free: str) -> str:
+        """A group-free regex matching wherever one of the given table rows matches.
+
+        Rows that start with the amount share one copy of it: backtracking still tries
+        every unit after every way of reading the amount, so the factored form matches
+        at exactly the positions the rows do on their own.
+        """
+        units, others = [], []
+        for row in rows:
+            pattern = self._folded_patterns[row][1]
+            if pattern.startswith(self.number):
+                units.append(pattern[len(self.number):])
+            else:
+                others.append(pattern.replace('(?P<amount>', '(?:'))
+        if units:
+            others.insert(0, f"{amount_free}(?:{'|'.join(units)})")
+        return f"(?:{'|'.join(others)})"
+
+    def _build_tokens(self) -> None:
+        # The tokens engine. Rows that start with the amount are indexed by what can
+        # follow it — the first characters of their unit once the `\s*` or `\s+` in
+        # between is skipped — and every other row by the first characters of the whole pattern
+        # (the "$", "€", "£" prefixes, the amount-less "кило…" words). The keys come
+        # from `re`'s own parse of the patterns, so an alias added to the table is
+        # indexed with it. Rows the index cannot describe are tried everywhere.
+        #
+        # The generated rows' ISO codes are lowercase in the folded rows, and would be
+        # tried after every amount followed by a lowercase letter only for
+        # _with_exact_tails to drop the match; a row whose unit is its code is indexed
+        # by the code's first character as the original text has to spell it instead.
+        self._code_rows: Dict[str, List[int]] = {}
+        self._unit_rows, self._unit_rows_anywhere = {}, []
+        self._lead_rows, self._lead_rows_anywhere = {}, []
+        for row, (_, pattern) in enumerate(self._folded_patterns):
+            if pattern.startswith(self.number):
+                unit = _skip_leading_space(pattern[len(self.number):])
+                keys, empty = _first_keys(_sre_parser.parse(unit).data, False)
+                index, anywhere = self._unit_rows, self._unit_rows_anywhere
+                tail = self._exact_tails.get(row)
+                if tail is not None and keys == {('=', fold_char(tail[0]))} and not empty:
+                    index, keys = self._code_rows, {tail[0]}
+            else:
+                keys, empty = _first_keys(_sre_parser.parse(pattern).data, False)
+                index, anywhere = self._lead_rows, self._lead_rows_anywhere
+            if keys is None or empty:
+                anywhere.append(row)
+                continue
+            for key in keys:
+                index.setdefault(key, []).append(row)
+
     def _convert_amount(self, amount_str: str, currency: str) -> Tuple[Optional[float], str]:
         """Normalise a matched amount into a number.
 
@@ -234,15 +974,6 @@ class CurrencyParser:
         clean_amount = amount_str
         base_currency = currency
 
-        # mapping special currencies to base currencies
-        currency_mapping = {
-            'USDK': 'USD',
-            'EURK': 'EUR',
-            'RUBK': 'RUB',
-            'USDCENT': 'USD',
-            'EURCENT': 'EUR',
-        }
-
         # multipliers for special currencies
         currency_multipliers = {
             'USDK': 1000,
@@ -255,7 +986,7 @@ class CurrencyParser:
         # if special currency, apply corresponding multiplier and get base currency
         if currency in currency_multipliers:
             multiplier = currency_multipliers[currency]
-            base_currency = currency_mapping[currency]
+            base_currency = PSEUDO_CURRENCIES[currency]
             if not amount_str:
                 if currency in ['USDK', 'EURK', 'RUBK']: #for 'кило...' without amount
                     return 1000.0, base_currency
@@ -315,79 +1046,674 @@ class CurrencyParser:
 
         return amount * multiplier, base_currency
 
-    def find_currency_matches(self, text: str) -> List[CurrencyMatch]:
+    def find_currency_matches(self, text: str, exclude: Optional[Iterable[Tuple[int, int]]] = None) -> List[CurrencyMatch]:
         """Find currencies in text, keeping the position of every match.
 
         This is the whole search: find_currencies() is a projection of it. Two
         properties hold for the returned list and callers are meant to rely on them:
         text[m.start:m.end] == m.original_text for every match, and the matches are
-        non-overlapping and sorted by position (the overlap filter below produces
-        both). Together they make the list a complete, ordered cut of the text, so a
-        caller can rebuild the message from slices — which is the only safe way to
-        substitute the matches: str.replace(original, ...) hits every equal substring
+        non-overlapping and sorted by position (the overlap filter in
+        _select_matches produces both). Together they make the list a complete,
+        ordered cut of the text, so a caller can rebuild the message from slices —
+        which is the only safe way to substitute the matches: str.replace(original, ...) hits every equal substring
         instead of the one that was matched, and then hits the text it has just
         inserted as well.
+
+        `exclude` is a list of (start, end) spans of the text that are not read at all
+        — the links, code blocks, mentions and hashtags of a Telegram message. Every
+        part in between is parsed as a text of its own, so a match can neither reach
+        into an excluded span nor take its boundary check from one; the offsets of the
+        matches are still into `text`.
         """
-        result: List[CurrencyMatch] = []
-        matches = []
+        if exclude is not None:
+            result = []
+            for start, end in text_segments(len(text), exclude):
+                result.extend(match._replace(start=start + match.start, end=start + match.end)
+                              for match in self.find_currency_matches(text[start:end]))
+            return result
 
         # Only the length is logged: message texts never go into the logs.
         if len(text) > MAX_TEXT_LENGTH:
             logger.warning(f"Text of {len(text)} characters exceeds the {MAX_TEXT_LENGTH} character limit, skipping currency parsing")
-            return result
+            return []
 
-        # Find all matches first
-        for currency, pattern in self.compiled_patterns:
-            for match in pattern.finditer(text):
-                # Check that currency is surrounded by spaces or is at the beginning/end of text
-                start_pos = match.start()
-                end_pos = match.end()
-                
-                # Start validation: either it's the beginning of text or preceded by space or non-alphanumeric
-                valid_start = start_pos == 0 or text[start_pos-1].isspace() or not text[start_pos-1].isalnum()
-                
-                # End validation: either it's the end of text or followed by space or non-alphanumeric
-                valid_end = end_pos == len(text) or text[end_pos].isspace() or not text[end_pos].isalnum()
-                
-                # Additional check for special characters that should not be considered as separators
-                special_chars = "#@^e%"
-                if start_pos > 0 and text[start_pos-1] in special_chars:
-                    valid_start = False
-                
-                if valid_start and valid_end:
-                    # A local, never an attribute on self: one CurrencyParser is shared by
-                    # every telebot worker thread, and _convert_amount() runs between the
-                    # assignment and the append below — long enough for another thread to
-                    # overwrite the attribute and put someone else's message text into
-                    # this reply.
-                    current_match = match.group(0)
-                    amount, base_currency = self._convert_amount(match.group('amount'), currency)
-                    # An amount we could not parse is dropped instead of being counted
-                    # as zero: the rest of the message still gets an answer.
-                    if amount is None:
-                        continue
-                    matches.append(( start_pos, end_pos, amount, base_currency, current_match ))
-        
-        # Sort matches by start position
+        if not self._may_contain_amount(text):
+            with self._prefilter_lock:
+                self._prefilter_rejections += 1
+            return []
+
+        key = None
+        if self._cache is not None:
+            key = text_key(text, self._cache_scope)
+            cached = self._cache.get(key)
+            if cached is not None:
+                return list(cached)
+        result = self._parse_before_deadline(text)
+        if result is None:
+            # Past the deadline: no matches in the reply, but nothing cached either, so
+            # the next time the text comes it is parsed again.
+            return []
+        if key is not None:
+            self._cache.put(key, result)
+        return result
+
+    def find_currency_matches_many(self, texts: Iterable[str], fan_out: Optional[str] = None,
+                                   workers: int = 0) -> List[List[CurrencyMatch]]:
+        """find_currency_matches() of every text, in the order of `texts`.
+
+        For replaying chat history and converting exported logs: the length check,
+        the prefilter and the cache run here once per text as usual, a text repeated
+        in the batch is parsed once, and only the distinct texts left over reach the
+        engine — in this thread, or spread as `fan_out` says (BATCH_THREADS or
+        BATCH_PROCESSES) over `workers` workers, os.cpu_count() by default. Batches
+        get no parse deadline: nobody is waiting on a reply, and the worker
+        processes are started for the batch and stopped after it. `texts` may be any
+        iterable; it is read once, up front.
+        """
+        if fan_out is not None and fan_out not in BATCH_FAN_OUTS:
+            raise ValueError(f"Unknown fan-out: {fan_out!r}, expected one of: {', '.join(BATCH_FAN_OUTS)}")
+        if workers <= 0:
+            workers = os.cpu_count() or 1
+
+        results: List[Optional[List[CurrencyMatch]]] = []
+        # Text -> positions in `results` waiting for its parse.
+        pending: Dict[str, List[int]] = {}
+        for text in texts:
+            results.append(None)
+            if text in pending:
+                pending[text].append(len(results) - 1)
+                continue
+            if len(text) > MAX_TEXT_LENGTH:
+                logger.warning(f"Text of {len(text)} characters exceeds the {MAX_TEXT_LENGTH} character limit, skipping currency parsing")
+                results[-1] = []
+            elif not self._may_contain_amount(text):
+                with self._prefilter_lock:
+                    self._prefilter_rejections += 1
+                results[-1] = []
+            else:
+                cached = self._cache.get(text_key(text, self._cache_scope)) if self._cache is not None else None
+                if cached is not None:
+                    results[-1] = list(cached)
+                else:
+                    pending[text] = [len(results) - 1]
+
+        distinct = list(pending)
+        if fan_out == BATCH_PROCESSES and len(distinct) > 1:
+            parsed = parse_in_processes(distinct, min(workers, len(distinct)), self.engine, self.regex_backend,
+                                        self.currencies)
+        elif fan_out == BATCH_THREADS and len(distinct) > 1:
+            # Compiled before the threads start, not by the first of them while the
+            # rest wait on the lock.
+            self._ensure_compiled()
+            with ThreadPoolExecutor(max_workers=min(workers, len(distinct))) as executor:
+                parsed = list(executor.map(self._parse_before_deadline, distinct))
+        else:
+            parsed = [self._parse_before_deadline(text) for text in distinct]
+
+        for text, result in zip(distinct, parsed):
+            if result is None:
+                result = []  # past the deadline of the bot's pool; not cached
+            elif self._cache is not None:
+                self._cache.put(text_key(text, self._cache_scope), result)
+            indices = pending[text]
+            results[indices[0]] = result
+            for index in indices[1:]:
+                # A list of its own per position, as separate calls would return.
+                results[index] = list(result)
+        return results
+
+    def variant(self, currencies: Iterable[str]) -> 'CurrencyParser':
+        """A parser with only the rows of `currencies`, built once and kept.
+
+        For chats that only ever write about a few currencies (see
+        src/chat_profiles.py): the scan engine runs a handful of rows instead of the
+        whole table, and the other engines have fewer candidates per hit. A variant
+        finds a subset of what this parser finds — its caller asks may_have_missed()
+        whether that was all of it.
+
+        A variant is cut from this parser rather than built like one: it takes the
+        rows this parser has compiled, and only its suspect patterns and the engine's
+        own structures are new — about a millisecond, against the tens a parser takes
+        to build. It parses through this parser's cache, its results kept apart by
+        the currencies in the key, and through this parser's worker pool and deadline.
+        """
+        key = frozenset(currencies)
+        if self.currencies is not None and not key <= self.currencies:
+            raise ValueError(f"A variant of a parser for {', '.join(sorted(self.currencies))} "
+                             f"cannot have {', '.join(sorted(key - self.currencies))}")
+        with self._variants_lock:
+            variant = self._variants.get(key)
+            if variant is not None:
+                self._variants.move_to_end(key)
+                return variant
+            if self._row_leads is None:
+                self._row_leads = [_row_lead(self.number, pattern) for _, pattern in self.patterns]
+                self._own_lead_index = _LeadIndex(self._row_leads)
+            leads, lead_index = self._row_leads, self._own_lead_index
+        self._ensure_compiled()
+        # Built outside the lock; two threads building the same one only waste the
+        # loser's copy. The copy brings the settings, the amount regex, the cache and
+        # the pool along; _set_table replaces everything derived from the table.
+        variant = copy.copy(self)
+        variant._set_table(self.patterns, key, profile=False)
+        variant._cache_scope = ','.join(sorted(key))
+        variant._owns_pool = False
+        kept = [index for index, row in enumerate(self.patterns)
+                if PSEUDO_CURRENCIES.get(row[0], row[0]) in key]
+        variant._adopt_compiled(self, kept)
+        kept_set = set(kept)
+        variant._lead_index = lead_index
+        variant._left_out = frozenset(range(len(self.patterns))) - kept_set
+        variant._tied = frozenset(_contested_rows(leads, kept_set))
+        with self._variants_lock:
+            variant = self._variants.setdefault(key, variant)
+            self._variants.move_to_end(key)
+            while len(self._variants) > VARIANT_LIMIT:
+                self._variants.popitem(last=False)
+        return variant
+
+    def may_have_missed(self, text: str, matches: List[CurrencyMatch],
+                        exclude: Optional[Iterable[Tuple[int, int]]] = None) -> bool:
+        """Whether a row this variant left out could have matched somewhere in `text`.
+
+        `matches` is what the variant found in it. False means the full table finds
+        the same: no left-out row can match anywhere but where a hit of the suspect
+        pattern is, and every hit lies inside a match already found — unless a left-out
+        row could have tied with a kept one there, which is suspect wherever it is.
+        True only means maybe: the test reads prefixes, it does not run the rows.
+        Always False on a parser with the whole table.
+
+        With the `exclude` the matches were found with, hits inside an excluded span
+        are not suspect: nothing is parsed there.
+        """
+        if self._left_out is None:
+            return False
+        segments = None if exclude is None else text_segments(len(text), exclude)
+        folded = fold_text(text)
+        for hit in self._lead_index.finder.finditer(text):
+            position = hit.start()
+            if segments is not None and not any(start <= position < end for start, end in segments):
+                continue
+            rows = self._lead_index.rows_at(folded, position)
+            if not self._tied.isdisjoint(rows):
+                return True
+            if not self._left_out.isdisjoint(rows) and not any(match.start <= position < match.end for match in matches):
+                return True
+        return False
+
+    def _parse_anywhere(self, text: str) -> List[CurrencyMatch]:
+        """_parse() in the worker pool when there is a healthy one, in-process otherwise.
+
+        Raises ParseTimeout when the pool's deadline passed.
+        """
+        if self._pool is not None:
+            result = self._pool.parse(text, self.currencies)
+            if result is not None:
+                return result
+        return self._parse(text)
+
+    def _parse_before_deadline(self, text: str) -> Optional[List[CurrencyMatch]]:
+        """_parse_anywhere(), None instead of the ParseTimeout: a result must never be
+        mistaken for one."""
+        try:
+            return self._parse_anywhere(text)
+        except ParseTimeout:
+            return None
+
+    def pool_stats(self) -> Optional[dict]:
+        """Counters of the worker pool; None when parsing runs in-process only."""
+        return None if self._pool is None else self._pool.stats()
+
+    def close(self) -> None:
+        """Stop the worker pool, if there is one. The parser keeps working in-process.
+
+        A variant leaves the pool it shares alone: it belongs to the parser.
+        """
+        if self._pool is not None and self._owns_pool:
+            self._pool.close()
+
+    def parse_incremental(self, text: str, previous: Optional[ParseState] = None) -> ParseState:
+        """find_currency_matches() for a text that is an edit of a previously parsed one.
+
+        Inline mode gets a new query for nearly every character typed, and each one is
+        the previous query with a few characters changed at the end. The matches of
+        `previous` that sit safely before the first changed character are kept as they
+        are, and only the rest of the text is scanned again; the result is the one a
+        full parse would give.
+
+        "Safely" is what a match attempt could have looked at. An attempt reads its
+        optional prefix (the "$" of "$100"), then a run of amount characters and
+        whitespace, then a unit of bounded width plus a few characters of lookahead.
+        So going back from the edit by the widest unit, then past any amount
+        characters and whitespace, then by the widest prefix, reaches a point before
+        which no attempt saw anything the edit touched. Raw matches of `previous` that
+        straddle that point move it further back, so that no row is mid-match there
+        and the engine can start afresh from it.
+
+        The rest goes the way of find_currency_matches(): through the cache, the
+        prefilter and the worker pool with its deadline.
+        """
+        if len(text) > MAX_TEXT_LENGTH:
+            return ParseState(text, self.find_currency_matches(text), None)
+
+        key = None
+        if self._cache is not None:
+            key = text_key(text, self._cache_scope)
+            cached = self._cache.get(key)
+            if cached is not None:
+                return ParseState(text, list(cached), None)
+
+        cut = self._reusable_prefix(text, previous)
+        matches = [match for match in previous.matches if match.start < cut] if cut else []
+        spans = [span for span in previous.spans if span[0] < cut] if cut else []
+        if not self._may_contain_amount(text[cut:]):
+            if not cut:
+                with self._prefilter_lock:
+                    self._prefilter_rejections += 1
+            return ParseState(text, matches, spans)
+
+        region = self._parse_region_before_deadline(text, cut)
+        if region is None:
+            # As in find_currency_matches: no matches, nothing cached, nothing to reuse.
+            return ParseState(text, [], None)
+        matches += region[0]
+        spans += region[1]
+        if key is not None:
+            self._cache.put(key, matches)
+        return ParseState(text, matches, spans)
+
+    def _parse_region_before_deadline(self, text: str,
+                                      pos: int) -> Optional[Tuple[List[CurrencyMatch], List[Tuple[int, int]]]]:
+        """_parse() of `text` from `pos` on and the spans of its raw matches, in the
+        worker pool when there is a healthy one; None when the pool's deadline passed."""
+        try:
+            if self._pool is not None:
+                result = self._pool.parse_region(text, pos, self.currencies)
+                if result is not None:
+                    return result
+        except ParseTimeout:
+            return None
+        spans: List[Tuple[int, int]] = []
+        return self._parse(text, pos, spans), spans
+
+    def _reusable_prefix(self, text: str, previous: Optional[ParseState]) -> int:
+        """How much of `previous` parse_incremental can keep; 0 for nothing."""
+        # A state without spans — over the length limit, from the cache, past the
+        # deadline — says nothing about where its text can be cut.
+        if previous is None or previous.spans is None:
+            return 0
+        self._ensure_compiled()
+        if self._incremental_margin is None:
+            return 0
+        edit = len(os.path.commonprefix((previous.text, text)))
+        return self._cut_before(text, edit, previous.spans)
+
+    def _cut_before(self, text: str, edit: int, spans: List[Tuple[int, int]]) -> int:
+        """The latest point before `edit` no match attempt reads past; see parse_incremental.
+
+        `spans` are the raw matches of a parse of text[:edit] or more. Needs the
+        compiled table and a bounded _incremental_margin.
+        """
+        cut = edit - self._incremental_margin
+        while cut > 0 and (text[cut - 1].isspace() or text[cut - 1].isdecimal()
+                           or not self._number_keys.isdisjoint(_char_keys(text[cut - 1]))):
+            cut -= 1
+        cut -= self._incremental_prefix + 1
+        moved = True
+        while moved and cut > 0:
+            moved = False
+            for start, end in spans:
+                if start < cut < end:
+                    cut, moved = start, True
+        return max(cut, 0)
+
+    def stream_currency_matches(self, text: Union[str, Iterable[str]], window: int = MAX_TEXT_LENGTH,
+                                max_matches: Optional[int] = None,
+                                time_budget: Optional[float] = None) -> Iterator[CurrencyMatch]:
+        """The matches of a text of any length, found window by window as it arrives.
+
+        For long channel posts, articles and exported logs, which find_currency_matches()
+        refuses. `text` is a string or an iterable of consecutive pieces of one (read
+        from a file, a socket); offsets are into their concatenation. Each window is
+        `window` characters past the point the previous one was cut at, and only the
+        matches before the new cut are yielded — the cut is placed as in
+        parse_incremental, where no match attempt could have read past the end of the
+        window, so every match comes out once and as a parse of the whole text would
+        give it. Memory stays at about two windows, and every window moves the cut by
+        at least half a window, so the total time is linear in the text.
+
+        One shape is not parsed exactly: a run of amount characters and whitespace
+        longer than half a window ("1 2 3 4 …" for thousands of characters) leaves no
+        safe cut; it is cut near the end of the window, behind any match across it.
+
+        Stops after `max_matches` matches or once `time_budget` seconds have passed,
+        checked between windows: a long input can never hold a worker for more than
+        its budget and one window.
+        """
+        self._ensure_compiled()
+        if self._incremental_margin is None:
+            raise ValueError("The pattern table has a row of unbounded width, its matches cannot be cut into windows")
+        reach = self._incremental_margin + self._incremental_prefix + 1 + STREAM_CONTEXT
+        if window < 4 * reach:
+            raise ValueError(f"A streaming window has to be at least {4 * reach} characters, got {window}")
+        if max_matches is not None and max_matches <= 0:
+            return
+        deadline = None if time_budget is None else time.monotonic() + time_budget
+
+        # Pieces of at most a window, so that dropping the parsed head of the buffer
+        # never copies more than about two windows.
+        pieces = iter([text] if isinstance(text, str) else text)
+        pieces = (piece[index:index + window] for piece in pieces for index in range(0, len(piece), window))
+
+        # buffer is the text from `offset` on; its part before `pos` is parsed and only
+        # kept as context for the lookbehinds and the boundary checks at `pos`.
+        buffer, offset, pos, found = '', 0, 0, 0
+        finished = False
+        while True:
+            while not finished and len(buffer) - pos < window:
+                piece = next(pieces, None)
+                if piece is None:
+                    finished = True
+                else:
+                    buffer += piece
+            final = finished and len(buffer) - pos <= window
+            view = buffer if final else buffer[:pos + window]
+            spans: List[Tuple[int, int]] = []
+            matches = self._parse(view, pos, spans) if self._may_contain_amount(view[pos:]) else []
+
+            if final:
+                cut = len(view)
+            else:
+                cut = self._cut_before(view, len(view), spans)
+                if cut < pos + window // 2:
+                    # No safe cut in the second half of the window: see the docstring.
+                    cut = len(view) - reach
+            for match in matches:
+                if match.start >= cut:
+                    break
+                yield match._replace(start=offset + match.start, end=offset + match.end)
+                # A match across a forced cut is the window's answer; resume after it.
+                cut = max(cut, match.end)
+                found += 1
+                if max_matches is not None and found >= max_matches:
+                    return
+            if final:
+                return
+            if deadline is not None and time.monotonic() >= deadline:
+                # Only the length is logged: message texts never go into the logs.
+                logger.warning(f"Stopped parsing a long text after {offset + cut} characters: "
+                               f"the {time_budget} s budget is spent")
+                return
+            base = max(0, cut - STREAM_CONTEXT)
+            buffer = buffer[base:]
+            offset += base
+            pos = cut - base
+
+    def cache_stats(self) -> Optional[dict]:
+        """Hit/miss/eviction counters and fill of the result cache; None when it is off."""
+        return None if self._cache is None else self._cache.stats()
+
+    def _parse(self, text: str, pos: int = 0, spans: Optional[List[Tuple[int, int]]] = None) -> List[CurrencyMatch]:
+        """Run the engine from `pos` over a text that passed the length check and the prefilter.
+
+        The (start, end) of every raw match is appended to `spans` when one is passed.
+        """
+        timings = [0] * len(self.patterns) if self._profile is not None else None
+        # One character for one: every offset into the folded text is one into `text`.
+        raw_matches = self._raw_matches(fold_text(text), timings, pos, text)
+        # The engines are generators; the tails are only known once the table compiled.
+        if self._compiled is None:
+            self._ensure_compiled()
+        if self._exact_tails:
+            raw_matches = self._with_exact_tails(text, raw_matches)
+        if timings is None and spans is None:
+            return self._select_matches(text, raw_matches)
+
+        raw_matches = list(raw_matches)
+        if spans is not None:
+            spans.extend((raw_match[0], raw_match[1]) for raw_match in raw_matches)
+        if timings is None:
+            return self._select_matches(text, raw_matches)
+
+        kept_rows: List[int] = []
+        result = self._select_matches(text, raw_matches, kept_rows)
+        with self._profile_lock:
+            for index, spent in enumerate(timings):
+                self._profile[index][0] += spent
+            for raw_match in raw_matches:
+                self._profile[raw_match[5]][1] += 1
+            for index in kept_rows:
+                self._profile[index][2] += 1
+        return result
+
+    def _with_exact_tails(self, text: str, raw_matches: Iterable[_RawMatch]) -> Iterator[_RawMatch]:
+        """The raw matches whose row has no case-sensitive tail or ends in it in `text`.
+
+        What the folded row matched but the original would not have: "5 kwd" for the
+        KWD row. Dropping it here leaves every engine's result as it was with the
+        `(?-i:KWD)` of the original row — a row resumes after such a match rather
+        than one character on, but a code in its case can only follow the one
+        without, never overlap it.
+        """
+        tails = self._exact_tails
+        for raw_match in raw_matches:
+            tail = tails.get(raw_match[5])
+            if tail is None or text.endswith(tail, 0, raw_match[1]):
+                yield raw_match
+
+    def pattern_profile(self) -> Optional[List[dict]]:
+        """Per-row counters of the pattern table, or None unless built with profile=True.
+
+        One dict per row, in table order: `row`, `currency`, `pattern` (the regex
+        source), `seconds` spent matching the row, `matches` it produced and how many
+        of those `survived` the boundary checks and the overlap filter. Counts and
+        times only — no message text is recorded. `seconds` is the row's own work:
+        the combined engine's locator and block checks are shared by all rows and are
+        not attributed to any of them.
+        """
+        if self._profile is None:
+            return None
+        with self._profile_lock:
+            counters = [list(row) for row in self._profile]
+        return [
+            {
+                'row': index,
+                'currency': currency,
+                'pattern': pattern,
+                'seconds': spent / 1e9,
+                'matches': matches,
+                'survived': survived,
+            }
+            for index, ((currency, pattern), (spent, matches, survived)) in enumerate(zip(self.patterns, counters))
+        ]
+
+    def _may_contain_amount(self, text: str) -> bool:
+        """False only for a text none of the patterns can match, decided without regexes.
+
+        `\\d` is any Unicode decimal digit, which is exactly str.isdecimal(), checked
+        over the distinct characters rather than the whole text. The amount-less words
+        are looked up in the casefolded text: casefolding maps every character the
+        IGNORECASE patterns accept for a letter of those words onto that letter.
+        """
+        if self._prefilter_words is None:
+            return True
+        if any(char.isdecimal() for char in set(text)):
+            return True
+        folded = text.casefold()
+        return any(word in folded for word in self._prefilter_words)
+
+    def prefilter_rejections(self) -> int:
+        """How many texts the prefilter has answered with no matches since start."""
+        with self._prefilter_lock:
+            return self._prefilter_rejections
+
+    def _raw_matches_scan(self, text: str, timings: Optional[List[int]] = None, pos: int = 0,
+                          original: Optional[str] = None) -> List[_RawMatch]:
+        """Every match of every pattern, as _RawMatch tuples.
+
+        The reference engine: one finditer() per pattern. Sorted by start position;
+        the sort is stable, so matches that start at the same place keep the order of
+        their patterns in the table — the tie-break the overlap filter relies on.
+
+        All engines run over fold_text() of the text; `original`, the text before
+        folding, is only read by the tokens engine.
+        """
+        matches = []
+        for index, (currency, pattern) in enumerate(self.compiled_patterns):
+            started = time.perf_counter_ns() if timings is not None else 0
+            for match in pattern.finditer(text, pos):
+                matches.append((match.start(), match.end(), currency, match.group('amount'), match.group(0), index))
+            if timings is not None:
+                timings[index] += time.perf_counter_ns() - started
         matches.sort(key=lambda x: x[0])
-        
-        # Filter overlapping matches
-        if matches:
-            current = matches[0]
-            filtered = [current]
-            
-            for match in matches[1:]:
-                if match[0] >= current[1]:  # If current match starts after previous ends
-                    filtered.append(match)
-                    current = match
-            
-            # Convert to required format: the working tuples are ordered
-            # (start, end, amount, currency, text), the returned ones are not.
-            result = [CurrencyMatch(m[2], m[3], m[4], m[0], m[1]) for m in filtered]
+        return matches
+
+    def _raw_matches_combined(self, text: str, timings: Optional[List[int]] = None, pos: int = 0,
+                              original: Optional[str] = None) -> Iterator[_RawMatch]:
+        """The same matches as _raw_matches_scan, in the same order, in one pass.
+
+        The locator finds the next position where ANY pattern matches; every row that
+        matches there is then taken in table order. That alone is not the scan's
+        answer: finditer runs per pattern and resumes each pattern after its own
+        previous match, so a pattern whose earlier match covers a position cannot match
+        there again, and a match that later fails the boundary check still consumed its
+        stretch for its own pattern. Both decide what the overlap filter ends up
+        keeping ("#100 500 долларов" is one rejected match, not a rejected one plus
+        "500 долларов"). So the engine keeps, per pattern, the position its finditer
+        would resume from.
+
+        Hits are rare — they sit on amounts — while the positions in between cost one
+        failed lookahead each.
+        """
+        resume_at = {}
+        compiled = self.compiled_patterns
+        search = self._locator.search
+        while True:
+            hit = search(text, pos)
+            if hit is None:
+                return
+            start = hit.start()
+            for block, rows in self._blocks:
+                if block.match(text, start) is None:
+                    continue
+                for index in rows:
+                    if resume_at.get(index, 0) > start:
+                        continue
+                    currency, pattern = compiled[index]
+                    started = time.perf_counter_ns() if timings is not None else 0
+                    match = pattern.match(text, start)
+                    if timings is not None:
+                        timings[index] += time.perf_counter_ns() - started
+                    if match is not None:
+                        resume_at[index] = match.end()
+                        yield start, match.end(), currency, match.group('amount'), match.group(0), index
+            pos = start + 1
+
+    def _raw_matches_tokens(self, text: str, timings: Optional[List[int]] = None, pos: int = 0,
+                            original: Optional[str] = None) -> Iterator[_RawMatch]:
+        """The same matches as _raw_matches_scan, in the same order, from the index.
+
+        One walk over the characters. Where a run of amount characters starts, the run
+        is read once and every character that can follow an amount inside it — any of
+        its own characters, the one after it, the whitespace after that and the first
+        character past the whitespace — is looked up in the unit index. The rows found
+        are the only ones that can match at a digit of the run; any other position
+        only gets the rows its own character leads. Those rows are then matched with
+        their own compiled patterns, so the index only decides which rows are tried,
+        never what they match. Resume positions as in _raw_matches_combined.
+
+        The rows of the ISO codes are looked up by the characters of `original`: their
+        code has to be there in its own case, see _build_tokens.
+        """
+        resume_at = {}
+        compiled = self.compiled_patterns
+        original = text if original is None else original
+        lead_rows, unit_rows, number_keys = self._lead_rows, self._unit_rows, self._number_keys
+        code_rows = self._code_rows
+        run_end = 0
+        after_amount: List[int] = []
+        for start in range(pos, len(text)):
+            char = text[start]
+            exact, folded = _char_keys(char)
+            rows = lead_rows.get(exact, []) + lead_rows.get(folded, []) + self._lead_rows_anywhere
+            if char.isdecimal():
+                if start >= run_end:
+                    run_end = start + 1
+                    while run_end < len(text) and (text[run_end].isdecimal() or not number_keys.isdisjoint(_char_keys(text[run_end]))):
+                        run_end += 1
+                    stop = run_end
+                    while stop < len(text) and text[stop].isspace():
+                        stop += 1
+                    found = set(self._unit_rows_anywhere)
+                    for follower in set(text[start:stop + 1]):
+                        for key in _char_keys(follower):
+                            found.update(unit_rows.get(key, ()))
+                    for follower in set(original[start:stop + 1]):
+                        found.update(code_rows.get(follower, ()))
+                    after_amount = list(found)
+                rows = rows + after_amount
+            if not rows:
+                continue
+            for index in sorted(set(rows)):
+                if resume_at.get(index, 0) > start:
+                    continue
+                currency, pattern = compiled[index]
+                started = time.perf_counter_ns() if timings is not None else 0
+                match = pattern.match(text, start)
+                if timings is not None:
+                    timings[index] += time.perf_counter_ns() - started
+                if match is not None:
+                    resume_at[index] = match.end()
+                    yield start, match.end(), currency, match.group('amount'), match.group(0), index
+
+    def _select_matches(self, text: str, raw_matches: Iterable[_RawMatch], kept_rows: Optional[List[int]] = None) -> List[CurrencyMatch]:
+        """Validate, convert and de-overlap raw matches, ordered by start position.
+
+        Of any two that overlap, the one met first is kept: the earlier start, and on a
+        tie the pattern that comes first in the table. The table row of every kept
+        match is appended to kept_rows when one is passed.
+        """
+        result: List[CurrencyMatch] = []
+        current_end = 0
+        for start_pos, end_pos, currency, amount_text, _, row in raw_matches:
+            # A match that overlaps the previous kept one is dropped before anything
+            # else is looked at — it could never be kept anyway.
+            if result and start_pos < current_end:
+                continue
+
+            # Check that currency is surrounded by spaces or is at the beginning/end of text
+            # Start validation: either it's the beginning of text or preceded by space or non-alphanumeric
+            valid_start = start_pos == 0 or text[start_pos-1].isspace() or not text[start_pos-1].isalnum()
+
+            # End validation: either it's the end of text or followed by space or non-alphanumeric
+            valid_end = end_pos == len(text) or text[end_pos].isspace() or not text[end_pos].isalnum()
+
+            # Additional check for special characters that should not be considered as separators
+            special_chars = "#@^e%"
+            if start_pos > 0 and text[start_pos-1] in special_chars:
+                valid_start = False
+
+            if not (valid_start and valid_end):
+                continue
+
+            # Locals, never attributes on self: one CurrencyParser is shared by every
+            # telebot worker thread, and _convert_amount() runs between reading the
+            # match and appending it — long enough for another thread to overwrite an
+            # attribute and put someone else's message text into this reply.
+            amount, base_currency = self._convert_amount(amount_text, currency)
+            # An amount we could not parse is dropped instead of being counted
+            # as zero: the rest of the message still gets an answer.
+            if amount is None:
+                continue
+            # The engines read the folded text; the match is reported in the original.
+            result.append(CurrencyMatch(amount, base_currency, text[start_pos:end_pos], start_pos, end_pos))
+            current_end = end_pos
+            if kept_rows is not None:
+                kept_rows.append(row)
 
         return result
 
-    def find_currencies(self, text: str) -> List[Tuple[float, str, str]]:
+    def find_currencies(self, text: str, exclude: Optional[Iterable[Tuple[int, int]]] = None) -> List[Tuple[float, str, str]]:
         """Find currencies in text
         Returns list of tuples: (amount: float, currency_code: str, original_text: str)
 
@@ -398,8 +1724,13 @@ class CurrencyParser:
         """
         return [
             (match.amount, match.currency_code, match.original_text)
-            for match in self.find_currency_matches(text)
+            for match in self.find_currency_matches(text, exclude)
         ]
 
     def process_currencies(self, text: str) -> List[Tuple[float, str, str]]:
         return self.find_currencies(text)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    print(f"Wrote {PATTERN_TABLE_PATH} ({write_pattern_table()})")
@@ -3,9 +3,9 @@
 # pylance: disable=reportMissingImports, reportMissingModuleSource, reportGeneralTypeIssues
 # type: ignore
 
-from typing import Dict, List, Optional
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple
 from datetime import datetime, timedelta
-import json
 import logging
 import math
 import threading
@@ -14,10 +14,19 @@ import time
 import uuid
 from pathlib import Path
 
-import requests
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
 
+from src.leader_lease import LeaderLease
+from src.rate_providers import ProviderPool, RateProvider, build_providers, usable_usd_rates
+from src.rate_table import RateTable
+from src.rates_cache import encode_rates_cache, read_rates_cache
+from src.rates_history import RatesHistory
 from src.settings import settings
 
+if TYPE_CHECKING:
+    import numpy
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -80,6 +89,13 @@ CLOCK_SKEW_TOLERANCE = timedelta(minutes=5)
 # (two containers can share the data volume); a real write takes milliseconds.
 STALE_TEMP_FILE_AGE = 60
 
+# How often a follower re-reads the cache and asks for the lease (see
+# RATES_LEADER_ELECTION). The watchdog notices a new cache within milliseconds, so the
+# re-read is only the fallback for a notification that never came (some volume drivers
+# drop inotify events); the lease request bounds how long the rates go without a
+# leader after the old one died.
+FOLLOWER_POLL_INTERVAL = 60
+
 
 # What _future_skew reports when the two timestamps cannot be compared at all. The
 # exact value carries no meaning — the callers only ask "is this in the future?" — it
@@ -87,7 +103,6 @@ STALE_TEMP_FILE_AGE = 60
 # broken. The real reason is logged separately, by _future_skew itself.
 UNCOMPARABLE_SKEW = CLOCK_SKEW_TOLERANCE + timedelta(seconds=1)
 
-
 def _future_skew(timestamp: datetime, now: datetime) -> Optional[timedelta]:
     """How far `timestamp` lies in the future, or None when it does not.
 
@@ -113,6 +128,187 @@ def _future_skew(timestamp: datetime, now: datetime) -> Optional[timedelta]:
     return skew if skew > CLOCK_SKEW_TOLERANCE else None
 
 
+class RatesSnapshot(NamedTuple):
+    """One published set of rates: never changed after it is built.
+
+    An update builds a new snapshot and swaps the manager's reference to it, so a
+    reader that took the snapshot once — for a whole reply — converts every amount
+    with the same rates, however many updates land meanwhile, and takes no lock to
+    do it. `revision` grows by one with every snapshot the manager publishes; a cache
+    of anything computed from rates can be keyed by it.
+    """
+
+    # Units of each currency per US dollar, USD itself included.
+    usd_rates: Mapping[str, float]
+    # Age of these rates. Survives a restart through the cache file, so right after
+    # a start it usually predates this process. None while there are no rates.
+    last_update: Optional[datetime]
+    revision: int
+    currencies: Tuple[str, ...]
+    # Positions in `vector`. A position, once given, is never given to another
+    # currency, so positions resolved against one snapshot hold for every later one;
+    # a currency a later update no longer quotes keeps its position as NaN.
+    index: Mapping[str, int]
+    # What `vector` is built from, on first use.
+    lazy_vector: '_LazyVector'
+
+    @property
+    def vector(self) -> 'numpy.ndarray':
+        """The same rates as a read-only float64 vector: the rate of currency C is
+        vector[index[C]]. Built, and numpy imported, when first asked for."""
+        return self.lazy_vector.get()
+
+    def get_rate(self, from_currency: str, to_currency: str) -> Optional[float]:
+        """Get exchange rate for currency pair.
+
+        Derived from the USD vector as usd[to] * (1 / usd[from]) — the expression the
+        stored cross-rate table was filled with, so every pair comes out bit for bit
+        as it did. A currency to itself is 1.0.
+        """
+        try:
+            return self.usd_rates[to_currency] * (1.0 / self.usd_rates[from_currency])
+        except KeyError:
+            logger.error(f"Rate not found for {from_currency}->{to_currency}")
+            return None
+
+    def get_rates(self, sources: Iterable[str], targets: Iterable[str]) -> RateTable:
+        """Every pair of sources × targets, as get_rate() gives each of them.
+
+        A currency these rates do not have leaves its pairs None, and all of them
+        together cost one log line per call, not one per pair.
+        """
+        sources, targets = tuple(dict.fromkeys(sources)), tuple(dict.fromkeys(targets))
+        usd_rates = self.usd_rates
+        target_rates = [usd_rates.get(target) for target in targets]
+        source_rates = [usd_rates.get(source) for source in sources]
+        if None not in target_rates and None not in source_rates:
+            # Every currency is known, which is the rule: one flat pass.
+            values: List[Optional[float]] = [
+                rate * in_usd for in_usd in [1.0 / rate for rate in source_rates] for rate in target_rates
+            ]
+        else:
+            values = [
+                None if source_rate is None or rate is None else rate * (1.0 / source_rate)
+                for source_rate in source_rates for rate in target_rates
+            ]
+            missing = [currency for currency in dict.fromkeys(sources + targets) if currency not in usd_rates]
+            logger.warning(f"No rates for {', '.join(missing)}")
+        return RateTable(sources, targets, values, self.revision)
+
+    def positions(self, currencies: Iterable[str]) -> 'numpy.ndarray':
+        """The positions of `currencies` in `vector`, -1 for a currency it lacks."""
+        numpy = _numpy()
+        index = self.index
+        return numpy.fromiter((index.get(currency, -1) for currency in currencies), dtype=numpy.intp)
+
+    def convert_many(self, amounts, sources, targets) -> 'numpy.ndarray':
+        """Every amount in every target currency, as one array of amounts × targets.
+
+        `sources` gives the currency of each amount. Both it and `targets` are currency
+        codes, or positions from positions() — which a job converting millions of
+        amounts resolves once instead of once per call. Each element is
+        amount * (usd[target] * (1 / usd[source])), get_rate() multiplied out in the
+        same order, so it equals amount * get_rate(source, target) bit for bit. A
+        currency these rates do not have makes its elements NaN and costs one log
+        line per call, as in get_rates().
+        """
+        numpy = _numpy()
+        amounts = numpy.asarray(amounts, dtype=numpy.float64)
+        (sources, source_codes), (targets, target_codes) = self._resolve(sources), self._resolve(targets)
+        if amounts.ndim != 1 or amounts.shape != sources.shape:
+            raise ValueError(f"Need one source currency per amount, got {sources.size} for {amounts.size} amounts")
+        source_rates, target_rates = self._rates_at(sources), self._rates_at(targets)
+        missing_sources, missing_targets = numpy.isnan(source_rates), numpy.isnan(target_rates)
+        if missing_sources.any() or missing_targets.any():
+            names = {position: currency for currency, position in self.index.items()}
+            missing = dict.fromkeys(
+                codes[i] if codes is not None else names.get(int(positions[i]), f"position {positions[i]}")
+                for positions, codes, unknown in ((sources, source_codes, missing_sources), (targets, target_codes, missing_targets))
+                for i in numpy.flatnonzero(unknown)
+            )
+            logger.warning(f"No rates for {', '.join(missing)}")
+        return amounts[:, None] * (target_rates[None, :] * (1.0 / source_rates)[:, None])
+
+    def _resolve(self, currencies) -> Tuple['numpy.ndarray', Optional[List[str]]]:
+        """Positions as they are; codes as their positions, and the codes themselves."""
+        if isinstance(currencies, _numpy().ndarray) and currencies.dtype.kind in 'iu':
+            return currencies, None
+        codes = list(currencies)
+        return self.positions(codes), codes
+
+    def _rates_at(self, positions: 'numpy.ndarray') -> 'numpy.ndarray':
+        """vector[positions], with NaN wherever a position is not in it."""
+        numpy = _numpy()
+        vector = self.vector
+        known = (positions >= 0) & (positions < len(vector))
+        if known.all():
+            return vector[positions]
+        rates = numpy.full(positions.shape, numpy.nan)
+        rates[known] = vector[positions[known]]
+        return rates
+
+
+def _numpy():
+    """numpy, imported on first use: only the vector and convert_many() need it, and
+    the manager has to start and convert without it."""
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("RatesSnapshot.vector and convert_many() need the numpy package") from None
+    return numpy
+
+
+class _LazyVector:
+    """The rates of one snapshot over its index, as a vector built on first use.
+
+    Two threads asking at once may both build it; they build equal arrays, and
+    either one may stay.
+    """
+
+    __slots__ = ('_usd_rates', '_index', '_vector')
+
+    def __init__(self, usd_rates: Mapping[str, float], index: Mapping[str, int]):
+        self._usd_rates = usd_rates
+        self._index = index
+        self._vector = None
+
+    def get(self) -> 'numpy.ndarray':
+        if self._vector is None:
+            numpy = _numpy()
+            vector = numpy.full(len(self._index), numpy.nan)
+            vector[[self._index[currency] for currency in self._usd_rates]] = list(self._usd_rates.values())
+            vector.flags.writeable = False
+            self._vector = vector
+        return self._vector
+
+
+def _rate_vector(usd_rates: Mapping[str, float], index: Mapping[str, int]) -> Tuple[Mapping[str, int], _LazyVector]:
+    """`usd_rates` as a vector over `index`, extended by the currencies it lacks."""
+    added = [currency for currency in usd_rates if currency not in index]
+    if added:
+        index = MappingProxyType({**index, **{currency: len(index) + offset for offset, currency in enumerate(added)}})
+    return index, _LazyVector(usd_rates, index)
+
+
+# What a manager serves before any rates were loaded or downloaded.
+_NO_RATES = RatesSnapshot(MappingProxyType({}), None, 0, (), *_rate_vector({}, MappingProxyType({})))
+
+
+class _CacheFileHandler(FileSystemEventHandler):
+    """Calls `on_change` when `path` is written or renamed into place."""
+
+    def __init__(self, path: Path, on_change):
+        self._path = os.path.abspath(path)
+        self._on_change = on_change
+
+    def on_any_event(self, event):
+        if event.is_directory or event.event_type not in ('created', 'modified', 'moved', 'closed'):
+            return
+        paths = (event.src_path, getattr(event, 'dest_path', ''))
+        if any(path and os.path.abspath(os.fsdecode(path)) == self._path for path in paths):
+            self._on_change()
+
+
 class ExchangeRatesManager:
     def __init__(
         self,
@@ -121,6 +317,12 @@ class ExchangeRatesManager:
         retry_initial_interval: float = RETRY_INITIAL_INTERVAL,
         retry_max_interval: float = RETRY_MAX_INTERVAL,
         start_update_thread: bool = True,
+        providers: Optional[Sequence[RateProvider]] = None,
+        provider_hedge_delay: float = settings.rate_provider_hedge_delay,
+        history_file: str = settings.rates_history_path,
+        history_intraday_days: int = settings.rates_history_intraday_days,
+        leader_election: bool = settings.rates_leader_election,
+        follower_poll_interval: float = FOLLOWER_POLL_INTERVAL,
     ):
         # The intervals are constructor arguments purely so tests can drive the whole
         # retry cycle in milliseconds instead of hours; production uses the defaults.
@@ -130,22 +332,28 @@ class ExchangeRatesManager:
         # FileNotFoundError — silently, since it only logs. The cache would never
         # be written and every restart would burn another paid API request.
         self._cache_file.parent.mkdir(parents=True, exist_ok=True)
-        self._rates: Dict = {}
-        # Age of the rates we are serving. Survives a restart through the cache file,
-        # so right after a start it usually predates this process.
-        self._last_update: Optional[datetime] = None
+        # Where the JSON cache of earlier releases sits: the old default path was the
+        # same name with a .json suffix. Read once, converted, then removed.
+        legacy_cache_file = self._cache_file.with_suffix('.json')
+        self._legacy_cache_file = legacy_cache_file if legacy_cache_file != self._cache_file else None
+        # The rates being served, see RatesSnapshot. Only ever replaced, under
+        # self._lock, never changed: a reader takes the reference without the lock,
+        # and one attribute read is atomic.
+        self._snapshot: RatesSnapshot = _NO_RATES
         # When an update last succeeded IN THIS PROCESS — None while every attempt so
-        # far has failed, even when _last_update is set from the cache. Kept apart
-        # from _last_update so "we are serving old rates" and "we cannot reach the
+        # far has failed, even when the snapshot's last_update is set from the cache.
+        # Kept apart from it so "we are serving old rates" and "we cannot reach the
         # API" are two distinguishable states in the log.
         self._last_successful_update: Optional[datetime] = None
         self._consecutive_failures = 0
+        # Held by writers only: publishing a snapshot and bumping the revision are one
+        # step. Readers never take it.
         self._lock = threading.Lock()
-        # Deliberately NOT self._lock: the cache write must never block get_rate.
+        # Deliberately NOT self._lock: the cache write must never block an update.
         # This one only keeps two savers from writing at the same time (see _save_cache).
         self._save_lock = threading.Lock()
-        # Ordering key for cache writes: a counter bumped once per successful update,
-        # NOT a wall-clock timestamp. Two savers can be in flight at once (a slow update
+        # Ordering key for cache writes, and the revision of the published snapshot: a
+        # counter bumped once per snapshot, NOT a wall-clock timestamp. Two savers can be in flight at once (a slow update
         # overtaken by the next one) and the older one must not overwrite the newer
         # snapshot — but wall time cannot answer that question, because the clock can
         # step backwards (a TZ change, an NTP correction, a data volume moved between
@@ -155,7 +363,30 @@ class ExchangeRatesManager:
         # as the clock stayed behind it.
         self._rates_revision = 0
         self._cache_written_revision = 0
-        self._currencies: List[str] = []
+
+        # Where updates come from, RATE_PROVIDERS unless a test passes its own.
+        self._providers = ProviderPool(
+            build_providers(settings.rate_providers, settings.api_key) if providers is None else providers,
+            timeout=API_REQUEST_TIMEOUT,
+            hedge_delay=provider_hedge_delay,
+        )
+
+        # With leader election on, only the holder of this lease fetches and writes the
+        # cache and the history; the others follow the cache it writes (see
+        # _follow_cache). Taken before the history is opened: a follower must not
+        # repair a file the leader may be appending to right now.
+        self._lease: Optional[LeaderLease] = None
+        if leader_election:
+            self._lease = LeaderLease(self._cache_file.with_name(f"{self._cache_file.name}.lease"))
+            self._lease.try_acquire()
+        self._follower_poll_interval = follower_poll_interval
+        # Serialises the watchdog thread and the update thread reloading the cache.
+        self._follow_lock = threading.Lock()
+        self._observer: Optional[Observer] = None
+
+        # Every snapshot published, for get_rate_at(). Read before the cache is, so the
+        # cached snapshot can join it on the first start after an upgrade.
+        self._history = RatesHistory(history_file, history_intraday_days, repair=self._is_leader())
 
         self._update_interval = update_interval
         self._retry_initial_interval = retry_initial_interval
@@ -173,8 +404,8 @@ class ExchangeRatesManager:
 
         _save_cache writes to `<cache>.<pid>.<random>.tmp` and only unlinks it on the
         error path, so a process killed mid-write (SIGKILL, the OOM killer, power loss)
-        leaves roughly a megabyte behind — and every write picks a fresh name, so
-        nothing would ever reuse that file.
+        leaves it behind — and every write picks a fresh name, so nothing would ever
+        reuse that file.
 
         Files younger than STALE_TEMP_FILE_AGE are left alone: they may belong to
         another process writing right now (two containers can share the data volume),
@@ -197,8 +428,7 @@ class ExchangeRatesManager:
                 continue
             except OSError as e:
                 # One file we may not touch must not cost us the whole sweep: this used
-                # to abort the loop, leaving every other megabyte-sized leftover on the
-                # volume forever. A root-owned temp file is not hypothetical —
+                # to abort the loop, leaving every other leftover on the volume forever. A root-owned temp file is not hypothetical —
                 # entrypoint.sh starts as root and chowns the volume before dropping to
                 # the service user with gosu, so anything written before that (or put
                 # there by hand) stays unwritable for the process that finds it.
@@ -208,11 +438,35 @@ class ExchangeRatesManager:
                 continue
             logger.info(f"Removed a stale rates cache temp file: {leftover.name}")
 
+    def _is_leader(self) -> bool:
+        """Whether this process fetches rates: always, unless it lost the election."""
+        return self._lease is None or self._lease.held
+
+    def leadership(self) -> Optional[str]:
+        """"leader" or "follower" with leader election on, None with it off."""
+        if self._lease is None:
+            return None
+        return "leader" if self._lease.held else "follower"
+
     def _initialize_rates(self) -> None:
         """Initialize rates from cache file or download new ones"""
+        if self._is_leader():
+            self._load_or_fetch_rates()
+        else:
+            logger.info(f"Following the rates leader ({self._lease.holder()}): serving its cache, fetching nothing")
+            self._follow_cache()
+            self._start_following()
+
+        # Say right at startup what the bot is going to serve — including the case
+        # where the answer is "nothing at all".
+        self._log_rates_age()
+
+    def _load_or_fetch_rates(self) -> None:
+        """Serve the cache, and download new rates when it is missing, old or broken."""
         if self._load_cache():
             now = datetime.now()
-            skew = _future_skew(self._last_update, now)
+            last_update = self._snapshot.last_update
+            skew = _future_skew(last_update, now)
             if skew is not None:
                 # The snapshot claims to be newer than "now", so its real age is
                 # unknown. Trusting it would freeze the rates for good: the "older
@@ -221,58 +475,142 @@ class ExchangeRatesManager:
                 # restart without ever refreshing it.
                 logger.warning(
                     f"Cached rates are stamped {skew} in the future (last update "
-                    f"{self._last_update.isoformat()}); the clock moved backwards, refreshing"
+                    f"{last_update.isoformat()}); the clock moved backwards, refreshing"
                 )
                 self._update_all_rates()
-            elif now - self._last_update > timedelta(hours=2):
+            elif now - last_update > timedelta(hours=2):
                 logger.info("Cached rates are too old, updating...")
                 self._update_all_rates()
         else:
             logger.info("No valid cache found, downloading rates...")
             self._update_all_rates()
 
-        # Say right at startup what the bot is going to serve — including the case
-        # where the answer is "nothing at all".
+    def _follow_cache(self) -> bool:
+        """Serve the rates the leader last wrote to the cache, if they are not the ones
+        being served already. Returns True when a new snapshot was published.
+
+        The leader replaces the file with os.replace(), so it is read whole or not at
+        all. A JSON cache of an earlier release is left for the leader to convert.
+        """
+        with self._follow_lock:
+            try:
+                if not self._cache_file.exists():
+                    return False
+                usd_rates, last_update, _revision, legacy = read_rates_cache(self._cache_file)
+                if legacy or last_update == self._snapshot.last_update:
+                    return False
+                if not all(math.isfinite(rate) and rate > 0 for rate in usd_rates.values()):
+                    raise ValueError("the cache holds a non-positive or non-finite rate")
+                self._publish(usd_rates, last_update)
+            except Exception as e:
+                logger.error(f"Failed to load the leader's rates cache: {str(e)}")
+                return False
+            # The leader appends to the history before it replaces the cache, so the
+            # history read now already has this snapshot.
+            try:
+                self._history.reload()
+            except Exception as e:
+                logger.error(f"Failed to reload the rates history: {str(e)}")
+            logger.info(f"Loaded the leader's rates, last update: {last_update}")
+            return True
+
+    def _start_following(self) -> None:
+        """Reload the cache whenever the leader replaces it."""
+        handler = _CacheFileHandler(self._cache_file, self._follow_cache)
+        observer = Observer()
+        # The directory, not the file: os.replace() swaps the inode a file watch
+        # would be attached to.
+        observer.schedule(handler, path=str(self._cache_file.parent), recursive=False)
+        observer.daemon = True
+        observer.start()
+        self._observer = observer
+
+    def _stop_following(self) -> None:
+        observer, self._observer = self._observer, None
+        if observer is not None:
+            observer.stop()
+            if observer is not threading.current_thread():
+                observer.join(timeout=UPDATE_THREAD_STOP_TIMEOUT)
+
+    def _become_leader(self) -> None:
+        """Take over the updates from a leader that has gone."""
+        logger.info("Took over rates updates from the previous leader")
+        self._stop_following()
+        try:
+            # The old leader may have died halfway through an append.
+            self._history.reload(repair=True)
+        except Exception as e:
+            logger.error(f"Failed to reload the rates history: {str(e)}")
+        self._load_or_fetch_rates()
         self._log_rates_age()
 
     def _load_cache(self) -> bool:
-        """Load rates from cache file"""
+        """Load rates from cache file.
+
+        The file is the binary snapshot of src/rates_cache.py. A JSON cache of an
+        earlier release — at the cache path itself, or at the `.json` path next to it
+        where the previous default kept it — is converted on load and written back as
+        a binary one, so the migration happens once, at the first start of this
+        version, without an API request.
+        """
         try:
-            if not self._cache_file.exists():
-                return False
-            with open(self._cache_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            rates = data['rates']
-            last_update = datetime.fromisoformat(data['last_update'])
-            if last_update.tzinfo is not None:
-                # Everything else here works in naive local time (datetime.now()), and
-                # mixing the two raises TypeError on the first subtraction — which
-                # happens in _initialize_rates, i.e. inside __init__, i.e. at import of
-                # src.bot. fromisoformat accepts an offset happily, so the cache only
-                # has to come from a build whose _save_cache used an aware `now` for
-                # the bot to die on import with `restart: always` looping it forever.
-                # astimezone() keeps the instant and only drops the representation.
-                last_update = last_update.astimezone().replace(tzinfo=None)
+            source = self._cache_file
+            if not source.exists():
+                if self._legacy_cache_file is None or not self._legacy_cache_file.exists():
+                    return False
+                source = self._legacy_cache_file
+            usd_rates, last_update, _revision, legacy = read_rates_cache(source)
+            # Every rate is divided by, so a zero or a NaN has to fail the load here
+            # rather than a conversion later.
+            if not all(math.isfinite(rate) and rate > 0 for rate in usd_rates.values()):
+                raise ValueError("the cache holds a non-positive or non-finite rate")
 
             # Nothing is published into the fields until the WHOLE file has been
             # understood. Assigning the rates before parsing the date meant that an
             # unparsable date returned False with the rates already in memory: the bot
             # converted, while the log and rates_age() said there were no rates at all,
             # and kept saying it until an update finally succeeded.
-            self._rates = rates
-            self._last_update = last_update
-            self._currencies = list(rates.keys())
-            # _cache_written_revision is deliberately NOT touched here: it orders the
-            # writes made by THIS process, and a timestamp read from the file used to
-            # veto every one of them whenever it happened to be in the future.
-            logger.info(f"Loaded rates from cache, last update: {self._last_update}")
+            revision = self._publish(usd_rates, last_update)
+            # _cache_written_revision is deliberately NOT touched here, and neither is
+            # the revision in the file used: it orders the writes made by THIS process,
+            # and a timestamp read from the file used to veto every one of them
+            # whenever it happened to be in the future.
+            logger.info(f"Loaded rates from cache, last update: {last_update}")
+            self._record_history(usd_rates, last_update)
+            if legacy:
+                logger.info(f"Converting the JSON rates cache {source} to the binary format")
+                self._save_cache(usd_rates, last_update, revision)
+                if source != self._cache_file and self._cache_written_revision == revision:
+                    source.unlink(missing_ok=True)
             return True
 
         except Exception as e:
             logger.error(f"Failed to load rates cache: {str(e)}")
             return False
 
-    def _save_cache(self, rates: Dict, last_update: datetime, revision: int) -> None:
+    def _publish(self, usd_rates: Dict[str, float], last_update: datetime) -> int:
+        """Swap in a snapshot of `usd_rates` and return its revision.
+
+        Under the lock, so two updates finishing at once get two different revisions
+        in the order they published. `usd_rates` must not be changed afterwards.
+        """
+        with self._lock:
+            self._rates_revision += 1
+            index, lazy_vector = _rate_vector(usd_rates, self._snapshot.index)
+            self._snapshot = RatesSnapshot(
+                MappingProxyType(usd_rates), last_update, self._rates_revision, tuple(usd_rates), index, lazy_vector
+            )
+            return self._rates_revision
+
+    def snapshot(self) -> RatesSnapshot:
+        """The rates being served right now, to convert a whole reply with.
+
+        Never blocks. Later updates do not change the snapshot returned: they publish
+        a new one.
+        """
+        return self._snapshot
+
+    def _save_cache(self, usd_rates: Dict[str, float], last_update: datetime, revision: int) -> None:
         """Write the rates cache atomically, without holding self._lock.
 
         `revision` is the ordering key — see _rates_revision. It is passed in rather
@@ -280,8 +618,9 @@ class ExchangeRatesManager:
         taken before this call.
 
         Two separate problems this shape solves:
-          - the file is around a megabyte, and json.dump on it is slow enough that
-            doing it under self._lock stalled get_rate for every message handler;
+          - the write and fsync are I/O, and doing them under self._lock stalled
+            get_rate for every message handler (with the old JSON cross-rate table
+            the file was a megabyte);
           - open(path, 'w') truncates the real cache first, so a kill in the middle
             left a half-written file that _load_cache then rejects — the next start
             began with no rates and burned a paid API request.
@@ -305,9 +644,9 @@ class ExchangeRatesManager:
                 if revision <= self._cache_written_revision:
                     logger.info("Skipping rates cache write: a newer snapshot has already been written")
                     return
-                data = {'rates': rates, 'last_update': last_update.isoformat()}
-                with open(tmp_path, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, indent=2)
+                content = encode_rates_cache(usd_rates, last_update, revision)
+                with open(tmp_path, 'wb') as f:
+                    f.write(content)
                     f.flush()
                     os.fsync(f.fileno())
                 os.replace(tmp_path, self._cache_file)
@@ -336,9 +675,18 @@ class ExchangeRatesManager:
         """Background thread for periodic rates updates.
 
         Waits on the stop event rather than sleeping, so close() does not have to wait
-        out a twelve-hour nap.
+        out a twelve-hour nap. A follower fetches nothing: it re-reads the cache and
+        asks for the lease every follower_poll_interval, and runs the updates from the
+        moment it gets it.
         """
         while not self._stop_updates.is_set():
+            if not self._is_leader():
+                if self._stop_updates.wait(self._follower_poll_interval):
+                    return
+                self._follow_cache()
+                if self._lease.try_acquire():
+                    self._become_leader()
+                continue
             if self._stop_updates.wait(self._next_update_delay()):
                 return
             self._update_all_rates()
@@ -352,7 +700,8 @@ class ExchangeRatesManager:
         logger.info("Started rates update thread")
 
     def close(self) -> None:
-        """Stop the background update thread. Safe to call more than once.
+        """Stop the background update thread and give up the leader lease. Safe to
+        call more than once.
 
         Public on purpose — see bot.shutdown_managers, which calls it on the way out.
         """
@@ -360,6 +709,9 @@ class ExchangeRatesManager:
         thread = self._update_thread_handle
         if thread is not None and thread.is_alive() and thread is not threading.current_thread():
             thread.join(timeout=UPDATE_THREAD_STOP_TIMEOUT)
+        self._stop_following()
+        if self._lease is not None:
+            self._lease.release()
 
     def rates_age(self) -> Optional[timedelta]:
         """How old the rates currently being served are, or None if there are none.
@@ -370,13 +722,11 @@ class ExchangeRatesManager:
         staleness warning in _log_rates_age, because nothing negative can ever exceed
         STALE_RATES_MAX_AGE.
         """
-        with self._lock:
-            if not self._rates or self._last_update is None:
-                return None
-            last_update = self._last_update
+        snapshot = self._snapshot
+        if not snapshot.usd_rates or snapshot.last_update is None:
+            return None
+        last_update = snapshot.last_update
 
-        # Outside the lock: nothing below touches shared state, and logging under a
-        # lock every message handler needs is not worth it.
         now = datetime.now()
         skew = _future_skew(last_update, now)
         if skew is not None:
@@ -413,31 +763,53 @@ class ExchangeRatesManager:
             logger.info(f"Exchange rates age: {age}")
 
     def get_rate(self, from_currency: str, to_currency: str) -> Optional[float]:
-        """Get exchange rate for currency pair"""
-        with self._lock:
-            try:
-                return self._rates[from_currency][to_currency]
-            except KeyError:
-                logger.error(f"Rate not found for {from_currency}->{to_currency}")
-                return None
+        """Get exchange rate for currency pair, from the current snapshot.
 
-    def _fetch_usd_rates(self) -> Dict:
-        """Fetch the raw USD-based quotes from the API. Raises on any failure.
+        Two calls may see two different updates; a caller converting several amounts
+        takes snapshot() once and asks it instead.
+        """
+        return self._snapshot.get_rate(from_currency, to_currency)
+
+    def get_rates(self, sources: Iterable[str], targets: Iterable[str]) -> RateTable:
+        """Every pair of sources × targets from the current snapshot, in one call."""
+        return self._snapshot.get_rates(sources, targets)
+
+    def convert_many(self, amounts, sources, targets) -> 'numpy.ndarray':
+        """Every amount in every target currency from the current snapshot, in one
+        vectorized multiply. See RatesSnapshot.convert_many()."""
+        return self._snapshot.convert_many(amounts, sources, targets)
+
+    def _fetch_usd_rates(self) -> Dict[str, Any]:
+        """Fetch the raw quotes, {code: units per US dollar}, from the first provider
+        to give usable ones. Raises when none did.
 
         Split out of _update_all_rates so the whole retry/backoff/caching machinery
         can be exercised in tests without touching the network.
         """
-        url = "https://api.apilayer.com/currency_data/live"
-        headers = {"apikey": settings.api_key}
+        _provider, quotes = self._providers.fetch()
+        return quotes
+
+    def _record_history(self, usd_rates: Dict[str, float], last_update: datetime) -> None:
+        """Append the snapshot to the rates history. A failure is logged and nothing
+        more: the history is a convenience, the update has already succeeded."""
+        try:
+            self._history.append(usd_rates, last_update)
+        except Exception as e:
+            logger.error(f"Failed to append to the rates history: {str(e)}")
 
-        response = requests.get(url, headers=headers, timeout=API_REQUEST_TIMEOUT)
-        response.raise_for_status()
-        result = response.json()
+    def get_rate_at(self, from_currency: str, to_currency: str, when: datetime) -> Optional[float]:
+        """The rate for the pair as it was at `when` (naive local time, like every
+        timestamp here), from the rates history: the snapshot published last at or
+        before `when`. None before the history starts or for a currency it lacked.
 
-        if not result.get('success'):
-            raise RuntimeError(f"API request failed. Response: {result}")
+        A binary search in memory — historical rates cost no API request.
+        """
+        return self._history.get_rate_at(from_currency, to_currency, when)
 
-        return result['quotes']
+    def provider_stats(self) -> List[Dict[str, Any]]:
+        """Requests, failures, wins and running latency of each rate provider, in the
+        order the next update asks them."""
+        return self._providers.stats()
 
     def _update_all_rates(self) -> bool:
         """Update rates for all currencies. Returns True when the rates were replaced.
@@ -450,70 +822,32 @@ class ExchangeRatesManager:
         try:
             quotes = self._fetch_usd_rates()
 
-            # Get all currencies from API response
-            usd_rates = {'USD': 1.0}  # Add base USD currency
-            skipped: List[str] = []
-            for key, value in quotes.items():
-                currency = key[3:]  # Remove 'USD' prefix from key
-                # apilayer returns 0 for some dead currencies, and 1.0 / 0 used to
-                # raise ZeroDivisionError in the cross-rate loop below — throwing away
-                # the whole update, every healthy currency included, until the next
-                # scheduled attempt.
-                try:
-                    rate = float(value)
-                except (TypeError, ValueError):
-                    skipped.append(currency)
-                    continue
-                if not math.isfinite(rate) or rate <= 0:
-                    skipped.append(currency)
-                    continue
-                usd_rates[currency] = rate
-
+            # A currency quoted at an unusable rate (apilayer returns 0 for some dead
+            # ones) is skipped, not the whole update — see usable_usd_rates.
+            usd_rates, skipped = usable_usd_rates(quotes)
             if skipped:
                 logger.warning(
                     f"Skipped {len(skipped)} currencies with an unusable (non-positive or non-numeric) "
                     f"rate: {', '.join(sorted(skipped))}"
                 )
 
-            # An empty (or entirely unusable) quotes payload would otherwise "succeed"
-            # and replace working rates with nothing at all.
-            if len(usd_rates) < 2:
-                raise RuntimeError(f"API returned no usable quotes ({len(quotes)} received, all skipped)")
-
             currencies = list(usd_rates.keys())
 
-            # Calculate cross-rates for ALL currencies
-            new_rates = {}
-            for base in currencies:
-                base_in_usd = 1.0 / usd_rates[base]
-                rates = {}
-
-                for target in currencies:
-                    if target != base:
-                        target_rate = usd_rates[target]
-                        rates[target] = target_rate * base_in_usd
-
-                new_rates[base] = rates
-
             now = datetime.now()
-            with self._lock:
-                self._rates = new_rates
-                # Assigned here, not while parsing the response: a failure halfway
-                # through used to leave the currency list describing rates we never
-                # actually stored.
-                self._currencies = currencies
-                self._last_update = now
-                self._last_successful_update = now
-                self._consecutive_failures = 0
-                # Under the same lock as the rates themselves, so two updates finishing
-                # at once get two different revisions in the order they published.
-                self._rates_revision += 1
-                revision = self._rates_revision
-
-            # Outside the lock on purpose: new_rates is never mutated after being
+            # The currency list is published with the rates, not while parsing the
+            # response: a failure halfway through used to leave it describing rates we
+            # never actually stored.
+            revision = self._publish(usd_rates, now)
+            self._last_successful_update = now
+            self._consecutive_failures = 0
+
+            # The history first: a follower reloads it when the cache changes, and must
+            # find this snapshot there by then.
+            self._record_history(usd_rates, now)
+            # Outside the lock on purpose: usd_rates is never mutated after being
             # published (every update builds a fresh dict), so the writer cannot race
             # with a reader — see _save_cache.
-            self._save_cache(new_rates, now, revision)
+            self._save_cache(usd_rates, now, revision)
             logger.info(f"Successfully updated rates for {len(currencies)} currencies")
             return True
 
@@ -527,5 +861,4 @@ class ExchangeRatesManager:
 
     def get_available_currencies(self) -> List[str]:
         """Get list of all available currencies"""
-        with self._lock:
-            return self._currencies.copy()
+        return list(self._snapshot.currencies)
@@ -0,0 +1,72 @@
+"""Which of the processes sharing data/ fetches the rates.
+
+Several bot containers can share one data volume; each used to run its own update
+thread and pay apilayer separately. With leader election on, the one holding the lease
+fetches and writes the rates cache, and the others follow the file it writes.
+
+The lease is an exclusive flock() on a file in the data directory. The kernel lets go
+of it when its holder dies, however it dies, so there is no expiry to tune and no stale
+lease to break: the next follower that asks gets it. flock() covers every process on one
+host — containers sharing a named volume included — but not a network filesystem
+mounted on several hosts, where it may be silently local.
+"""
+
+import logging
+import os
+import socket
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock(), so no leader election either.
+    fcntl = None
+
+logger = logging.getLogger(os.path.splitext(os.path.basename(__file__))[0])
+
+
+class LeaderLease:
+    def __init__(self, path: Path):
+        self._path = Path(path)
+        # The descriptor the lock is held through, while it is held: closing it is
+        # what releases the lock.
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        """Take the lease if nobody holds it. Never blocks; True while this process holds it."""
+        if self._fd is not None:
+            return True
+        if fcntl is None:
+            raise RuntimeError("Leader election needs flock(), which this platform does not have")
+        fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        except BaseException:
+            os.close(fd)
+            raise
+        # Who holds it, for whoever looks at the file; the lock itself is all that counts.
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{socket.gethostname()} pid {os.getpid()} since {datetime.now().isoformat()}\n".encode())
+        self._fd = fd
+        logger.info(f"Took the rates leader lease {self._path}")
+        return True
+
+    def holder(self) -> str:
+        """What the current holder wrote into the lease file, for the log."""
+        try:
+            return self._path.read_text(encoding='utf-8').strip() or "unknown"
+        except OSError:
+            return "unknown"
+
+    def release(self) -> None:
+        fd, self._fd = self._fd, None
+        if fd is not None:
+            os.close(fd)
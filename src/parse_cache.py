@@ -0,0 +1,155 @@
+"""Bounded LRU cache of parse results, keyed by a digest of the message text, and the
+per-user state table of incremental inline parsing.
+
+The same texts reach the parser again and again: a price pasted into several chats, a
+post forwarded around, an inline query retyped. A parse result is a pure function of
+the text and the pattern table, and the table is fixed for the life of the process, so
+an entry never goes stale and the cache needs no invalidation — only a bound.
+
+Keys are 16-byte BLAKE2b digests rather than the texts themselves: the cache holds no
+copy of the messages it has seen, and a 4096-character key would cost more memory
+than most results do.
+"""
+
+import hashlib
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence
+
+_DIGEST_SIZE = 16
+
+
+def text_key(text: str, scope: str = '') -> bytes:
+    """The cache key of a text.
+
+    `scope` tells apart results of the same text from different parsers sharing one
+    cache — a parser for a few currencies only (CurrencyParser.variant) finds less
+    than the full one. It is the BLAKE2b key, so no text can collide with a scope.
+
+    "surrogatepass": a str decoded from Telegram's JSON can carry a lone surrogate,
+    which plain utf-8 refuses to encode.
+    """
+    key = scope.encode('utf-8')
+    if len(key) > hashlib.blake2b.MAX_KEY_SIZE:
+        key = hashlib.blake2b(key).digest()
+    return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=_DIGEST_SIZE, key=key).digest()
+
+
+def _result_size(result: Sequence[tuple]) -> int:
+    """Approximate memory held by one cached result, its key included."""
+    size = sys.getsizeof(result) + sys.getsizeof(b'') + _DIGEST_SIZE
+    for match in result:
+        size += sys.getsizeof(match) + sum(sys.getsizeof(field) for field in match)
+    return size
+
+
+class ParseCache:
+    """Thread-safe LRU of parse results with an entry budget and a byte budget.
+
+    Whichever budget is reached first evicts the least recently used entries. A
+    result bigger than the whole byte budget is not stored at all. Results are stored
+    and returned as tuples: a caller that mutates the list it got back cannot change
+    what the next caller sees.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        if max_entries <= 0 or max_bytes <= 0:
+            raise ValueError(f"Parse cache budgets must be positive, got {max_entries} entries and {max_bytes} bytes")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[bytes, tuple]" = OrderedDict()
+        self._sizes: Dict[bytes, int] = {}
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: bytes) -> Optional[tuple]:
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return result
+
+    def put(self, key: bytes, result: List[tuple]) -> None:
+        stored = tuple(result)
+        size = _result_size(stored)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._sizes[key]
+            self._entries[key] = stored
+            self._entries.move_to_end(key)
+            self._sizes[key] = size
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                evicted, _ = self._entries.popitem(last=False)
+                self._bytes -= self._sizes.pop(evicted)
+                self._evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Counters since start, and the current fill against both budgets."""
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+            }
+
+
+class ParseStateTable:
+    """The last parse per user, for incremental parsing of inline queries.
+
+    Unlike ParseCache this has to keep the query text itself — finding where the next
+    keystroke changed it needs the previous text — so it is bounded by age as well as
+    by size: a state older than `ttl` seconds is gone, and past `max_entries` users
+    the least recently active one is dropped. Nothing is ever written to disk.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        if max_entries <= 0 or ttl <= 0:
+            raise ValueError(f"Parse state table bounds must be positive, got {max_entries} entries and {ttl} s")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        # Least recently stored first, so expired entries are always at the front.
+        self._states: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, owner: Hashable) -> Optional[Any]:
+        with self._lock:
+            self._expire()
+            entry = self._states.get(owner)
+            return None if entry is None else entry[1]
+
+    def put(self, owner: Hashable, state: Any) -> None:
+        with self._lock:
+            self._states[owner] = (self._clock(), state)
+            self._states.move_to_end(owner)
+            self._expire()
+            while len(self._states) > self.max_entries:
+                self._states.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._expire()
+            return len(self._states)
+
+    def _expire(self) -> None:
+        deadline = self._clock() - self.ttl
+        while self._states:
+            stored_at, _ = next(iter(self._states.values()))
+            if stored_at > deadline:
+                break
+            self._states.popitem(last=False)
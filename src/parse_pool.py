@@ -0,0 +1,225 @@
+"""Parsing in a pool of worker processes, to keep regex work off the bot's GIL.
+
+`re` holds the GIL for the whole of a match, so a slow scan in a handler thread stalls
+every other thread of the process, the polling loop included. Sent to a worker
+process instead, the scan only costs that worker: the handler thread waits on a
+future (which releases the GIL) and gives up at a deadline.
+
+Each worker builds its own CurrencyParser once, in the pool initializer. Workers are
+started with "spawn", never "fork": the bot process runs telebot's thread pool and
+holds locks, and a forked child inherits every lock in whatever state some other
+thread left it.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+from typing import TYPE_CHECKING, Any, Callable, Dict, FrozenSet, List, Optional, Sequence, Set, Tuple
+
+from src.regex_backends import BACKEND_RE
+
+if TYPE_CHECKING:
+    from src.currency_parser import CurrencyParser
+
+logger = logging.getLogger(os.path.splitext(os.path.basename(__file__))[0])
+
+# The parser of a worker process, built by _init_worker.
+_worker_parser: Optional['CurrencyParser'] = None
+
+
+class ParseTimeout(TimeoutError):
+    """A pooled parse did not finish before the deadline. Not a result: nothing about
+    the text is known, so nothing about it may be cached."""
+
+
+def _init_worker(engine: str, regex_backend: str) -> None:
+    global _worker_parser
+    # Imported here: currency_parser imports this module, and a worker only needs the
+    # parser once it exists.
+    from src.currency_parser import CurrencyParser
+    _worker_parser = CurrencyParser(engine=engine, regex_backend=regex_backend)
+
+
+def _parse_in_worker(text: str, currencies: Optional[FrozenSet[str]] = None) -> list:
+    # The engine only: length cap, prefilter and cache already ran in the bot process.
+    # With `currencies`, the rows of the variant for them (CurrencyParser.variant),
+    # which the worker cuts from its own parser once and keeps.
+    return _parser_of_worker(currencies)._parse(text)
+
+
+def _parse_region_in_worker(text: str, pos: int, currencies: Optional[FrozenSet[str]] = None) -> Tuple[list, list]:
+    # The rest of an incrementally parsed text, with the spans of its raw matches.
+    spans: list = []
+    return _parser_of_worker(currencies)._parse(text, pos, spans), spans
+
+
+def _parser_of_worker(currencies: Optional[FrozenSet[str]]) -> 'CurrencyParser':
+    if _worker_parser is None:
+        raise RuntimeError("A parse task reached a worker that was never initialised")
+    return _worker_parser if currencies is None else _worker_parser.variant(currencies)
+
+
+def _spawn_executor(workers: int, engine: str, regex_backend: str) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(engine, regex_backend),
+    )
+
+
+def parse_in_processes(texts: Sequence[str], workers: int, engine: str, regex_backend: str = BACKEND_RE,
+                       currencies: Optional[FrozenSet[str]] = None) -> List[list]:
+    """_parse() of every text, in order, in worker processes started for this call;
+    with `currencies`, the _parse() of the variant for them.
+
+    For batches, not for the bot's replies: no deadline, and the texts go out in
+    chunks — a few per worker — so the pickling round trip is paid per chunk rather
+    than per text.
+    """
+    chunksize = max(1, len(texts) // (workers * 4))
+    with _spawn_executor(workers, engine, regex_backend) as executor:
+        return list(executor.map(_parse_in_worker, texts, repeat(currencies), chunksize=chunksize))
+
+
+class ParsePool:
+    """A process pool for CurrencyParser, with a deadline and a way back to in-process.
+
+    parse() returns the matches, raises ParseTimeout when the deadline passed (the
+    caller answers "no currencies found", as for a text over MAX_TEXT_LENGTH, and for
+    the same reason: a text that slow must not hold up the reply, and parsing it
+    in-process instead is the very stall the pool exists to avoid), or returns None
+    when the pool is unhealthy — then the caller parses in-process. A broken pool (a
+    worker killed by the OOM killer, say) is shut down and rebuilt on the first call
+    after `retry_after` seconds.
+
+    A parse that missed its deadline cannot be stopped: cancel() only withdraws a task
+    that has not started, and the worker runs the one it has to the end. Once every
+    worker is busy with such abandoned parses, the pool is saturated — each new text
+    would only queue behind them and time out in turn — so it is recycled: a fresh
+    executor takes the new texts, and the old one is shut down, its workers exiting
+    as their abandoned parses end.
+    """
+
+    def __init__(self, workers: int, deadline: float, engine: str, retry_after: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic, regex_backend: str = BACKEND_RE):
+        if workers <= 0 or deadline <= 0:
+            raise ValueError(f"Parse pool needs positive workers and deadline, got {workers} and {deadline}")
+        self.workers = workers
+        self.deadline = deadline
+        self.engine = engine
+        self.regex_backend = regex_backend
+        self.retry_after = retry_after
+        self._clock = clock
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._broken_at: Optional[float] = None
+        self._counters = {'submitted': 0, 'timeouts': 0, 'fallbacks': 0, 'restarts': 0, 'recycles': 0}
+        # Timed-out parses still running in the current executor.
+        self._abandoned: Set[Future] = set()
+        self._lock = threading.Lock()
+        self._start()
+
+    def _start(self) -> None:
+        """Create the executor; called with self._lock held or before it is shared."""
+        try:
+            self._executor = _spawn_executor(self.workers, self.engine, self.regex_backend)
+            self._broken_at = None
+            self._abandoned = set()
+        except Exception:
+            logger.error("Failed to start the parse pool, parsing in-process", exc_info=True)
+            self._executor = None
+            self._broken_at = self._clock()
+
+    def _healthy_executor(self) -> Optional[ProcessPoolExecutor]:
+        with self._lock:
+            if self._executor is None and self._broken_at is not None \
+                    and self._clock() - self._broken_at >= self.retry_after:
+                self._counters['restarts'] += 1
+                self._start()
+            return self._executor
+
+    def _mark_broken(self, executor: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._executor is not executor:
+                return  # another thread got here first
+            self._executor = None
+            self._broken_at = self._clock()
+        logger.error(f"Parse pool is broken, parsing in-process for the next {self.retry_after:.0f} s")
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def parse(self, text: str, currencies: Optional[FrozenSet[str]] = None) -> Optional[List[tuple]]:
+        """The matches of `text`, by the variant for `currencies` when given; see the class."""
+        return self._run(text, _parse_in_worker, text, currencies)
+
+    def parse_region(self, text: str, pos: int,
+                     currencies: Optional[FrozenSet[str]] = None) -> Optional[Tuple[List[tuple], List[Tuple[int, int]]]]:
+        """The matches of `text` from `pos` on and the spans of its raw matches, for
+        CurrencyParser.parse_incremental; same deadline and fallback as parse()."""
+        return self._run(text, _parse_region_in_worker, text, pos, currencies)
+
+    def _run(self, text: str, function: Callable[..., Any], *args: Any) -> Any:
+        executor = self._healthy_executor()
+        if executor is None:
+            self._count('fallbacks')
+            return None
+        try:
+            future = executor.submit(function, *args)
+        except (BrokenProcessPool, RuntimeError):
+            # RuntimeError: submit() on an executor another thread has just shut down.
+            self._mark_broken(executor)
+            self._count('fallbacks')
+            return None
+        self._count('submitted')
+        try:
+            return future.result(timeout=self.deadline)
+        except TimeoutError:
+            self._count('timeouts')
+            # Only the length: message texts never go into the logs.
+            logger.warning(f"Parsing {len(text)} characters took longer than {self.deadline} s, answering with no matches")
+            if not future.cancel():
+                self._abandon(executor, future)
+            raise ParseTimeout(f"Parsing took longer than {self.deadline} s")
+        except (BrokenProcessPool, RuntimeError):
+            self._mark_broken(executor)
+            self._count('fallbacks')
+            return None
+
+    def _abandon(self, executor: ProcessPoolExecutor, future: Future) -> None:
+        """Keep count of a timed-out parse still holding a worker; recycle the executor
+        when all of them are held."""
+        with self._lock:
+            if self._executor is not executor:
+                return  # already replaced
+            self._abandoned.add(future)
+        # Outside the lock: a future that is done already runs the callback right here.
+        future.add_done_callback(self._abandoned_done)
+        with self._lock:
+            if self._executor is not executor or len(self._abandoned) < self.workers:
+                return
+            self._counters['recycles'] += 1
+            self._start()
+        logger.error(f"Every parse worker is stuck on a parse past its deadline, starting {self.workers} new ones")
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _abandoned_done(self, future: Future) -> None:
+        with self._lock:
+            self._abandoned.discard(future)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters, workers=self.workers, healthy=int(self._executor is not None))
+
+    def close(self) -> None:
+        with self._lock:
+            executor, self._executor, self._broken_at = self._executor, None, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,207 @@
+"""Throughput of CurrencyParser on a synthetic chat corpus, configurations side by side.
+
+    python -m src.parser_benchmark [--messages N] [--seed S] [--config NAME ...]
+
+The corpus is what the bot sees in a group chat: mostly messages without any money
+in them (some with times, dates, phone numbers and versions — digits the prefilter
+lets through), short price mentions in every spelling the alias table knows, and a
+few pastes up to MAX_TEXT_LENGTH. Every configuration parses the same corpus; the
+report gives messages per second and the p50/p99 latency of one
+find_currency_matches() call, and every result is compared with the reference
+configuration's. A configuration that returns a different CurrencyMatch list for
+any message makes the run fail — a faster parser that answers differently is not
+an optimisation.
+"""
+
+import argparse
+import random
+import sys
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Protocol, Sequence
+
+from src.currency_aliases import ALIASES, expand
+from src.currency_parser import ENGINE_COMBINED, ENGINE_SCAN, ENGINE_TOKENS, MAX_TEXT_LENGTH, CurrencyMatch, CurrencyParser
+from src.regex_backends import BACKEND_RE2
+
+# Keyword arguments of CurrencyParser per configuration. The reference is the plain
+# scan: every other engine is defined as returning exactly what it returns.
+CONFIGURATIONS: Dict[str, dict] = {
+    'scan': {'engine': ENGINE_SCAN},
+    'combined': {'engine': ENGINE_COMBINED},
+    'tokens': {'engine': ENGINE_TOKENS},
+    'combined+cache': {'engine': ENGINE_COMBINED, 'cache_entries': 1024, 'cache_bytes': 4 << 20},
+    're2': {'engine': ENGINE_SCAN, 'regex_backend': BACKEND_RE2},
+}
+REFERENCE = 'scan'
+
+# Shares of the corpus. The rest is money-free chat.
+PRICE_SHARE = 0.17
+PASTE_SHARE = 0.03
+
+_CHAT = [
+    "привет, как дела?", "ок", "ахаха 😂", "созвон в 15:30?", "буду через 10 минут",
+    "кв. 42, этаж 7, домофон 42К", "мой номер +7 999 123-45-67", "версия 3.11.7 вышла",
+    "заказ №128345 доставят 12.05", "see you at 7", "lol", "+1", "2 + 2 = 4",
+    "на фото 3 кота и 1 собака", "встреча перенесена на 2024-06-01", "у меня 5 минут",
+    "what time is it in UTC+3?", "запускаю сборку #4512", "счёт 3:1 в пользу Реала",
+    "погода +23, ветер 5 м/с", "ничего не понял", "скинь ссылку", "спасибо!",
+]
+_PRICE = [
+    "взял за {price}", "{price} за подписку, норм?", "скинь {price} до пятницы",
+    "это стоило {price}", "аренда {price} в месяц", "it was {price}, can you believe it",
+    "{price}", "цена {price}, торг уместен", "получил {price} и ещё {price}",
+]
+_PASTE_LINES = [
+    "2024-05-01 12:00:{second:02d} INFO request took {n} ms, {n} rows",
+    "Товар {n} — {price}", "{n} {n} {n} {n} {n} {n} {n} {n}",
+    "order {n}: total {price}, shipping {price}", "строка {n} без денег, просто текст",
+]
+
+
+def _price(rng: random.Random) -> str:
+    """One amount with one of the spellings the alias table knows, or an ISO code."""
+    amount = rng.choice(['5', '20', '99', '150', '1 500', '12 000', '2,5к', '1.99', '1,000,000', '300к', '7.5'])
+    currency = rng.choice(list(ALIASES))
+    aliases = ALIASES[currency]
+    roll = rng.random()
+    if roll < 0.15:
+        return rng.choice(['100 CHF', '50 KWD', '20 NOK', '5 SEK', '7 HKD'])
+    if roll < 0.3 and aliases.prefixes:
+        return rng.choice(expand(rng.choice(aliases.prefixes))) + amount.replace(' ', '')
+    if roll < 0.45 and aliases.symbols:
+        return amount + rng.choice(['', ' ']) + rng.choice(expand(rng.choice(aliases.symbols)))
+    if aliases.words:
+        return f"{amount} {rng.choice(expand(rng.choice(aliases.words)))}"
+    return rng.choice(expand(rng.choice(aliases.standalone or aliases.spaced)))
+
+
+def _paste(rng: random.Random) -> str:
+    lines = []
+    size = 0
+    limit = rng.randint(MAX_TEXT_LENGTH // 2, MAX_TEXT_LENGTH)
+    while True:
+        line = rng.choice(_PASTE_LINES).format(second=rng.randrange(60), n=rng.randint(1, 99999), price=_price(rng))
+        if size + len(line) + 1 > limit:
+            return '\n'.join(lines)
+        lines.append(line)
+        size += len(line) + 1
+
+
+def build_corpus(messages: int = 5000, seed: int = 0) -> List[str]:
+    """A reproducible chat corpus of `messages` texts, none longer than MAX_TEXT_LENGTH."""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(messages):
+        roll = rng.random()
+        if roll < PASTE_SHARE:
+            corpus.append(_paste(rng))
+        elif roll < PASTE_SHARE + PRICE_SHARE:
+            corpus.append(rng.choice(_PRICE).replace('{price}', '{}').format(*(_price(rng) for _ in range(2))))
+        else:
+            corpus.append(rng.choice(_CHAT))
+    return corpus
+
+
+class Parser(Protocol):
+    """What run_benchmark() times: a CurrencyParser, or a stand-in for one."""
+
+    def find_currency_matches(self, text: str) -> List[CurrencyMatch]:
+        ...
+
+
+class BenchmarkResult(NamedTuple):
+    name: str
+    messages: int
+    seconds: float
+    messages_per_second: float
+    p50_us: float
+    p99_us: float
+    # Positions in the corpus where the result differs from the reference's.
+    mismatches: List[int]
+
+
+def _percentile(ordered: List[int], share: float) -> int:
+    """Nearest-rank percentile of an ascending list."""
+    return ordered[max(0, min(len(ordered) - 1, int(round(share * len(ordered))) - 1))]
+
+
+def run_benchmark(corpus: Sequence[str], parsers: Dict[str, Parser], reference: str = REFERENCE) -> List[BenchmarkResult]:
+    """Parse the corpus with every parser and compare each with the reference.
+
+    `parsers` maps a name to anything with find_currency_matches(), usually a
+    CurrencyParser; the reference has to be one of them. Each parser parses one text
+    before the clock starts, so lazy compilation is not billed to the first message.
+    """
+    if reference not in parsers:
+        raise ValueError(f"The reference configuration {reference!r} is not among: {', '.join(parsers)}")
+    expected: Optional[List[List[CurrencyMatch]]] = None
+    results = []
+    for name in [reference] + [name for name in parsers if name != reference]:
+        parse = parsers[name].find_currency_matches
+        parse('100 долларов')
+        outputs: List[List[CurrencyMatch]] = []
+        latencies: List[int] = []
+        for text in corpus:
+            started = time.perf_counter_ns()
+            outputs.append(parse(text))
+            latencies.append(time.perf_counter_ns() - started)
+        if expected is None:
+            expected = outputs
+        total = sum(latencies) / 1e9
+        latencies.sort()
+        results.append(BenchmarkResult(
+            name=name,
+            messages=len(corpus),
+            seconds=total,
+            messages_per_second=len(corpus) / total if total else float('inf'),
+            p50_us=_percentile(latencies, 0.50) / 1e3,
+            p99_us=_percentile(latencies, 0.99) / 1e3,
+            mismatches=[index for index, (got, want) in enumerate(zip(outputs, expected)) if got != want],
+        ))
+    return results
+
+
+def build_parsers(names: Sequence[str], factory: Callable[..., Parser] = CurrencyParser) -> Dict[str, Parser]:
+    """A parser per configuration name. Configurations that cannot be built here — re2
+    without google-re2 installed — are left out with a note on stderr."""
+    parsers: Dict[str, Parser] = {}
+    for name in names:
+        if name not in CONFIGURATIONS:
+            raise ValueError(f"Unknown configuration: {name!r}, expected one of: {', '.join(CONFIGURATIONS)}")
+        try:
+            parsers[name] = factory(**CONFIGURATIONS[name])
+        except ValueError as e:
+            print(f"skipping {name}: {e}", file=sys.stderr)
+    return parsers
+
+
+def format_report(results: List[BenchmarkResult]) -> str:
+    lines = [f"{'configuration':<16} {'msgs/s':>10} {'p50 µs':>9} {'p99 µs':>10}  equivalence"]
+    for result in results:
+        verdict = 'ok' if not result.mismatches else f"{len(result.mismatches)} messages differ"
+        lines.append(f"{result.name:<16} {result.messages_per_second:>10.0f} {result.p50_us:>9.1f} {result.p99_us:>10.1f}  {verdict}")
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    arguments = argparse.ArgumentParser(description=(__doc__ or '').split('\n\n')[0])
+    arguments.add_argument('--messages', type=int, default=5000, help="corpus size (default: 5000)")
+    arguments.add_argument('--seed', type=int, default=0, help="corpus seed (default: 0)")
+    arguments.add_argument('--config', action='append', choices=list(CONFIGURATIONS),
+                           help=f"a configuration to run, repeatable (default: all); {REFERENCE} always runs")
+    options = arguments.parse_args(argv)
+
+    corpus = build_corpus(options.messages, options.seed)
+    names = [REFERENCE] + [name for name in (options.config or CONFIGURATIONS) if name != REFERENCE]
+    results = run_benchmark(corpus, build_parsers(names))
+    print(f"{len(corpus)} messages, {sum(len(text) for text in corpus)} characters, seed {options.seed}")
+    print(format_report(results))
+    failed = [result for result in results if result.mismatches]
+    for result in failed:
+        for index in result.mismatches[:5]:
+            print(f"{result.name} differs from {REFERENCE} on message {index}: {corpus[index][:80]!r}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,286 @@
+"""Where the rates come from: a set of providers asked together, the first good answer wins.
+
+The manager used to make one request to apilayer per update, with a 10 s timeout,
+and a slow apilayer meant the update thread waited out the timeout before backing
+off. ProviderPool asks the providers in order of how well they have been doing. The
+best one goes first. The next one is started when it fails, or when it has not
+answered within `hedge_delay` seconds. The first response that holds usable rates
+is taken, and the requests still running finish in the background, only to update
+their provider's statistics. With a hedge delay of 0 every provider is asked at once.
+
+Providers:
+  - ApilayerProvider: apilayer's currency_data/live, the paid source the bot started with;
+  - JsonRatesProvider: any HTTP endpoint answering JSON with a `rates` object against a
+    `base` (or `base_code`) currency — open.er-api.com and the like, or a stand-in
+    served on the local network;
+  - FileRatesProvider: the same JSON read from a file, for air-gapped deployments and tests.
+
+A provider returns the raw quotes, {code: units per US dollar}; usable_usd_rates()
+is what decides which of them can be used.
+"""
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+import requests
+
+from src.rates_cache import BASE_CURRENCY
+
+logger = logging.getLogger(os.path.splitext(os.path.basename(__file__))[0])
+
+APILAYER_URL = "https://api.apilayer.com/currency_data/live"
+
+# Weight of the newest request in a provider's running averages: about the last five
+# requests count, so a provider that recovers is trusted again within a day or two of
+# updates rather than never.
+_SMOOTHING = 0.2
+
+
+class RateProvider:
+    """A source of USD rates. Subclasses set `name` and implement fetch()."""
+
+    name: str = ""
+
+    def fetch(self, timeout: float) -> Dict[str, Any]:
+        """The raw quotes, {code: units per US dollar}. Raises on any failure."""
+        raise NotImplementedError
+
+
+class ApilayerProvider(RateProvider):
+    name = "apilayer"
+
+    def __init__(self, api_key: str, url: str = APILAYER_URL):
+        self._api_key = api_key
+        self._url = url
+
+    def fetch(self, timeout: float) -> Dict[str, Any]:
+        response = requests.get(self._url, headers={"apikey": self._api_key}, timeout=timeout)
+        response.raise_for_status()
+        result = response.json()
+
+        if not result.get('success'):
+            raise RuntimeError(f"API request failed. Response: {result}")
+
+        # "USDEUR": apilayer prefixes every quote with the source currency.
+        return {key[3:]: value for key, value in result['quotes'].items() if key.startswith(BASE_CURRENCY)}
+
+
+class JsonRatesProvider(RateProvider):
+    """An HTTP endpoint answering {"base": "USD", "rates": {"EUR": 0.92, ...}}."""
+
+    def __init__(self, url: str, headers: Optional[Mapping[str, str]] = None):
+        self.name = urlparse(url).netloc or url
+        self._url = url
+        self._headers = dict(headers or {})
+
+    def fetch(self, timeout: float) -> Dict[str, Any]:
+        response = requests.get(self._url, headers=self._headers, timeout=timeout)
+        response.raise_for_status()
+        return rates_from_payload(response.json())
+
+
+class FileRatesProvider(RateProvider):
+    """A JSON file of the shape JsonRatesProvider reads, re-read on every update."""
+
+    def __init__(self, path: str):
+        self.name = f"file:{path}"
+        self._path = Path(path)
+
+    def fetch(self, timeout: float) -> Dict[str, Any]:
+        return rates_from_payload(json.loads(self._path.read_text(encoding='utf-8')))
+
+
+def rates_from_payload(data: Mapping[str, Any]) -> Dict[str, Any]:
+    """The quotes of a {"base": ..., "rates": {...}} document, against the US dollar.
+
+    A document against another base is converted through its own USD rate. An
+    explicit failure ("success": false, "result": "error") is raised as one.
+    """
+    if data.get('success') is False or data.get('result', 'success') != 'success':
+        raise RuntimeError(f"Rates request failed. Response: {data}")
+    rates = data['rates']
+    base = data.get('base') or data.get('base_code') or BASE_CURRENCY
+    if base == BASE_CURRENCY:
+        return dict(rates)
+    per_dollar = float(rates[BASE_CURRENCY])
+    converted = {code: float(rate) / per_dollar for code, rate in rates.items() if code != BASE_CURRENCY}
+    converted[base] = 1.0 / per_dollar
+    return converted
+
+
+def usable_usd_rates(quotes: Mapping[str, Any]) -> Tuple[Dict[str, float], List[str]]:
+    """The usable rates of `quotes` with USD itself added, and the codes that were not.
+
+    apilayer returns 0 for some dead currencies, and 1.0 / 0 used to raise
+    ZeroDivisionError in the cross-rate loop that once stood in the update —
+    throwing away the whole update, every healthy currency included, until the
+    next scheduled attempt. get_rate divides by these now, so a rate that is not a
+    positive finite number skips its currency instead. A payload with nothing usable
+    raises: it would otherwise "succeed" and replace working rates with nothing.
+    """
+    usd_rates = {BASE_CURRENCY: 1.0}
+    skipped: List[str] = []
+    for currency, value in quotes.items():
+        if currency == BASE_CURRENCY:
+            continue
+        try:
+            rate = float(value)
+        except (TypeError, ValueError):
+            skipped.append(currency)
+            continue
+        if not math.isfinite(rate) or rate <= 0:
+            skipped.append(currency)
+            continue
+        usd_rates[currency] = rate
+    if len(usd_rates) < 2:
+        raise RuntimeError(f"API returned no usable quotes ({len(quotes)} received, all skipped)")
+    return usd_rates, skipped
+
+
+def build_providers(specs: str, api_key: str) -> List[RateProvider]:
+    """The providers of a RATE_PROVIDERS value, in its order.
+
+    Comma-separated entries: `apilayer`, an http(s) URL of a JSON source, or
+    `file:<path>`. Raises ValueError on anything else.
+    """
+    providers: List[RateProvider] = []
+    for spec in (part.strip() for part in specs.split(',')):
+        if spec == 'apilayer':
+            providers.append(ApilayerProvider(api_key))
+        elif spec.startswith(('http://', 'https://')):
+            providers.append(JsonRatesProvider(spec))
+        elif spec.startswith('file:') and len(spec) > len('file:'):
+            providers.append(FileRatesProvider(spec[len('file:'):]))
+        else:
+            raise ValueError(f"unknown rate provider {spec!r}: use apilayer, an http(s) URL or file:<path>")
+    if len({provider.name for provider in providers}) != len(providers):
+        raise ValueError("a rate provider is listed twice")
+    return providers
+
+
+class _ProviderStats:
+    """Counters of one provider. Changed under ProviderPool._lock only."""
+
+    __slots__ = ('requests', 'failures', 'wins', 'latency', 'failure_rate', 'last_error')
+
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.wins = 0
+        # Running averages: seconds a request took, and the share of requests that
+        # failed. None until the first request comes back.
+        self.latency: Optional[float] = None
+        self.failure_rate = 0.0
+        self.last_error: Optional[str] = None
+
+
+class ProviderPool:
+    """The providers of one manager, and how each of them has been doing."""
+
+    def __init__(self, providers: Sequence[RateProvider], timeout: float, hedge_delay: float):
+        if not providers:
+            raise ValueError("At least one rate provider is needed")
+        self._providers = list(providers)
+        self._timeout = timeout
+        self._hedge_delay = hedge_delay
+        self._lock = threading.Lock()
+        self._stats = {provider.name: _ProviderStats() for provider in self._providers}
+
+    def _expected_cost(self, provider: RateProvider) -> float:
+        """Seconds an answer from `provider` is expected to take, a failure costing the
+        full timeout.
+
+        A provider not asked yet is taken to answer within the hedge delay: behind
+        every measured provider that does, in front of those that do not. So after a
+        start the configured order holds until a measurement says otherwise.
+        """
+        stats = self._stats[provider.name]
+        if stats.latency is None:
+            return self._hedge_delay
+        return stats.latency + stats.failure_rate * self._timeout
+
+    def ranked(self) -> List[RateProvider]:
+        """The providers in the order the next update asks them; ties keep the configured order."""
+        with self._lock:
+            return sorted(self._providers, key=self._expected_cost)
+
+    def fetch(self, validate: Callable[[Dict[str, Any]], Any] = usable_usd_rates) -> Tuple[str, Dict[str, Any]]:
+        """The name of the provider that answered first with quotes `validate` accepts,
+        and those quotes. Raises RuntimeError naming every failure when none did."""
+        queue = self.ranked()
+        executor = ThreadPoolExecutor(max_workers=len(queue), thread_name_prefix='rate-provider')
+        running: Dict[Any, RateProvider] = {}
+        errors: List[str] = []
+        try:
+            while queue or running:
+                if queue and not running:
+                    provider = queue.pop(0)
+                    running[executor.submit(self._ask, provider, validate)] = provider
+                    continue
+                done, _ = wait(running, timeout=self._hedge_delay if queue else None, return_when=FIRST_COMPLETED)
+                if not done:
+                    # The running requests are slow: start the next provider beside them.
+                    provider = queue.pop(0)
+                    running[executor.submit(self._ask, provider, validate)] = provider
+                    continue
+                for future in done:
+                    provider = running.pop(future)
+                    try:
+                        quotes = future.result()
+                    except Exception as e:
+                        errors.append(f"{provider.name}: {e}")
+                        continue
+                    with self._lock:
+                        self._stats[provider.name].wins += 1
+                    if errors or running:
+                        logger.info(f"Rates from {provider.name} "
+                                    f"({len(errors)} failed, {len(running)} still running)")
+                    return provider.name, quotes
+        finally:
+            # The losers finish on their own — each is capped by the request timeout —
+            # and only their statistics are kept.
+            executor.shutdown(wait=False)
+        raise RuntimeError(f"Every rate provider failed: {'; '.join(errors)}")
+
+    def _ask(self, provider: RateProvider, validate: Callable[[Dict[str, Any]], Any]) -> Dict[str, Any]:
+        started = time.monotonic()
+        try:
+            quotes = provider.fetch(self._timeout)
+            validate(quotes)
+        except Exception as e:
+            self._record(provider, time.monotonic() - started, e)
+            raise
+        self._record(provider, time.monotonic() - started, None)
+        return quotes
+
+    def _record(self, provider: RateProvider, elapsed: float, error: Optional[Exception]) -> None:
+        with self._lock:
+            stats = self._stats[provider.name]
+            stats.requests += 1
+            failed = error is not None
+            if failed:
+                stats.failures += 1
+                stats.last_error = str(error)
+            if stats.latency is None:
+                stats.latency, stats.failure_rate = elapsed, float(failed)
+            else:
+                stats.latency += _SMOOTHING * (elapsed - stats.latency)
+                stats.failure_rate += _SMOOTHING * (float(failed) - stats.failure_rate)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """One dict per provider, in the order the next update asks them."""
+        order = self.ranked()
+        with self._lock:
+            return [
+                dict(name=provider.name, **{field: getattr(self._stats[provider.name], field)
+                                            for field in _ProviderStats.__slots__})
+                for provider in order
+            ]
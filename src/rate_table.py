@@ -0,0 +1,46 @@
+"""The rates of a whole reply: every (source, target) pair, from one snapshot of rates.
+
+A reply converts each currency found in the message into each currency the user
+shows, and used to fetch those pairs one get_rate() call at a time into a dict keyed
+by "SRC_TGT" strings. RateTable is what ExchangeRatesManager.get_rates() returns
+instead: the pairs as one row-major list with the currencies' positions beside it,
+so a lookup is two dict reads and a list index — no key is ever built.
+"""
+
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple, Union
+
+
+class RateTable:
+    """Rates of sources × targets. `revision` is that of the snapshot they came from."""
+
+    __slots__ = ('sources', 'targets', 'revision', '_source_index', '_target_index', '_values')
+
+    def __init__(self, sources: Iterable[str], targets: Iterable[str], values: List[Optional[float]], revision: int):
+        self.sources: Tuple[str, ...] = tuple(sources)
+        self.targets: Tuple[str, ...] = tuple(targets)
+        if len(values) != len(self.sources) * len(self.targets):
+            raise ValueError(f"A table of {len(self.sources)} sources and {len(self.targets)} targets "
+                             f"needs {len(self.sources) * len(self.targets)} rates, got {len(values)}")
+        self.revision = revision
+        self._source_index: Dict[str, int] = {source: index * len(self.targets) for index, source in enumerate(self.sources)}
+        self._target_index: Dict[str, int] = {target: index for index, target in enumerate(self.targets)}
+        self._values = values
+
+    def rate(self, source: str, target: str) -> Optional[float]:
+        """The rate from `source` to `target`; None when it is unknown or was not asked for."""
+        row = self._source_index.get(source)
+        column = self._target_index.get(target)
+        if row is None or column is None:
+            return None
+        return self._values[row + column]
+
+    def __len__(self) -> int:
+        """How many of the pairs have a rate."""
+        return sum(value is not None for value in self._values)
+
+
+def lookup_rate(rates: Union[RateTable, Mapping[str, float]], source: str, target: str) -> Optional[float]:
+    """The rate from `source` to `target` in a RateTable, or in a {"SRC_TGT": rate} dict."""
+    if isinstance(rates, RateTable):
+        return rates.rate(source, target)
+    return rates.get(f"{source}_{target}")
@@ -0,0 +1,158 @@
+"""The on-disk rates cache: one snapshot of the USD vector in a small binary file.
+
+The file is read on every start and rewritten after every update. As JSON it had to be
+parsed into a dict on start, and rewritten as a whole text with `indent=2`. The binary
+layout is laid out the way the manager keeps the rates, so loading it is a few fixed-size
+reads out of an mmap:
+
+    header   40 bytes  b"CRVR", format version (u16), 0 (u16),
+                       last update (i64, microseconds since 1970-01-01 in local wall-clock
+                       time — the naive stamp the manager works with, as the JSON had it),
+                       revision of the writing process (i64), currency count (u32),
+                       size of the code table (u32), CRC-32 of everything after the
+                       header (u32), 0 (u32)
+    codes    the codes in ASCII, each followed by a NUL, padded with NULs to a multiple
+             of 8 bytes — one decode and one split, not a slice per currency
+    rates    count × float64, units of each currency per US dollar, in the order of the codes
+
+All little-endian; for ~170 currencies that is under 3 KB. A file of another version,
+a truncated one, or one whose checksum does not match is refused with ValueError, and
+the manager then downloads fresh rates, as it does for any cache it cannot read.
+
+The JSON caches of earlier releases — the USD vector under `usd_rates`, and before that
+the full cross-rate table under `rates` — are still read, so the first start of this
+release converts whatever the previous one left and does not spend an API request on it.
+"""
+
+import json
+import mmap
+import struct
+import zlib
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Mapping, NamedTuple, Tuple
+
+MAGIC = b"CRVR"
+FORMAT_VERSION = 1
+
+# The currency every quote is against. The manager keeps one number per currency — how
+# many units of it a dollar buys — and derives every other pair from two of them.
+BASE_CURRENCY = 'USD'
+
+_HEADER = struct.Struct('<4sHHqqIIII')
+# The code table is padded to this, so the rates that follow it stay aligned.
+_ALIGNMENT = 8
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+class CachedRates(NamedTuple):
+    """What a cache file holds."""
+
+    usd_rates: Dict[str, float]
+    last_update: datetime
+    # The revision the writing process had published. Informational only: revisions
+    # order the snapshots of one process and mean nothing to the next (see
+    # ExchangeRatesManager._rates_revision). 0 for a JSON cache.
+    revision: int
+    # Whether the file was one of the JSON formats and wants rewriting.
+    legacy: bool
+
+
+def encode_rates_cache(usd_rates: Mapping[str, float], last_update: datetime, revision: int) -> bytes:
+    """The binary cache file for `usd_rates`."""
+    if any(not currency or '\0' in currency for currency in usd_rates):
+        raise ValueError(f"Cannot store the currency codes {list(usd_rates)!r}")
+    codes = ''.join(currency + '\0' for currency in usd_rates).encode('ascii')
+    codes += b'\0' * (-len(codes) % _ALIGNMENT)
+    body = codes + struct.pack(f'<{len(usd_rates)}d', *usd_rates.values())
+    stamp = (last_update - _EPOCH) // _MICROSECOND
+    return _HEADER.pack(MAGIC, FORMAT_VERSION, 0, stamp, revision, len(usd_rates), len(codes), zlib.crc32(body), 0) + body
+
+
+def decode_rates_cache(buffer) -> CachedRates:
+    """The rates in a binary cache file, from any buffer holding it (an mmap, bytes)."""
+    cached, end = decode_rates_record(buffer, 0)
+    if end != len(buffer):
+        raise ValueError(f"the rates cache holds {len(buffer)} bytes, its header describes {end}")
+    return cached
+
+
+def decode_rates_record(buffer, offset: int) -> Tuple[CachedRates, int]:
+    """The snapshot that starts at `offset` of `buffer`, and the offset right after it.
+
+    A snapshot describes its own length, so files of several of them back to back —
+    the rates history — are read with this one after the other.
+    """
+    if len(buffer) - offset < _HEADER.size:
+        raise ValueError("the rates cache is shorter than its header")
+    magic, version, _, stamp, revision, count, codes_size, checksum, _ = _HEADER.unpack_from(buffer, offset)
+    if magic != MAGIC:
+        raise ValueError("not a rates cache file")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"rates cache format version {version}, this build reads {FORMAT_VERSION}")
+    codes_offset = offset + _HEADER.size
+    rates_offset = codes_offset + codes_size
+    end = rates_offset + count * 8
+    if len(buffer) < end:
+        raise ValueError(f"the rates cache holds {len(buffer) - offset} bytes, {count} currencies need {end - offset}")
+    if zlib.crc32(buffer[codes_offset:end]) != checksum:
+        raise ValueError("the rates cache checksum does not match")
+    codes = buffer[codes_offset:rates_offset].decode('ascii').split('\0')[:count]
+    if len(codes) != count:
+        raise ValueError(f"the rates cache names {len(codes)} currencies, its header says {count}")
+    rates = struct.unpack_from(f'<{count}d', buffer, rates_offset)
+    return CachedRates(dict(zip(codes, rates)), _EPOCH + stamp * _MICROSECOND, revision, legacy=False), end
+
+
+def read_rates_cache(path: Path) -> CachedRates:
+    """The rates in the cache file at `path`, binary or one of the JSON formats.
+
+    The binary file is mapped rather than read. The JSON formats are told apart from it
+    by its magic, so a cache left at a `.json` path by an older release is read
+    all the same.
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            f.seek(0)
+            return decode_legacy_json_cache(f.read())
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return decode_rates_cache(mapped)
+
+
+def decode_legacy_json_cache(content: bytes) -> CachedRates:
+    """The rates in a JSON cache of an earlier release, for a one-time conversion."""
+    data = json.loads(content)
+    if 'usd_rates' in data:
+        usd_rates = {currency: float(rate) for currency, rate in data['usd_rates'].items()}
+    else:
+        usd_rates = _usd_rates_from_cross_rates(data['rates'])
+    last_update = datetime.fromisoformat(data['last_update'])
+    if last_update.tzinfo is not None:
+        # Everything else works in naive local time (datetime.now()), and mixing the
+        # two raises TypeError on the first subtraction — which happens in
+        # _initialize_rates, i.e. inside __init__, i.e. at import of src.bot.
+        # fromisoformat accepts an offset happily, so the cache only has to come from
+        # a build whose _save_cache used an aware `now` for the bot to die on import
+        # with `restart: always` looping it forever. astimezone() keeps the instant
+        # and only drops the representation.
+        last_update = last_update.astimezone().replace(tzinfo=None)
+    return CachedRates(usd_rates, last_update, 0, legacy=True)
+
+
+def _usd_rates_from_cross_rates(rates: Dict) -> Dict[str, float]:
+    """The USD vector behind a cache file of the oldest format, a full table of cross rates.
+
+    The old table kept rates[base][target] for every pair, so its USD row is the vector
+    itself; a table without one (never written by this code, but possible by hand) is
+    read through any row that has USD in it.
+    """
+    if BASE_CURRENCY in rates:
+        vector = {currency: float(rate) for currency, rate in rates[BASE_CURRENCY].items()}
+    else:
+        base, row = next((base, row) for base, row in rates.items() if BASE_CURRENCY in row)
+        in_usd = float(row[BASE_CURRENCY])
+        vector = {currency: float(rate) / in_usd for currency, rate in row.items()}
+        vector[base] = 1.0 / in_usd
+    vector[BASE_CURRENCY] = 1.0
+    return vector
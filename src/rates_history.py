@@ -0,0 +1,191 @@
+"""Every published set of rates, kept on disk and answerable by time.
+
+An update replaces the snapshot in memory and the rates cache on disk, so "how much
+was this last month" could only be answered by paying the API for historical rates.
+RatesHistory appends each snapshot to a file instead: the snapshots of
+src/rates_cache.py back to back, each one a self-checking record of ~2 KB. At start
+the whole file is read into two lists ordered by time, and get_rate_at() is a binary
+search over them — no request, no file access.
+
+Retention: every snapshot of the last `intraday_days` days is kept; before that, the
+last snapshot of each calendar day, forever. Dropping the rest rewrites the file,
+atomically and at most about once a day; an append never does.
+
+A process killed in the middle of an append leaves a torn record at the end of the
+file. Reading stops at the first record that does not check out, and the file is cut
+back to the records before it, so the next append starts on a clean boundary.
+"""
+
+import bisect
+import logging
+import mmap
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from types import MappingProxyType
+from typing import List, Mapping, NamedTuple, Optional, Tuple
+
+from src.rates_cache import decode_rates_record, encode_rates_cache
+
+logger = logging.getLogger(os.path.splitext(os.path.basename(__file__))[0])
+
+
+class _HistoryIndex(NamedTuple):
+    """The history in memory. Replaced as a whole, never changed: readers take no lock."""
+
+    # Timestamps in increasing order, and the USD vector of each.
+    timestamps: Tuple[datetime, ...]
+    usd_rates: Tuple[Mapping[str, float], ...]
+
+
+def retained(timestamps: List[datetime], now: datetime, intraday_days: int) -> List[bool]:
+    """Which of `timestamps` (increasing) the retention rules keep as of `now`.
+
+    Everything from the last `intraday_days` days, and before that the last timestamp
+    of each calendar day.
+    """
+    cutoff = now - timedelta(days=intraday_days)
+    return [
+        timestamp >= cutoff or index + 1 == len(timestamps) or timestamps[index + 1].date() != timestamp.date()
+        for index, timestamp in enumerate(timestamps)
+    ]
+
+
+class RatesHistory:
+    def __init__(self, path: str, intraday_days: int, repair: bool = True):
+        """`repair=False` for a process that only reads the file another one writes
+        (see reload())."""
+        self._path = Path(path)
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._intraday_days = intraday_days
+        # Held by writers: appends and compaction. get_rate_at() never takes it.
+        self._lock = threading.Lock()
+        self._index = _HistoryIndex((), ())
+        self._load(repair)
+
+    def _load(self, repair: bool = True) -> None:
+        """Read the file into the index, cutting a torn tail off it when `repair`."""
+        if not self._path.exists() or self._path.stat().st_size == 0:
+            return
+        timestamps: List[datetime] = []
+        usd_rates: List[Mapping[str, float]] = []
+        with open(self._path, 'r+b' if repair else 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                offset = 0
+                while offset < len(mapped):
+                    try:
+                        record, end = decode_rates_record(mapped, offset)
+                    except ValueError as e:
+                        if repair:
+                            logger.warning(f"Rates history is damaged at byte {offset} of {len(mapped)} ({e}); "
+                                           "dropping the rest of the file")
+                        break
+                    # Appends are ordered, but a clock that stepped backwards could still
+                    # have written one out of order: keep the lists sorted regardless.
+                    position = bisect.bisect_right(timestamps, record.last_update)
+                    timestamps.insert(position, record.last_update)
+                    usd_rates.insert(position, MappingProxyType(record.usd_rates))
+                    offset = end
+                size = len(mapped)
+            if repair and offset < size:
+                f.truncate(offset)
+        self._index = _HistoryIndex(tuple(timestamps), tuple(usd_rates))
+        logger.info(f"Loaded {len(timestamps)} historical rate snapshots")
+
+    def reload(self, repair: bool = False) -> None:
+        """Read the file again, for a process that follows another one writing it.
+
+        Nothing is cut off unless asked: a record that does not check out yet may be
+        the writer's append in progress, and the next reload reads it whole. A process
+        taking over the writing repairs, since the writer it replaces is gone.
+        """
+        with self._lock:
+            self._load(repair)
+
+    def __len__(self) -> int:
+        return len(self._index.timestamps)
+
+    def span(self) -> Optional[Tuple[datetime, datetime]]:
+        """The first and the last timestamp kept, or None while there is nothing."""
+        timestamps = self._index.timestamps
+        return (timestamps[0], timestamps[-1]) if timestamps else None
+
+    def append(self, usd_rates: Mapping[str, float], timestamp: datetime, now: Optional[datetime] = None) -> bool:
+        """Add the snapshot of `timestamp`. Returns False when the history already has
+        that moment or a later one — a restart publishing the cached snapshot again.
+
+        Appending is one write to the end of the file; when the retention rules have
+        something to drop by now, the file is rewritten afterwards.
+        """
+        with self._lock:
+            index = self._index
+            if index.timestamps and timestamp <= index.timestamps[-1]:
+                return False
+            record = encode_rates_cache(usd_rates, timestamp, 0)
+            with open(self._path, 'ab') as f:
+                f.write(record)
+                f.flush()
+                os.fsync(f.fileno())
+            self._index = _HistoryIndex(
+                index.timestamps + (timestamp,), index.usd_rates + (MappingProxyType(dict(usd_rates)),)
+            )
+            self._compact(datetime.now() if now is None else now)
+            return True
+
+    def compact(self, now: Optional[datetime] = None) -> int:
+        """Apply the retention rules as of `now`; returns how many snapshots were dropped."""
+        with self._lock:
+            return self._compact(datetime.now() if now is None else now)
+
+    def _compact(self, now: datetime) -> int:
+        index = self._index
+        keep = retained(list(index.timestamps), now, self._intraday_days)
+        dropped = keep.count(False)
+        if not dropped:
+            return 0
+        kept = _HistoryIndex(
+            tuple(timestamp for timestamp, wanted in zip(index.timestamps, keep) if wanted),
+            tuple(rates for rates, wanted in zip(index.usd_rates, keep) if wanted),
+        )
+        # Same temp-file-and-replace as the rates cache: a kill halfway through leaves
+        # the old file whole.
+        tmp_path = self._path.with_name(f"{self._path.name}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp")
+        try:
+            with open(tmp_path, 'wb') as f:
+                for timestamp, rates in zip(kept.timestamps, kept.usd_rates):
+                    f.write(encode_rates_cache(rates, timestamp, 0))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._path)
+        except OSError as e:
+            logger.error(f"Failed to compact the rates history: {e}")
+            tmp_path.unlink(missing_ok=True)
+            return 0
+        self._index = kept
+        logger.info(f"Dropped {dropped} intra-day rate snapshots older than {self._intraday_days} days")
+        return dropped
+
+    def rates_at(self, when: datetime) -> Optional[Tuple[datetime, Mapping[str, float]]]:
+        """The snapshot that was being served at `when` — the last one published at or
+        before it — with its timestamp; None before the first one."""
+        index = self._index
+        position = bisect.bisect_right(index.timestamps, when) - 1
+        if position < 0:
+            return None
+        return index.timestamps[position], index.usd_rates[position]
+
+    def get_rate_at(self, from_currency: str, to_currency: str, when: datetime) -> Optional[float]:
+        """The rate for the pair as it was at `when`, derived like RatesSnapshot.get_rate().
+
+        None before the first snapshot, and for a currency that snapshot did not have.
+        """
+        found = self.rates_at(when)
+        if found is None:
+            return None
+        _timestamp, usd_rates = found
+        try:
+            return usd_rates[to_currency] * (1.0 / usd_rates[from_currency])
+        except KeyError:
+            return None
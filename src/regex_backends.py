@@ -0,0 +1,552 @@
+"""Regex backends the pattern table of CurrencyParser can run on.
+
+'re'   the standard library. A backtracking engine: fast on ordinary messages, but its
+       worst case depends on how every pattern is written — which is why the amount
+       regex is full of possessive quantifiers, bounded repeats and lookarounds, and
+       why every new alias is a potential ReDoS on the path that runs for every
+       message in every chat.
+'re2'  google-re2, an automaton. Every pattern runs in time linear in the text, no
+       matter how it is written, so the worst case is a property of the backend
+       rather than of the patterns.
+
+RE2 has no lookarounds, possessive quantifiers or backreferences, and its \\b, \\w,
+\\d, \\s and case folding are ASCII or differ from Python's. So a pattern is never
+handed to it as written: translate_for_re2() rewrites the parsed pattern into an
+exact equivalent — every character class spelled out from Python's own definition,
+IGNORECASE folded the way `re` folds it, and the lookaheads and \\b at the end of a
+pattern turned into a consuming guard behind an empty marker group that tells where
+the match really ends. Anything else has no equivalent, and re2_incompatibility()
+says what; CurrencyParser.regex_backend_report() runs that over the whole table.
+
+    python -m src.regex_backends
+
+prints the rows of the current table that the re2 backend could not run.
+"""
+
+import bisect
+import functools
+import itertools
+import operator
+import re
+import sys
+import threading
+# Private and missing from typeshed; tests/parser/test_re_internals.py guards them.
+from re import _casefix, _compiler as _sre_compiler, _constants as _sre_constants, _parser as _sre_parser  # pyright: ignore[reportAttributeAccessIssue]
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+import _sre
+
+BACKEND_RE = 're'
+BACKEND_RE2 = 're2'
+BACKENDS = (BACKEND_RE, BACKEND_RE2)
+
+# A set of code points as sorted, disjoint, inclusive (low, high) ranges. Surrogates
+# are never members: they cannot be encoded as UTF-8, so texts reach RE2 with every
+# lone surrogate replaced by U+FFFD (a character no pattern of the table names).
+_Ranges = Tuple[Tuple[int, int], ...]
+_SURROGATES: _Ranges = ((0xD800, 0xDFFF),)
+_EVERYTHING: _Ranges = ((0, 0xD7FF), (0xE000, sys.maxunicode))
+_LONE_SURROGATE = re.compile('[\ud800-\udfff]')
+
+# Zero-width items translate_for_re2() can turn into a guard when they end a pattern.
+_TRAILING_OPS = (_sre_constants.AT, _sre_constants.ASSERT, _sre_constants.ASSERT_NOT)
+_BOUNDARIES = (_sre_constants.AT_BOUNDARY, _sre_constants.AT_NON_BOUNDARY)
+_LEAF_OPS = (_sre_constants.LITERAL, _sre_constants.NOT_LITERAL, _sre_constants.IN, _sre_constants.ANY)
+
+# RE2 refuses repeat counts above this.
+_RE2_MAX_REPEAT = 1000
+
+
+class _Inexpressible(Exception):
+    """A construct translate_for_re2() has no exact RE2 equivalent for."""
+
+
+def _ranges(codes, ascending: bool = False) -> _Ranges:
+    """Ranges of an iterable of code points; `ascending` when it is sorted and unique."""
+    merged: List[List[int]] = []
+    for code in (codes if ascending else sorted(set(codes))):
+        if merged and code == merged[-1][1] + 1:
+            merged[-1][1] = code
+        else:
+            merged.append([code, code])
+    return _subtract(tuple((low, high) for low, high in merged), _SURROGATES)
+
+
+@functools.lru_cache(maxsize=None)
+def _union(a: _Ranges, b: _Ranges) -> _Ranges:
+    merged: List[List[int]] = []
+    for low, high in sorted(a + b):
+        if merged and low <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], high)
+        else:
+            merged.append([low, high])
+    return tuple((low, high) for low, high in merged)
+
+
+@functools.lru_cache(maxsize=None)
+def _complement(a: _Ranges) -> _Ranges:
+    gaps, next_low = [], 0
+    for low, high in a:
+        if low > next_low:
+            gaps.append((next_low, low - 1))
+        next_low = high + 1
+    if next_low <= sys.maxunicode:
+        gaps.append((next_low, sys.maxunicode))
+    return tuple(gaps)
+
+
+@functools.lru_cache(maxsize=None)
+def _subtract(a: _Ranges, b: _Ranges) -> _Ranges:
+    return _intersect(a, _complement(b))
+
+
+@functools.lru_cache(maxsize=None)
+def _intersect(a: _Ranges, b: _Ranges) -> _Ranges:
+    return _complement(_union(_complement(a), _complement(b)))
+
+
+@functools.lru_cache(maxsize=None)
+def _class(ranges: _Ranges) -> str:
+    """An RE2 character class for a set, negated when that is the shorter spelling."""
+    if not ranges:
+        raise _Inexpressible("a character class that matches nothing")
+    negated = _subtract(_EVERYTHING, ranges)
+    if not negated:
+        return r'[\x{0}-\x{10FFFF}]'
+    spelled, prefix = (negated, '^') if len(negated) < len(ranges) else (ranges, '')
+    items = ''.join(
+        rf'\x{{{low:X}}}' if low == high else rf'\x{{{low:X}}}-\x{{{high:X}}}'
+        for low, high in spelled
+    )
+    return f'[{prefix}{items}]'
+
+
+def _listed(items) -> Optional[_Ranges]:
+    """The code points a class of literals and ranges names; None when it uses a category."""
+    listed: List[Tuple[int, int]] = []
+    negated = False
+    for op, value in items:
+        if op is _sre_constants.NEGATE:
+            negated = True
+        elif op is _sre_constants.LITERAL:
+            listed.append((value, value))
+        elif op is _sre_constants.RANGE:
+            listed.append(value)
+        else:
+            return None
+    ranges = _subtract(_union(tuple(listed), ()), _SURROGATES)
+    return _subtract(_EVERYTHING, ranges) if negated else ranges
+
+
+def _all_characters(chunk: int = 1 << 16) -> Iterator[str]:
+    """Every character there is, a chunk at a time: kept whole, it would be over a
+    million characters held for the life of the process."""
+    for low in range(0, sys.maxunicode + 1, chunk):
+        yield ''.join(map(chr, range(low, min(low + chunk, sys.maxunicode + 1))))
+
+
+@functools.lru_cache(maxsize=None)
+def _case_folds() -> Dict[int, List[int]]:
+    """The code points `re` lowercases to something else, grouped by that lowercase form.
+
+    A pass over every code point, so only made for a literal under IGNORECASE — which
+    the folded rows of the parser's table never have.
+    """
+    codes = range(sys.maxunicode + 1)
+    lowers = list(map(_sre.unicode_tolower, codes))
+    folds: Dict[int, List[int]] = {}
+    for code in itertools.compress(codes, map(operator.ne, lowers, codes)):
+        folds.setdefault(lowers[code], []).append(code)
+    return folds
+
+
+@functools.lru_cache(maxsize=None)
+def _matched_by(op, value, flags: int) -> _Ranges:
+    """The code points a single-character item matches, as `re` itself decides it.
+
+    Literals under IGNORECASE come from the case folds (the same lowercase form plus
+    the extra case pairs `re` knows about, as the tokens engine of the parser indexes
+    them), and case-sensitive literals and classes that only list characters are read
+    off the item. Everything else — categories, IGNORECASE classes — is asked of `re`
+    directly, by running the item alone over every character there is.
+    """
+    if op is _sre_constants.LITERAL and flags & re.IGNORECASE:
+        lower = _sre.unicode_tolower(value)
+        keys = {lower} | {_sre.unicode_tolower(extra) for extra in _casefix._EXTRA_CASES.get(lower, ())}
+        own = [key for key in keys if _sre.unicode_tolower(key) == key]
+        return _ranges(itertools.chain(own, *(_case_folds().get(key, ()) for key in keys)))
+    if op is _sre_constants.LITERAL:
+        return _ranges([value])
+    if op is _sre_constants.IN and not flags & re.IGNORECASE:
+        listed = _listed(value)
+        if listed is not None:
+            return listed
+    state = _sre_parser.State()
+    state.flags = flags
+    compiled = _sre_compiler.compile(_sre_parser.SubPattern(state, [(op, value)]), flags)
+    found = itertools.chain.from_iterable(map(compiled.findall, _all_characters()))
+    return _ranges(map(ord, found), ascending=True)
+
+
+def _leaf(item, flags: int) -> _Ranges:
+    op, value = item
+    if op is _sre_constants.IN:
+        # Lists are not hashable; the tuple form describes the same class.
+        value = tuple(value)
+    return _matched_by(op, value, flags)
+
+
+def _word(flags: int) -> _Ranges:
+    return _matched_by(_sre_constants.IN, ((_sre_constants.CATEGORY, _sre_constants.CATEGORY_WORD),), flags)
+
+
+def _sub_flags(flags: int, add_flags: int, del_flags: int) -> int:
+    return (flags | add_flags) & ~del_flags
+
+
+def _describe(op, value: Any = None) -> str:
+    if op is _sre_constants.ASSERT_NOT or op is _sre_constants.ASSERT:
+        kind = 'lookbehind' if value[0] < 0 else 'lookahead'
+        return f"a {kind} that does not end the pattern" if kind == 'lookahead' else f"a {kind}"
+    if op is _sre_constants.AT:
+        return f"{value} that does not end the pattern"
+    if op is _sre_constants.POSSESSIVE_REPEAT:
+        return "a possessive quantifier"
+    if op is _sre_constants.ATOMIC_GROUP:
+        return "an atomic group"
+    if op in (_sre_constants.GROUPREF, _sre_constants.GROUPREF_EXISTS):
+        return "a backreference"
+    return str(op)
+
+
+def _translate(items, flags: int, names: Dict[int, str]) -> str:
+    """RE2 source for a parsed sequence that contains no assertions."""
+    out = []
+    for op, value in items:
+        if op in _LEAF_OPS:
+            out.append(_class(_leaf((op, value), flags)))
+        elif op is _sre_constants.SUBPATTERN:
+            group, add_flags, del_flags, sub = value
+            body = _translate(sub.data, _sub_flags(flags, add_flags, del_flags), names)
+            name = names.get(group)
+            out.append(f'(?P<{name}>{body})' if name else f'(?:{body})')
+        elif op is _sre_constants.BRANCH:
+            out.append('(?:' + '|'.join(_translate(branch.data, flags, names) for branch in value[1]) + ')')
+        elif op in (_sre_constants.MAX_REPEAT, _sre_constants.MIN_REPEAT):
+            low, high, sub = value
+            if low > _RE2_MAX_REPEAT or (high is not _sre_constants.MAXREPEAT and high > _RE2_MAX_REPEAT):
+                raise _Inexpressible(f"a repeat count above {_RE2_MAX_REPEAT}")
+            if high is _sre_constants.MAXREPEAT:
+                quantifier = f'{{{low},}}'
+            elif low == high:
+                quantifier = f'{{{low}}}'
+            else:
+                quantifier = f'{{{low},{high}}}'
+            lazy = '?' if op is _sre_constants.MIN_REPEAT else ''
+            out.append(f'(?:{_translate(sub.data, flags, names)}){quantifier}{lazy}')
+        elif op is _sre_constants.AT and value is _sre_constants.AT_BEGINNING_STRING:
+            out.append(r'\A')
+        elif op is _sre_constants.AT and value is _sre_constants.AT_END_STRING:
+            out.append(r'\z')
+        else:
+            raise _Inexpressible(_describe(op, value))
+    return ''.join(out)
+
+
+def _last_characters(items, flags: int) -> Tuple[_Ranges, bool]:
+    """Every character a parsed sequence can end with, and whether it can match empty."""
+    found: _Ranges = ()
+    for op, value in reversed(items):
+        if op in _TRAILING_OPS:
+            continue
+        if op in _LEAF_OPS:
+            return _union(found, _leaf((op, value), flags)), False
+        if op is _sre_constants.SUBPATTERN:
+            _, add_flags, del_flags, sub = value
+            last, empty = _last_characters(sub.data, _sub_flags(flags, add_flags, del_flags))
+        elif op is _sre_constants.BRANCH:
+            last, empty = (), False
+            for branch in value[1]:
+                branch_last, branch_empty = _last_characters(branch.data, flags)
+                last, empty = _union(last, branch_last), empty or branch_empty
+        elif op in (_sre_constants.MAX_REPEAT, _sre_constants.MIN_REPEAT):
+            last, empty = _last_characters(value[2].data, flags)
+            empty = empty or value[0] == 0
+        else:
+            raise _Inexpressible(_describe(op, value))
+        found = _union(found, last)
+        if not empty:
+            return found, False
+    return found, True
+
+
+def _preceding(items, flags: int, before: Optional[_Ranges]) -> Optional[_Ranges]:
+    """The characters a match can have consumed last once it is past `items`."""
+    last, empty = _last_characters(items, flags)
+    if not empty:
+        return last
+    return None if before is None else _union(last, before)
+
+
+def _sequences(items, flags: int) -> List[Tuple[_Ranges, ...]]:
+    """A lookahead's content as the fixed character sequences it matches."""
+    if len(items) == 1 and items[0][0] is _sre_constants.BRANCH:
+        return [sequence for branch in items[0][1][1] for sequence in _sequences(branch.data, flags)]
+    if not all(op in _LEAF_OPS for op, _ in items):
+        raise _Inexpressible("a lookahead that is not a fixed sequence of characters")
+    return [tuple(_leaf(item, flags) for item in items)]
+
+
+def _avoid(sequences: List[Tuple[_Ranges, ...]], domain: _Ranges, allow_end: bool) -> str:
+    """A consuming regex for "the text here does not start with any of `sequences`".
+
+    It consumes either nothing at the end of the text or the characters that decide
+    it; its alternatives are mutually exclusive, so their order does not matter.
+    """
+    alternatives = [r'\z'] if allow_end else []
+    regions = [(domain, ())]
+    for index, sequence in enumerate(sequences):
+        split = []
+        for region, members in regions:
+            inside, outside = _intersect(region, sequence[0]), _subtract(region, sequence[0])
+            if inside:
+                split.append((inside, members + (index,)))
+            if outside:
+                split.append((outside, members))
+        regions = split
+    for region, members in regions:
+        tails = [sequences[index][1:] for index in members]
+        if any(not tail for tail in tails):
+            continue
+        if not tails:
+            alternatives.append(_class(region))
+        else:
+            alternatives.append(f'{_class(region)}(?:{_avoid(tails, _EVERYTHING, True)})')
+    if not alternatives:
+        raise _Inexpressible("a lookahead that can never pass")
+    return '|'.join(alternatives)
+
+
+def _guard(trailing, last: _Ranges) -> str:
+    """The consuming equivalent of the zero-width items that end a pattern."""
+    avoided: List[Tuple[_Ranges, ...]] = []
+    domain, allow_end = _EVERYTHING, True
+    for (op, value), flags in trailing:
+        if op is _sre_constants.AT and value in _BOUNDARIES:
+            # Whether a boundary follows depends on the character before it, which
+            # the match itself consumed: \b after a word character is "no word
+            # character next", after anything else it is "a word character next".
+            word = _word(flags)
+            if not _subtract(last, word):
+                ends_in_word = True
+            elif not _intersect(last, word):
+                ends_in_word = False
+            else:
+                raise _Inexpressible(r"\b after something that may or may not end in a word character")
+            if ends_in_word == (value is _sre_constants.AT_BOUNDARY):
+                avoided.append((word,))
+            else:
+                domain, allow_end = _intersect(domain, word), False
+        elif op is _sre_constants.ASSERT_NOT and value[0] > 0:
+            avoided.extend(_sequences(value[1].data, flags))
+        elif op is _sre_constants.ASSERT and value[0] > 0:
+            sequences = _sequences(value[1].data, flags)
+            if len(sequences) != 1 or len(sequences[0]) != 1:
+                raise _Inexpressible("a positive lookahead longer than one character")
+            domain, allow_end = _intersect(domain, sequences[0][0]), False
+        else:
+            raise _Inexpressible(_describe(op, value))
+    return f'(?:{_avoid(avoided, domain, allow_end)})'
+
+
+def _translate_tail(items, flags: int, names: Dict[int, str], inherited, before: Optional[_Ranges],
+                    markers: List[str]) -> str:
+    """RE2 source for a parsed sequence that ends the pattern.
+
+    `inherited` are the zero-width items that followed the sequence in an enclosing
+    one, each with its own flags. They are pushed down into a group that ends the
+    sequence and into its alternatives — (A|B)\\b is A\\b|B\\b, priorities included —
+    so that each alternative knows what its last character can be, and meets them
+    together with the assertions it ends in itself. `before` are the
+    characters the match can have consumed right before the sequence; None at the
+    start of the pattern, where that character is not part of the match.
+    """
+    body = list(items)
+    own = []
+    while body and body[-1][0] in _TRAILING_OPS:
+        own.insert(0, (body.pop(), flags))
+    trailing = own + list(inherited)
+
+    # A group that ends the sequence is followed by whatever follows the sequence, and
+    # its alternatives may end in assertions of their own even when nothing does.
+    if body and (body[-1][0] is _sre_constants.BRANCH or
+                 body[-1][0] is _sre_constants.SUBPATTERN and body[-1][1][0] not in names):
+        op, value = body[-1]
+        head = _translate(body[:-1], flags, names)
+        head_before = _preceding(body[:-1], flags, before)
+        if op is _sre_constants.BRANCH:
+            tails = [
+                _translate_tail(branch.data, flags, names, trailing, head_before, markers)
+                for branch in value[1]
+            ]
+            return f"{head}(?:{'|'.join(tails)})"
+        _, add_flags, del_flags, sub = value
+        tail = _translate_tail(sub.data, _sub_flags(flags, add_flags, del_flags), names, trailing, head_before, markers)
+        return f'{head}(?:{tail})'
+    if not trailing:
+        return _translate(body, flags, names)
+
+    last = _preceding(body, flags, before)
+    if last is None:
+        raise _Inexpressible("a trailing assertion after something that can match empty")
+    marker = f'_end{len(markers)}'
+    markers.append(marker)
+    return f'{_translate(body, flags, names)}(?P<{marker}>){_guard(trailing, last)}'
+
+
+def translate_for_re2(pattern: str, flags: int = re.IGNORECASE) -> Tuple[str, List[str]]:
+    """RE2 source equivalent to a `re` pattern, and the names of its end markers.
+
+    Where one of the marker groups took part in a match, the match of the original
+    pattern ends there; where none did, it ends where the RE2 match ends. Named
+    groups keep their names. Raises ValueError naming the construct that has no
+    equivalent.
+    """
+    parsed = _sre_parser.parse(pattern, flags)
+    names = {index: name for name, index in parsed.state.groupdict.items()}
+    markers: List[str] = []
+    try:
+        return _translate_tail(parsed.data, parsed.state.flags, names, [], None, markers), markers
+    except _Inexpressible as e:
+        raise ValueError(str(e)) from None
+
+
+def re2_incompatibility(pattern: str, flags: int = re.IGNORECASE) -> Optional[str]:
+    """Why the re2 backend cannot run a pattern, or None when it can.
+
+    Needs google-re2 only to confirm that RE2 accepts the translation; without it the
+    translation alone is checked.
+    """
+    try:
+        source, _ = translate_for_re2(pattern, flags)
+    except ValueError as e:
+        return str(e)
+    try:
+        import re2
+    except ImportError:
+        return None
+    try:
+        _compile_re2(source)
+    except re2.error as e:
+        return f"RE2 refused the translation: {e}"
+    return None
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile_re2(source: str):
+    """RE2 compiled regex of a translation, shared by the check and the backend."""
+    import re2
+    options = re2.Options()
+    # Spelled-out Unicode classes make big automata; RE2's default budget is 8 MiB.
+    options.max_mem = 64 << 20
+    return re2.compile(source, options)
+
+
+# The UTF-8 form of the text the last scan in this thread ran over, shared by every
+# row of the table: (text, encoded, byte offset of every character or None for ASCII).
+_encoded = threading.local()
+
+
+def _encode(text: str) -> Tuple[bytes, Optional[List[int]]]:
+    last = getattr(_encoded, 'last', None)
+    if last is not None and last[0] is text:
+        return last[1], last[2]
+    clean = _LONE_SURROGATE.sub('\ufffd', text)
+    data = clean.encode('utf-8')
+    offsets = None
+    if len(data) != len(text):
+        offsets = [0, *itertools.accumulate(len(char.encode('utf-8')) for char in clean)]
+    _encoded.last = (text, data, offsets)
+    return data, offsets
+
+
+class Re2Match:
+    """The part of re.Match the scan engine reads: start(), end() and group()."""
+
+    __slots__ = ('_text', '_match', '_groups', '_offsets', '_start', '_end')
+
+    def __init__(self, text: str, match, groups: Dict[str, int], offsets: Optional[List[int]], start: int, end: int):
+        self._text = text
+        self._match = match
+        self._groups = groups
+        self._offsets = offsets
+        self._start = start
+        self._end = end
+
+    def start(self) -> int:
+        return self._start
+
+    def end(self) -> int:
+        return self._end
+
+    def group(self, name: Union[str, int] = 0) -> Optional[str]:
+        if isinstance(name, int):
+            if name:
+                raise IndexError("no such group")
+            return self._text[self._start:self._end]
+        low, high = self._match.span(self._groups[name])
+        if low < 0:
+            return None
+        if self._offsets is None:
+            return self._text[low:high]
+        return self._text[bisect.bisect_left(self._offsets, low):bisect.bisect_left(self._offsets, high)]
+
+
+class Re2Pattern:
+    """A `re` pattern translated to and compiled by RE2, with the finditer() of re.Pattern."""
+
+    def __init__(self, pattern: str, flags: int = re.IGNORECASE,
+                 translation: Optional[Tuple[str, List[str]]] = None):
+        """`translation` is translate_for_re2() of the pattern when it is known already."""
+        self.pattern = pattern
+        source, markers = translation if translation is not None else translate_for_re2(pattern, flags)
+        try:
+            self._regex = _compile_re2(source)
+        except ImportError:
+            raise ValueError("The re2 regex backend needs the google-re2 package") from None
+        # The wrapper's match objects take group numbers only.
+        self._groups = dict(self._regex.groupindex)
+        self._markers = [self._groups[marker] for marker in markers]
+
+    def finditer(self, text: str, pos: int = 0) -> Iterator[Re2Match]:
+        data, offsets = _encode(text)
+        byte_pos = pos if offsets is None else offsets[pos]
+        search = self._regex.search
+        while True:
+            match = search(data, byte_pos)
+            if match is None:
+                return
+            end = match.end()
+            for marker in self._markers:
+                marker_end = match.end(marker)
+                if marker_end >= 0:
+                    end = marker_end
+                    break
+            if offsets is None:
+                start, char_end = match.start(), end
+            else:
+                start, char_end = bisect.bisect_left(offsets, match.start()), bisect.bisect_left(offsets, end)
+            yield Re2Match(text, match, self._groups, offsets, start, char_end)
+            if char_end == start:
+                # An empty match: step over one character, as re.finditer does.
+                char_end += 1
+                if char_end > len(text):
+                    return
+            byte_pos = char_end if offsets is None else offsets[char_end]
+
+
+if __name__ == '__main__':
+    from src.currency_parser import CurrencyParser
+    report = CurrencyParser().regex_backend_report(BACKEND_RE2)
+    for entry in report:
+        print(f"row {entry['row']} {entry['currency']}: {entry['reason']}\n    {entry['pattern']}")
+    print(f"{len(report)} rows the {BACKEND_RE2} backend cannot run")
@@ -1,9 +1,10 @@
 from typing import Any
 
-from pydantic import field_validator
+from pydantic import field_validator, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 from src.config_errors import load_settings_or_exit
+from src.rate_providers import build_providers
 
 
 class Settings(BaseSettings):
@@ -24,10 +25,61 @@ class Settings(BaseSettings):
     # finally never runs, so the sqlite stores are never closed properly.
     watch_code_changes: bool = False
 
+    # Per-pattern timing and hit counters in the currency parser, shown by /stats.
+    # Off by default: it takes two timestamps around every pattern it runs.
+    parser_profiling: bool = False
+
+    # LRU cache of parse results, keyed by a digest of the text: forwarded posts and
+    # retyped inline queries are parsed once. 0 in either budget turns it off.
+    parse_cache_entries: int = 2048
+    parse_cache_bytes: int = 4 * 1024 * 1024
+
+    # Incremental parsing of inline queries: the last parse per user is kept this many
+    # seconds, for at most this many users, and the next keystroke reuses the matches
+    # before the edit. 0 entries turns it off.
+    inline_state_entries: int = 1024
+    inline_state_ttl: int = 120
+
+    # Parse in this many worker processes instead of in the bot process, so a slow
+    # scan never holds the GIL the polling thread needs. 0 parses in-process. A parse
+    # that takes longer than parse_deadline seconds is answered with no matches.
+    parse_workers: int = 0
+    parse_deadline: float = 2.0
+
+    # Group chats parsed with only the currencies they have been seen to use, for at
+    # most this many chats; every chat_profile_refresh-th message of a chat, and any
+    # message where a left-out currency might be, is parsed in full. 0 turns it off.
+    chat_profile_entries: int = 0
+    chat_profile_refresh: int = 50
+
+    # Regex engine the parser's patterns run on: "re" (the standard library) or "re2"
+    # (google-re2, linear time in the text whatever the patterns, see
+    # src/regex_backends.py). re2 runs the plain per-pattern scan.
+    parser_regex_backend: str = "re"
+
+    # Where the rates come from, comma-separated, in order of preference until their
+    # statistics say otherwise: "apilayer" (needs api_key), an http(s) URL of a JSON
+    # source with `rates` against `base`, or file:<path> of such JSON. The next one
+    # is asked when the one before fails or has not answered in
+    # rate_provider_hedge_delay seconds; 0 asks them all at once (see
+    # src/rate_providers.py).
+    rate_providers: str = "apilayer"
+    rate_provider_hedge_delay: float = 2.0
+
+    # Several containers sharing data/: only the one holding a lease on a file next to
+    # the rates cache fetches; the others serve the cache it writes, reloaded when the
+    # file changes (see src/leader_lease.py). One host only — flock() does not reach
+    # across a network filesystem.
+    rates_leader_election: bool = False
+
     # All mutable state lives under data/ (mounted as a docker volume).
     # The two *_db_path files are sqlite databases; on first start each one
     # imports the same-named .json left behind by the pickleDB era.
-    exchange_rates_cache_path: str = "data/exchange_rates_cache.json"
+    exchange_rates_cache_path: str = "data/exchange_rates_cache.bin"
+    # Every rate snapshot ever published, for point-in-time lookups: all of them for
+    # rates_history_intraday_days days, then the last one of each day, forever.
+    rates_history_path: str = "data/rates_history.bin"
+    rates_history_intraday_days: int = 30
     statistics_db_path: str = "data/statistics.db"
     user_settings_db_path: str = "data/user_settings.db"
 
@@ -59,7 +111,7 @@ class Settings(BaseSettings):
             raise ValueError(f"must be one of: {', '.join(sorted(allowed))}")
         return normalised
 
-    @field_validator("watch_code_changes", mode="before")
+    @field_validator("watch_code_changes", "parser_profiling", "rates_leader_election", mode="before")
     @classmethod
     def _empty_flag_is_off(cls, value: Any) -> Any:
         """Treat an empty / whitespace-only value as "off", and tolerate padding.
@@ -77,6 +129,64 @@ class Settings(BaseSettings):
             return False if not cleaned else cleaned
         return value
 
+    @field_validator("parse_cache_entries", "parse_cache_bytes", "inline_state_entries", "parse_workers",
+                     "chat_profile_entries", "rates_history_intraday_days")
+    @classmethod
+    def _reject_negative_budget(cls, value: int) -> int:
+        """A negative budget is a typo, not a way of saying "off" — 0 is."""
+        if value < 0:
+            raise ValueError("must be 0 or greater")
+        return value
+
+    @model_validator(mode="after")
+    def _one_parse_cache_off_switch(self) -> "Settings":
+        """0 in either parse cache budget turns the cache off, so both read 0.
+
+        A cache with room for entries but not for a single byte of them cannot hold
+        anything; ParseCache refuses to be built like that, and accepting
+        PARSE_CACHE_BYTES=0 here only to crash at import was the worst of both.
+        """
+        if self.parse_cache_entries == 0 or self.parse_cache_bytes == 0:
+            self.parse_cache_entries = self.parse_cache_bytes = 0
+        return self
+
+    @field_validator("rate_providers")
+    @classmethod
+    def _known_rate_providers(cls, value: str) -> str:
+        # The providers are built here once to be checked; the manager builds its own.
+        build_providers(value, api_key="")
+        return value.strip()
+
+    @field_validator("rate_provider_hedge_delay")
+    @classmethod
+    def _reject_negative_delay(cls, value: float) -> float:
+        if value < 0:
+            raise ValueError("must be 0 or a positive number of seconds")
+        return value
+
+    @field_validator("inline_state_ttl", "parse_deadline")
+    @classmethod
+    def _reject_non_positive_seconds(cls, value: float) -> float:
+        if value <= 0:
+            raise ValueError("must be a positive number of seconds")
+        return value
+
+    @field_validator("chat_profile_refresh")
+    @classmethod
+    def _reject_non_positive_count(cls, value: int) -> int:
+        if value <= 0:
+            raise ValueError("must be 1 or greater")
+        return value
+
+    @field_validator("parser_regex_backend")
+    @classmethod
+    def _known_regex_backend(cls, value: str) -> str:
+        normalised = value.strip().lower()
+        allowed = {"re", "re2"}
+        if normalised not in allowed:
+            raise ValueError(f"must be one of: {', '.join(sorted(allowed))}")
+        return normalised
+
     @field_validator("statistics_db_path", "user_settings_db_path")
     @classmethod
     def _reject_json_db_path(cls, value: str) -> str:
@@ -20,6 +20,8 @@ import time
 
 from telebot import types
 
+from src.rate_table import RateTable
+
 # A token that is obviously fake but has the shape of a real one: telebot's TeleBot()
 # refuses anything without a colon, and the tests need a value they can search for in
 # the output rather than whatever BOT_TOKEN happens to be in the environment (CI sets
@@ -72,13 +74,17 @@ class RecordingRatesManager:
 
     def __init__(self, missing=()):
         self.requested = []
+        self.calls = 0
         self._missing = set(missing)
 
-    def get_rate(self, from_currency, to_currency):
-        self.requested.append((from_currency, to_currency))
-        if (from_currency, to_currency) in self._missing:
-            return None
-        return 1.0
+    def get_rates(self, sources, targets):
+        self.calls += 1
+        sources, targets = list(sources), list(targets)
+        # A currency to itself is in the table too, but never used: it is not a pair
+        # the reply costs.
+        self.requested.extend((source, target) for source in sources for target in targets if source != target)
+        values = [None if (source, target) in self._missing else 1.0 for source in sources for target in targets]
+        return RateTable(sources, targets, values, revision=1)
 
     @property
     def requested_targets(self):
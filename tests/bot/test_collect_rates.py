@@ -33,14 +33,14 @@ def test_no_user_settings_fetches_only_the_default_currencies(bot, rates, defaul
         # that a message costs a handful of lookups, not all of them.
         assert len(rates.requested) < len(bot.currency_formatter.target_currencies) // 2, \
             f"user_currencies={user_currencies}"
-        assert set(result) == {f"GEL_{target}" for target in defaults}, \
+        assert {target for target in result.targets if result.rate("GEL", target)} == defaults | {"USD"}, \
             f"user_currencies={user_currencies}"
 
 
 def test_usd_is_requested_even_when_the_user_left_it_out(bot, rates):
     result = bot._collect_rates([(100.0, "GEL", "100 лари")], ["EUR", "GBP"])
     assert rates.requested_targets == {"EUR", "GBP", "USD"}
-    assert "GEL_USD" in result
+    assert result.rate("GEL", "USD") == 1.0
 
 
 def test_usd_is_not_requested_twice_when_the_user_asked_for_it(bot, rates):
@@ -61,7 +61,8 @@ def test_repeated_amounts_in_the_same_currency_are_fetched_once(bot, rates):
     result = bot._collect_rates(found, ["EUR", "USD"])
 
     assert rates.requested == [("RUB", "EUR"), ("RUB", "USD")]
-    assert set(result) == {"RUB_EUR", "RUB_USD"}
+    assert result.sources == ("RUB",)
+    assert len(result) == 2
 
 
 def test_several_source_currencies_are_all_fetched(bot, rates):
@@ -75,5 +76,12 @@ def test_a_missing_rate_is_left_out_of_the_result(bot):
     rates = RecordingRatesManager(missing=[("GEL", "GBP")])
     with mock.patch.object(bot, "rates_manager", rates):
         result = bot._collect_rates([(100.0, "GEL", "100 лари")], ["GBP", "EUR"])
-    assert "GEL_GBP" not in result
-    assert "GEL_EUR" in result
+    assert result.rate("GEL", "GBP") is None
+    assert result.rate("GEL", "EUR") == 1.0
+
+
+def test_a_reply_costs_one_call_to_the_manager(bot, rates):
+    found = [(100.0, "RUB", "100 рублей"), (5.0, "EUR", "5 евро"), (3.0, "GEL", "3 лари")]
+    result = bot._collect_rates(found, ["USD", "EUR", "GBP"])
+    assert rates.calls == 1
+    assert (result.sources, result.targets) == (("RUB", "EUR", "GEL"), ("USD", "EUR", "GBP"))
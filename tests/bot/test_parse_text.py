@@ -11,6 +11,7 @@ from unittest import mock
 
 import pytest
 
+from src.chat_profiles import ChatProfiles
 from tests.bot.doubles import message
 from tests.logcapture import assert_no_logs
 
@@ -77,3 +78,54 @@ def test_a_forward_into_a_group_chat_is_ignored(bot, fake_bot):
     })
     bot.parse_text(incoming.text, incoming)
     assert fake_bot.replies == []
+
+
+def test_group_chats_go_through_their_chat_profile(bot, fake_bot):
+    profiles = ChatProfiles(bot.currency_parser, max_chats=8, min_matches=1)
+    with mock.patch.object(bot, "chat_profiles", profiles):
+        for text in ("100 долларов", "200 долларов", "5 евро"):
+            incoming = message(text=text)
+            bot.parse_text(incoming.text, incoming)
+        private = message(chat={"id": 42, "type": "private"}, text="300 долларов")
+        bot.parse_text(private.text, private)
+    assert len(fake_bot.replies) == 4
+    assert profiles.currencies(-1001234567890) == {'USD', 'EUR'}
+    assert profiles.stats() == {'subset_parses': 1, 'full_parses': 2, 'fallbacks': 1, 'chats': 1}
+
+
+def _entity(text, fragment, kind):
+    """A Telegram entity over `fragment` of `text`, with offsets in UTF-16 code units."""
+    start = text.index(fragment)
+    return {
+        "type": kind,
+        "offset": len(text[:start].encode("utf-16-le")) // 2,
+        "length": len(fragment.encode("utf-16-le")) // 2,
+    }
+
+
+def test_links_and_code_are_not_parsed(bot, fake_bot):
+    text = "смотри https://shop.example/?price=100$ и `500 рублей`"
+    incoming = message(chat={"id": 42, "type": "private"}, text=text,
+                       entities=[_entity(text, "https://shop.example/?price=100$", "url"),
+                                 _entity(text, "`500 рублей`", "code")])
+    bot.handle_message(incoming)
+    assert len(fake_bot.replies) == 1
+    assert "Не нашел ничего" in fake_bot.replies[0][1]
+
+
+def test_entity_offsets_count_utf16_units(bot):
+    text = "🎉🎉 @cash100 100 долларов 😀 #usd5"
+    incoming = message(text=text, entities=[_entity(text, "@cash100", "mention"), _entity(text, "#usd5", "hashtag"),
+                                            _entity(text, "100 долларов", "bold")])
+    spans = bot._excluded_spans(text, incoming.entities)
+    assert [text[start:end] for start, end in spans] == ["@cash100", "#usd5"]
+    assert bot.currency_parser.find_currencies(text, spans) == [(100.0, 'USD', '100 долларов')]
+
+
+def test_a_photo_caption_uses_the_caption_entities(bot, fake_bot):
+    caption = "https://example.com/?p=100$"
+    incoming = message(chat={"id": 42, "type": "private"}, text=None, caption=caption,
+                       photo=[{"file_id": "x", "file_unique_id": "y", "width": 1, "height": 1}],
+                       caption_entities=[_entity(caption, caption, "url")])
+    bot.handle_photo(incoming)
+    assert "Не нашел ничего" in fake_bot.replies[0][1]
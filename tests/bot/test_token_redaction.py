@@ -72,8 +72,8 @@ def test_a_value_whose_str_raises_is_left_alone(bot):
 
 
 def test_the_apilayer_key_is_masked(bot):
-    """No live leak today — the key travels in a header — but _fetch_usd_rates puts
-    the API response body into the text of the exception it raises."""
+    """No live leak today — the key travels in a header — but ApilayerProvider.fetch
+    puts the API response body into the text of the exception it raises."""
     with mock.patch.object(bot.settings, "api_key", "apilayer-secret-key-value"):
         redacted = bot._redact("API request failed. Response: {'key': 'apilayer-secret-key-value'}")
     assert "apilayer-secret-key-value" not in redacted
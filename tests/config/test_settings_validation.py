@@ -12,6 +12,7 @@ comment above them.
 import pytest
 from pydantic import ValidationError
 
+from src.currency_parser import CurrencyParser
 from src.settings import Settings
 
 
@@ -56,11 +57,30 @@ def test_db_paths_are_accepted():
 
 
 def test_the_rates_cache_may_still_be_json():
-    # Only the two sqlite paths are constrained; the rates cache really is JSON.
+    # Only the two sqlite paths are constrained; a rates cache left at its old .json
+    # path is told by its content and converted in place.
     assert build(exchange_rates_cache_path="data/exchange_rates_cache.json").exchange_rates_cache_path == \
         "data/exchange_rates_cache.json"
 
 
+@pytest.mark.parametrize("value", ["apilayer", " apilayer, https://open.er-api.com/v6/latest/USD ", "file:data/rates.json"])
+def test_rate_providers_are_accepted(value):
+    assert build(rate_providers=value).rate_providers == value.strip()
+
+
+@pytest.mark.parametrize("value", ["", "apilayr", "apilayer,apilayer", "file:", "ftp://rates.example"])
+def test_unknown_rate_providers_are_rejected(value):
+    with pytest.raises(ValidationError) as caught:
+        build(rate_providers=value)
+    assert "rate_providers" in str(caught.value)
+
+
+def test_a_negative_hedge_delay_is_rejected():
+    with pytest.raises(ValidationError):
+        build(rate_provider_hedge_delay=-1)
+    assert build(rate_provider_hedge_delay=0).rate_provider_hedge_delay == 0
+
+
 @pytest.mark.parametrize("field", ["statistics_db_path", "user_settings_db_path"])
 def test_a_trailing_space_is_stripped_from_an_accepted_path(field):
     # Trivially easy to produce in YAML or a .env line, and it would otherwise create
@@ -127,3 +147,76 @@ def test_watch_code_changes_defaults_to_off(monkeypatch):
     # developer with WATCH_CODE_CHANGES exported would otherwise see this fail.
     monkeypatch.delenv("WATCH_CODE_CHANGES", raising=False)
     assert build().watch_code_changes is False
+
+
+# --- parser_profiling --------------------------------------------------------
+# Shares the flag validator with watch_code_changes; pinned so that an empty
+# `PARSER_PROFILING=` cannot become a startup failure if the two are ever split.
+
+@pytest.mark.parametrize("raw, expected", [("", False), (" on ", True), ("0", False)])
+def test_parser_profiling_accepts_the_usual_spellings(raw, expected):
+    assert build(parser_profiling=raw).parser_profiling is expected
+
+
+def test_parser_profiling_defaults_to_off(monkeypatch):
+    monkeypatch.delenv("PARSER_PROFILING", raising=False)
+    assert build().parser_profiling is False
+
+
+@pytest.mark.parametrize("raw, expected", [("", False), (" true ", True), ("off", False)])
+def test_rates_leader_election_accepts_the_usual_spellings(raw, expected):
+    assert build(rates_leader_election=raw).rates_leader_election is expected
+
+
+# --- parse_cache_* -----------------------------------------------------------
+
+@pytest.mark.parametrize("field", ["parse_cache_entries", "parse_cache_bytes"])
+def test_a_negative_parse_cache_budget_is_rejected(field):
+    with pytest.raises(ValidationError) as caught:
+        build(**{field: -1})
+    assert field in str(caught.value)
+
+
+def test_zero_parse_cache_entries_is_the_off_switch():
+    assert build(parse_cache_entries=0).parse_cache_entries == 0
+
+
+def test_zero_parse_cache_bytes_turns_the_cache_off_too():
+    # Used to pass validation and then crash at import, in ParseCache.__init__.
+    built = build(parse_cache_bytes=0)
+    assert (built.parse_cache_entries, built.parse_cache_bytes) == (0, 0)
+    assert CurrencyParser(cache_entries=built.parse_cache_entries, cache_bytes=built.parse_cache_bytes).cache_stats() is None
+
+
+def test_inline_state_ttl_must_be_positive():
+    with pytest.raises(ValidationError) as caught:
+        build(inline_state_ttl=0)
+    assert "inline_state_ttl" in str(caught.value)
+
+
+def test_parse_deadline_must_be_positive():
+    with pytest.raises(ValidationError) as caught:
+        build(parse_deadline=0)
+    assert "parse_deadline" in str(caught.value)
+
+
+@pytest.mark.parametrize("raw, expected", [("re", "re"), ("RE2", "re2"), (" re2 ", "re2")])
+def test_the_regex_backend_is_normalised(raw, expected):
+    assert build(parser_regex_backend=raw).parser_regex_backend == expected
+
+
+def test_an_unknown_regex_backend_is_rejected():
+    with pytest.raises(ValidationError) as caught:
+        build(parser_regex_backend="pcre")
+    assert "parser_regex_backend" in str(caught.value)
+
+
+def test_chat_profiles_are_off_by_default_and_refresh_must_be_positive(monkeypatch):
+    monkeypatch.delenv("CHAT_PROFILE_ENTRIES", raising=False)
+    assert build().chat_profile_entries == 0
+    with pytest.raises(ValidationError) as caught:
+        build(chat_profile_refresh=0)
+    assert "chat_profile_refresh" in str(caught.value)
+    with pytest.raises(ValidationError) as caught:
+        build(chat_profile_entries=-1)
+    assert "chat_profile_entries" in str(caught.value)
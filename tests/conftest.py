@@ -36,7 +36,8 @@ _STATE_DIR = tempfile.mkdtemp(prefix="currva-bot-tests-")
 # The suite is the only writer, so removing the whole directory at interpreter exit is
 # enough — no leftovers in /tmp after `make test`, whether it passed or failed.
 atexit.register(shutil.rmtree, _STATE_DIR, ignore_errors=True)
-os.environ["EXCHANGE_RATES_CACHE_PATH"] = os.path.join(_STATE_DIR, "exchange_rates_cache.json")
+os.environ["EXCHANGE_RATES_CACHE_PATH"] = os.path.join(_STATE_DIR, "exchange_rates_cache.bin")
+os.environ["RATES_HISTORY_PATH"] = os.path.join(_STATE_DIR, "rates_history.bin")
 os.environ["STATISTICS_DB_PATH"] = os.path.join(_STATE_DIR, "statistics.db")
 os.environ["USER_SETTINGS_DB_PATH"] = os.path.join(_STATE_DIR, "user_settings.db")
 
@@ -52,6 +53,6 @@ from tests.stubs import StubCurrencyParser
 
 @pytest.fixture(scope="module")
 def parser():
-    # CurrencyParser.__init__ compiles ~170 regexes; module scope keeps that off the
+    # CurrencyParser.__init__ compiles ~150 regexes; module scope keeps that off the
     # per-test path. The parser is stateless once built, so sharing it is safe.
     return StubCurrencyParser()
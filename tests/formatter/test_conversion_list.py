@@ -6,6 +6,7 @@
 """format_multiple_conversions(): deduplication, truncation and the empty list."""
 
 from src.currency_formatter import MAX_LISTED_CONVERSIONS
+from src.rate_table import RateTable
 
 
 def test_the_rest_note_counts_unique_amounts_not_raw_matches(formatter, unit_rates):
@@ -28,3 +29,14 @@ def test_more_unique_amounts_than_the_limit_are_truncated_with_the_note(formatte
 def test_empty_list_still_returns_none(formatter, unit_rates):
     # Behaviour deliberately unchanged; only the annotation was corrected.
     assert formatter.format_multiple_conversions([], unit_rates, mode='chat') is None
+
+
+def test_a_rate_table_formats_like_the_dict_it_replaces(formatter):
+    currencies = ["USD", "EUR", "RUB", "GEL", "GBP"]
+    rates = {f"{a}_{b}": 1.5 + index for index, (a, b) in enumerate((a, b) for a in currencies for b in currencies if a != b)}
+    table = RateTable(currencies, currencies,
+                      [rates.get(f"{a}_{b}") for a in currencies for b in currencies], revision=1)
+    currency_list = [(100.0, "RUB", "100 рублей"), (5.0, "GBP", "5 фунтов"), (7.0, "GEL", "7 лари")]
+    for mode in ("chat", "inline"):
+        assert formatter.format_multiple_conversions(currency_list, table, mode=mode) == \
+            formatter.format_multiple_conversions(currency_list, rates, mode=mode)
@@ -0,0 +1,183 @@
+# flake8: noqa
+# pylint: disable=broad-exception-raised, raise-missing-from, too-many-arguments, redefined-outer-name
+# pylance: disable=reportMissingImports, reportMissingModuleSource, reportGeneralTypeIssues
+# type: ignore
+
+"""Worst-case inputs built against every row of the pattern table, under a CPU ceiling.
+
+tests/parser/test_limits.py pins the pathological inputs that were found the hard
+way. This suite goes looking for the next one: for every row of
+CurrencyParser.patterns it derives a text the row almost matches, from the row's own
+regex — so a new alias is attacked the day it is added — and grows it into the
+shapes that make a backtracking engine go super-linear:
+
+    digit groups    "1 000 000 … долла": a long amount that never reaches its unit
+    separators      "1.1,1 1.1,1 …": every position a possible thousands group
+    k suffixes      "5кдолла 5кдолла …": the "к" has to be given back every time
+    stems           "1 долла 1 долла …": the unit's stem without its ending
+    confusables     "1 дoллaрoв …" with Latin letters that look Cyrillic
+    spaces          "1" + whitespace + stem, for the \\s* in front of the unit
+    glued           "1долларовx …": full matches that fail their \\b at the end
+
+Each row runs alone over each shape at MAX_TEXT_LENGTH, and the whole parser runs
+over shapes mixed from all rows, each engine in turn. The limits are CPU time of the
+calling thread, not wall-clock time, so a busy runner does not trip them; a run that
+does is measured once more and the faster run kept, since interference can only add.
+Measured when the limits were set: the costliest row needs ~15 ms for its worst shape
+and the costliest parse (the scan engine on digit groups) ~0.8 s. The amount regex
+with its old unbounded repeat put single rows at ~0.25 s on digit groups and a whole
+scan at the 20-30 s test_limits.py tells about — both far past the limits below.
+"""
+
+import random
+import re
+import time
+from re import _constants as sre, _parser as sre_parser
+
+import pytest
+
+from src.case_folding import fold_text
+from src.currency_parser import ENGINES, MAX_TEXT_LENGTH, CurrencyParser
+
+
+# CPU seconds one row may take for one finditer() over a MAX_TEXT_LENGTH text, and
+# one find_currency_matches() call for the whole table.
+ROW_CEILING = 0.1
+PARSE_CEILING = 4.0
+
+# Latin look-alikes of Cyrillic letters and the other way round.
+CONFUSABLES = str.maketrans('аеорсхукмтнвАЕОРСХУКМТНВaeopcxyABEKMHOPCTXY',
+                            'aeopcxykmthbAEOPCXYKMTHBаеорсхуАВЕКМНОРСТХУ')
+
+
+def _sample(items, rng):
+    """One string the parsed items match, choosing among alternatives with `rng`."""
+    out = []
+    for op, value in items:
+        if op is sre.LITERAL:
+            out.append(chr(value))
+        elif op is sre.NOT_LITERAL:
+            out.append('x' if value != ord('x') else 'y')
+        elif op is sre.ANY:
+            out.append('x')
+        elif op is sre.IN:
+            out.append(_sample_set(value))
+        elif op is sre.BRANCH:
+            out.append(_sample(rng.choice(value[1]).data, rng))
+        elif op is sre.SUBPATTERN:
+            out.append(_sample(value[3].data, rng))
+        elif op in (sre.MAX_REPEAT, sre.MIN_REPEAT, sre.POSSESSIVE_REPEAT):
+            low, high, sub = value
+            count = low if high == low else rng.randint(low, min(high, low + 2))
+            out.append(''.join(_sample(sub.data, rng) for _ in range(count)))
+        elif op is sre.ATOMIC_GROUP:
+            out.append(_sample(value.data, rng))
+        # Assertions consume nothing.
+    return ''.join(out)
+
+
+def _sample_set(items):
+    for op, value in items:
+        if op is sre.LITERAL:
+            return chr(value)
+        if op is sre.RANGE:
+            return chr(value[0])
+        if op is sre.CATEGORY:
+            return {sre.CATEGORY_DIGIT: '7', sre.CATEGORY_SPACE: ' '}.get(value, 'ж')
+    return 'ж'
+
+
+def _row_parts(parser, pattern, rng):
+    """A prefix, an amount and a unit the row matches, sampled from its regex."""
+    if parser.number not in pattern:
+        return '', '', _sample(sre_parser.parse(pattern.replace('(?P<amount>)', ''), re.IGNORECASE).data, rng)
+    prefix, unit = pattern.split(parser.number, 1)
+    prefix = _sample(sre_parser.parse(prefix, re.IGNORECASE).data, rng)
+    unit = _sample(sre_parser.parse(unit, re.IGNORECASE).data, rng).lstrip()
+    return prefix, '1', unit
+
+
+def _fill(fragment):
+    """`fragment` repeated to exactly MAX_TEXT_LENGTH characters."""
+    return (fragment * (MAX_TEXT_LENGTH // max(1, len(fragment)) + 1))[:MAX_TEXT_LENGTH]
+
+
+def _shapes(prefix, amount, unit):
+    """The fragment of every shape for one row; _fill() makes the text of it."""
+    stem = unit[:-1] if len(unit) > 1 else unit
+    return {
+        'digit groups': f"{prefix}{amount or '1'}" + ' 000' * 400 + f" {stem} ",
+        'separators': f"{prefix}1.1,1 1.1,1 1,1.1 {stem}",
+        'k suffixes': f"{prefix}5к{stem} ",
+        'stems': f"{prefix}{amount} {stem} ",
+        'confusables': f"{prefix}{amount} {unit.translate(CONFUSABLES)} ",
+        'spaces': f"{prefix}{amount or '1'}" + ' \t ' * 600 + stem,
+        'glued': f"{prefix}{amount}{unit}x1 ",
+    }
+
+
+SHAPES = list(_shapes('', '1', 'x'))
+
+
+@pytest.fixture(scope="module")
+def table():
+    """(row, currency, compiled pattern, its shapes) for every row of the table."""
+    parser = CurrencyParser()
+    rng = random.Random(13)
+    return [
+        (row, currency, compiled, _shapes(*_row_parts(parser, pattern, rng)))
+        for row, ((currency, pattern), (_, compiled)) in enumerate(zip(parser.patterns, parser.compiled_patterns))
+    ]
+
+
+def _cpu_seconds(call):
+    """CPU time of this thread for call(); the faster of two runs if the first is slow."""
+    def once():
+        started = time.thread_time()
+        call()
+        return time.thread_time() - started
+    first = once()
+    return first if first < 0.01 else min(first, once())
+
+
+@pytest.mark.parametrize("shape", SHAPES)
+def test_no_row_is_super_linear_on_its_worst_case(table, shape):
+    slow = []
+    for row, currency, compiled, shapes in table:
+        # The rows are compiled for folded text.
+        text = fold_text(_fill(shapes[shape]))
+        assert len(text) == MAX_TEXT_LENGTH
+        seconds = _cpu_seconds(lambda: sum(1 for _ in compiled.finditer(text)))
+        if seconds > ROW_CEILING:
+            slow.append((seconds, row, currency, compiled.pattern, text[:60]))
+    slow.sort(reverse=True)
+    assert not slow, (
+        f"{len(slow)} rows take more than {ROW_CEILING} s of CPU for one pass over "
+        f"{MAX_TEXT_LENGTH} characters shaped as {shape!r}; the worst: "
+        + '; '.join(f"row {row} ({currency}) {seconds:.3f} s on {text!r}" for seconds, row, currency, _, text in slow[:3]))
+
+
+@pytest.fixture(scope="module", params=ENGINES)
+def engine_parser(request):
+    return CurrencyParser(engine=request.param)
+
+
+@pytest.mark.parametrize("shape", SHAPES)
+def test_a_whole_parse_stays_under_the_ceiling(table, engine_parser, shape):
+    # Every row's fragment of the shape in turn, as far as the limit reaches.
+    text = _fill(''.join(shapes[shape] for _, _, _, shapes in table))
+    engine_parser.find_currency_matches('100 долларов')
+    seconds = _cpu_seconds(lambda: engine_parser.find_currency_matches(text))
+    assert seconds < PARSE_CEILING, (
+        f"the {engine_parser.engine} engine took {seconds:.2f} s of CPU for {MAX_TEXT_LENGTH} "
+        f"characters shaped as {shape!r}: {text[:80]!r}")
+
+
+def test_the_samples_are_what_the_rows_match():
+    # The shapes are only near misses if the sample they are cut from is a match.
+    parser = CurrencyParser()
+    rng = random.Random(13)
+    for (currency, pattern), (_, compiled) in zip(parser.patterns, parser.compiled_patterns):
+        prefix, amount, unit = _row_parts(parser, pattern, rng)
+        text = f"{prefix}{amount} {unit}" if amount and r'\s+' in pattern else f"{prefix}{amount}{unit}"
+        assert compiled.fullmatch(fold_text(text)), (currency, pattern, text)
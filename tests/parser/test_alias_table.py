@@ -0,0 +1,117 @@
+# flake8: noqa
+# pylint: disable=broad-exception-raised, raise-missing-from, too-many-arguments, redefined-outer-name
+# pylance: disable=reportMissingImports, reportMissingModuleSource, reportGeneralTypeIssues
+# type: ignore
+
+"""The alias table and the rows compiled from it.
+
+Every alias listed in src/currency_aliases.py has to parse as its currency in the
+position it is listed for, the compiled trie has to match its forms and nothing
+else, and a new alias must extend a row rather than add one.
+"""
+
+import dataclasses
+import re
+
+import pytest
+
+from src.currency_aliases import ALIASES, Aliases, compile_alias_rows, expand, trie_pattern
+
+
+# The "кило…" and cent rows stand for a multiple or a fraction of another currency.
+BASE = {'RUBK': 'RUB', 'USDK': 'USD', 'EURK': 'EUR', 'USDCENT': 'USD', 'EURCENT': 'EUR'}
+
+
+def _listed(field):
+    """(currency, form) for every form of `field`, the first currency to list it only."""
+    seen, listed = set(), []
+    for currency, entry in ALIASES.items():
+        for alias in getattr(entry, field):
+            for form in expand(alias):
+                if form.lower() not in seen:
+                    seen.add(form.lower())
+                    listed.append((currency, form))
+    return listed
+
+
+def test_braces_spell_out_every_form():
+    assert expand('лир{а,ы,}') == ['лира', 'лиры', 'лир']
+    assert expand('турецк{ая,ой} лир{а,}') == ['турецкая лира', 'турецкая лир', 'турецкой лира', 'турецкой лир']
+    assert expand('usd') == ['usd']
+
+
+@pytest.mark.parametrize("forms", [
+    ['доллар', 'долларов', 'доллара'],
+    ['cent', 'cents', 'eurocent', 'eurocents'],
+    ['лей', 'лея', 'леи', 'леев', 'молдавских лей'],
+    ['$', 'د.إ', 'dh', 'zł', 'Kč'],
+])
+def test_a_trie_matches_its_forms_and_nothing_else(forms):
+    pattern = re.compile(trie_pattern(forms), re.IGNORECASE)
+    for form in forms:
+        assert pattern.fullmatch(form)
+        assert pattern.fullmatch(form.upper())
+        assert not pattern.fullmatch(form + 'ъ')
+        assert not pattern.fullmatch(form[:-1] + 'ъ')
+    assert not pattern.fullmatch('')
+    # An alias is text, not a regex: the dot in "د.إ" is a dot.
+    assert not pattern.fullmatch('دxإ')
+
+
+def test_shared_prefixes_are_read_once():
+    assert trie_pattern(['доллар{ов,а,}']) == 'доллар(?:ов|а)?'
+    assert trie_pattern(['белорусск{их,ий,ие} руб{лей,ля,ль}']) == 'белорусски[хйе] рубл(?:ей|[яь])'
+
+
+def test_duplicates_are_merged():
+    assert trie_pattern(['usd', 'USD', 'usd']) == trie_pattern(['usd'])
+
+
+@pytest.mark.parametrize("currency, form", _listed('words') + _listed('unhyphenated'))
+def test_every_word_parses_as_its_currency(parser, currency, form):
+    for text in (f"5 {form}", f"5{form}"):
+        [match] = parser.find_currency_matches(text)
+        assert match.currency_code == BASE.get(currency, currency)
+        assert match.original_text == text
+
+
+@pytest.mark.parametrize("currency, form", _listed('symbols'))
+def test_every_symbol_parses_as_its_currency(parser, currency, form):
+    [match] = parser.find_currency_matches(f"5 {form}")
+    assert match.currency_code == BASE.get(currency, currency)
+
+
+@pytest.mark.parametrize("currency, form", _listed('prefixes'))
+def test_every_prefix_parses_as_its_currency(parser, currency, form):
+    [match] = parser.find_currency_matches(f"{form}5")
+    assert match.currency_code == BASE.get(currency, currency)
+
+
+@pytest.mark.parametrize("currency, form", _listed('spaced'))
+def test_spaced_words_need_the_space(parser, currency, form):
+    assert [match.currency_code for match in parser.find_currency_matches(f"5 {form}")] == [currency]
+    assert parser.find_currency_matches(f"5{form}") == []
+
+
+@pytest.mark.parametrize("currency, form", _listed('standalone'))
+def test_standalone_words_are_an_amount(parser, currency, form):
+    [match] = parser.find_currency_matches(form)
+    assert match.currency_code == BASE[currency]
+
+
+def test_an_alias_extends_a_row_and_adds_none():
+    table = dict(ALIASES)
+    table['USD'] = dataclasses.replace(table['USD'], words=table['USD'].words + ('гринов', 'зелёных'))
+    table['ISK'] = Aliases(words=('крон{а,ы,} исландск{их,ие}',))
+    rows = compile_alias_rows('(?P<amount>\\d+)')
+    extended = compile_alias_rows('(?P<amount>\\d+)', table)
+    assert len(extended) == len(rows) + 1
+    assert [currency for currency, _ in extended[:-1]] == [currency for currency, _ in rows]
+
+
+def test_a_currency_has_one_row_per_position():
+    rows = compile_alias_rows('(?P<amount>\\d+)')
+    for currency, entry in ALIASES.items():
+        expected = bool(entry.prefixes) + bool(entry.words or entry.unhyphenated or entry.symbols) \
+            + bool(entry.spaced) + bool(entry.standalone)
+        assert sum(1 for row_currency, _ in rows if row_currency == currency) == expected
@@ -0,0 +1,61 @@
+# flake8: noqa
+# pylint: disable=broad-exception-raised, raise-missing-from, too-many-arguments, redefined-outer-name
+# pylance: disable=reportMissingImports, reportMissingModuleSource, reportGeneralTypeIssues
+# type: ignore
+
+"""find_currency_matches_many(): a batch is the same as a loop of single calls.
+
+Whatever the fan-out, the result for every text has to be what
+find_currency_matches() returns for it, in the order the texts came in — repeats,
+texts over the length limit and texts the prefilter rejects included.
+"""
+
+import pytest
+
+from src.currency_parser import BATCH_FAN_OUTS, BATCH_PROCESSES, BATCH_THREADS, MAX_TEXT_LENGTH, CurrencyParser
+
+
+BATCH = [
+    "100 долларов",
+    "ничего тут нет",
+    "£800 и 700£ и €50",
+    "100 долларов",
+    "1" * (MAX_TEXT_LENGTH + 1),
+    "",
+    "5 килобаксов и 2,5к евро",
+    "100 USD 200 EUR 300 RUB",
+    "£800 и 700£ и €50",
+]
+
+
+@pytest.mark.parametrize("fan_out", [None, BATCH_THREADS, BATCH_PROCESSES])
+def test_a_batch_returns_what_single_calls_return_in_input_order(parser, fan_out):
+    expected = [parser.find_currency_matches(text) for text in BATCH]
+    assert parser.find_currency_matches_many(BATCH, fan_out=fan_out, workers=2) == expected
+
+
+def test_any_iterable_is_accepted(parser):
+    assert parser.find_currency_matches_many(text for text in BATCH) == [
+        parser.find_currency_matches(text) for text in BATCH
+    ]
+
+
+def test_repeated_texts_get_lists_of_their_own(parser):
+    first, second = parser.find_currency_matches_many(["100 долларов", "100 долларов"])
+    assert first == second and first is not second
+
+
+def test_the_batch_goes_through_the_prefilter_and_the_cache():
+    parser = CurrencyParser(cache_entries=16, cache_bytes=1 << 20)
+    parser.find_currency_matches("100 долларов")
+    parser.find_currency_matches_many(["100 долларов", "ничего тут нет", "200 евро", "200 евро"])
+    assert parser.prefilter_rejections() == 1
+    stats = parser.cache_stats()
+    assert stats["hits"] == 1
+    assert stats["entries"] == 2
+
+
+def test_an_unknown_fan_out_is_refused(parser):
+    with pytest.raises(ValueError, match="Unknown fan-out"):
+        parser.find_currency_matches_many(BATCH, fan_out="gpu")
+    assert "gpu" not in BATCH_FAN_OUTS
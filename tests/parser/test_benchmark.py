@@ -0,0 +1,67 @@
+# flake8: noqa
+# pylint: disable=broad-exception-raised, raise-missing-from, too-many-arguments, redefined-outer-name
+# pylance: disable=reportMissingImports, reportMissingModuleSource, reportGeneralTypeIssues
+# type: ignore
+
+"""The throughput benchmark: a reproducible corpus and an equivalence check that bites.
+
+Timings are not asserted here — they depend on the machine. What is pinned is that
+the corpus looks like a chat, that every engine passes the equivalence check on it,
+and that a configuration answering differently is reported, never averaged away.
+"""
+
+import pytest
+
+from src.currency_parser import MAX_TEXT_LENGTH
+from src.parser_benchmark import CONFIGURATIONS, REFERENCE, build_corpus, build_parsers, main, run_benchmark
+
+
+def test_the_corpus_is_reproducible_and_looks_like_a_chat(parser):
+    corpus = build_corpus(2000, seed=3)
+    assert corpus == build_corpus(2000, seed=3)
+    assert corpus != build_corpus(2000, seed=4)
+    assert max(len(text) for text in corpus) <= MAX_TEXT_LENGTH
+    assert any(len(text) > MAX_TEXT_LENGTH // 2 for text in corpus)
+    with_money = sum(1 for text in corpus[:500] if parser.find_currency_matches(text))
+    assert 0.1 * 500 < with_money < 0.4 * 500
+
+
+def test_every_engine_passes_the_equivalence_check():
+    corpus = build_corpus(300, seed=1)
+    results = run_benchmark(corpus, build_parsers(['scan', 'combined', 'tokens', 'combined+cache']))
+    assert [result.name for result in results] == [REFERENCE, 'combined', 'tokens', 'combined+cache']
+    for result in results:
+        assert result.mismatches == []
+        assert result.messages == 300
+        assert 0 < result.p50_us <= result.p99_us
+        assert result.messages_per_second > 0
+
+
+class _Forgetful:
+    """Drops the last match of every message with more than one."""
+
+    def __init__(self, parser):
+        self._parser = parser
+
+    def find_currency_matches(self, text):
+        matches = self._parser.find_currency_matches(text)
+        return matches[:-1] if len(matches) > 1 else matches
+
+
+def test_a_configuration_that_answers_differently_is_reported(parser):
+    corpus = ["100 долларов и 200 евро", "ничего", "5 CHF", "$5 и €6"]
+    results = run_benchmark(corpus, {REFERENCE: parser, 'forgetful': _Forgetful(parser)})
+    assert results[1].mismatches == [0, 3]
+
+
+def test_the_command_fails_on_a_difference(monkeypatch, parser, capsys):
+    monkeypatch.setattr('src.parser_benchmark.build_parsers',
+                        lambda names: {REFERENCE: parser, 'forgetful': _Forgetful(parser)})
+    assert main(['--messages', '200']) == 1
+    assert "forgetful differs from scan" in capsys.readouterr().err
+
+
+def test_an_unknown_configuration_is_refused():
+    with pytest.raises(ValueError, match="Unknown configuration"):
+        build_parsers(['gpu'])
+    assert REFERENCE in CONFIGURATIONS
@@ -0,0 +1,75 @@
+# flake8: noqa
+# pylint: disable=broad-exception-raised, raise-missing-from, too-many-arguments, redefined-outer-name
+# pylance: disable=reportMissingImports, reportMissingModuleSource, reportGeneralTypeIssues
+# type: ignore
+
+"""The parse result cache: same answers, fewer parses, bounded memory."""
+
+import pytest
+
+from src.currency_parser import CurrencyParser
+from src.parse_cache import ParseCache, text_key
+
+
+def test_a_repeated_text_is_answered_from_the_cache():
+    parser = CurrencyParser(cache_entries=8, cache_bytes=1 << 20)
+    first = parser.find_currency_matches("100 долларов")
+    second = parser.find_currency_matches("100 долларов")
+    assert first == second == CurrencyParser().find_currency_matches("100 долларов")
+    stats = parser.cache_stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+
+
+def test_a_caller_mutating_its_result_does_not_change_the_next_one():
+    parser = CurrencyParser(cache_entries=8, cache_bytes=1 << 20)
+    parser.find_currency_matches("100 долларов").clear()
+    assert len(parser.find_currency_matches("100 долларов")) == 1
+
+
+def test_prefiltered_texts_never_reach_the_cache():
+    parser = CurrencyParser(cache_entries=8, cache_bytes=1 << 20)
+    parser.find_currency_matches("ничего тут нет")
+    assert parser.cache_stats()['misses'] == 0
+
+
+def test_the_cache_is_off_by_default(parser):
+    assert parser.cache_stats() is None
+
+
+def test_the_least_recently_used_entry_goes_first():
+    cache = ParseCache(max_entries=2, max_bytes=1 << 20)
+    cache.put(text_key("a"), [])
+    cache.put(text_key("b"), [])
+    assert cache.get(text_key("a")) == ()
+    cache.put(text_key("c"), [])
+    assert cache.get(text_key("b")) is None
+    assert cache.get(text_key("a")) == ()
+    assert cache.stats()['evictions'] == 1
+
+
+def test_the_byte_budget_evicts_as_well():
+    parser = CurrencyParser()
+    result = parser.find_currency_matches("100 долларов и 200 евро")
+    cache = ParseCache(max_entries=100, max_bytes=1)
+    cache.put(text_key("x"), result)
+    assert cache.stats()['entries'] == 0
+
+    cache = ParseCache(max_entries=100, max_bytes=4096)
+    for number in range(100):
+        cache.put(text_key(str(number)), result)
+    stats = cache.stats()
+    assert 0 < stats['bytes'] <= 4096
+    assert stats['entries'] + stats['evictions'] == 100
+
+
+def test_the_key_is_a_digest_not_the_text():
+    key = text_key("секретные 100 долларов")
+    assert isinstance(key, bytes) and len(key) == 16
+    # A lone surrogate (possible in a str decoded from JSON) does not break it.
+    assert text_key("\ud800") != key
+
+
+@pytest.mark.parametrize("entries, size", [(0, 10), (10, 0), (-1, 10)])
+def test_non_positive_budgets_are_refused(entries, size):
+    with pytest.raises(ValueError):
+        ParseCache(entries, size)
@@ -0,0 +1,70 @@
+# flake8: noqa
+# pylint: disable=broad-exception-raised, raise-missing-from, too-many-arguments, redefined-outer-name
+# pylance: disable=reportMissingImports, reportMissingModuleSource, reportGeneralTypeIssues
+# type: ignore
+
+"""Folding the text once instead of matching every row with IGNORECASE.
+
+The folded rows have to match the folded text exactly where the original rows matched
+the original text under IGNORECASE, and the matches have to index the text the caller
+passed.
+"""
+
+import re
+import sys
+
+import pytest
+
+from src.case_folding import _tables, fold_pattern, fold_text
+from src.currency_parser import CurrencyParser
+
+
+def test_the_fast_path_folds_like_the_table():
+    fold, _ = _tables()
+    chars = [chr(code) for code in range(sys.maxunicode + 1) if not 0xD800 <= code <= 0xDFFF]
+    for start in range(0, len(chars), 4096):
+        chunk = ''.join(chars[start:start + 4096])
+        assert fold_text(chunk) == chunk.translate(fold)
+        for char in chunk:
+            assert fold_text(char) == char.translate(fold), hex(ord(char))
+
+
+@pytest.mark.parametrize("left, right", [
+    ("ДОЛЛАР", "доллар"), ("ı", "I"), ("ſ", "s"), ("ς", "Σ"), ("ᲁ", "д"), ("K", "k"), ("İ", "i"),
+])
+def test_what_ignorecase_equates_folds_alike(left, right):
+    assert re.fullmatch(re.escape(left), right, re.IGNORECASE)
+    assert fold_text(left) == fold_text(right)
+
+
+def test_folding_keeps_every_offset():
+    for text in ("İstanbul 5 USD", "ΣΑΣ 100 EUR", "Straße 5 €", "ﬃ 3 доллара"):
+        assert len(fold_text(text)) == len(text)
+
+
+def test_matches_index_the_original_text(parser):
+    text = "İİ ΣΑΣ 100 ДОЛЛАРОВ"
+    [match] = parser.find_currency_matches(text)
+    assert (match.original_text, text[match.start:match.end]) == ("100 ДОЛЛАРОВ", "100 ДОЛЛАРОВ")
+
+
+def test_codes_keep_their_case(parser):
+    assert parser.find_currencies("5 KWD") == [(5.0, 'KWD', '5 KWD')]
+    assert parser.find_currencies("5 kwd") == []
+    assert parser.find_currencies("5 Kwd") == []
+
+
+def test_the_table_folds_to_itself_but_for_the_codes():
+    parser = CurrencyParser()
+    for currency, pattern in parser.patterns:
+        folded, tail = fold_pattern(pattern)
+        if tail is None:
+            assert folded == pattern
+        else:
+            assert (tail, folded) == (currency, pattern.replace(f"(?-i:{currency})", currency.lower()))
+
+
+@pytest.mark.parametrize("pattern", [r"(?-i:USD)\s+\d", r"(?-i:U.D)", r"\x41", r"(?i)a", "[A-Z]"])
+def test_what_cannot_be_folded_is_refused(pattern):
+    with pytest.raises(ValueError, match="Cannot fold"):
+        fold_pattern(pattern)
@@ -0,0 +1,163 @@
+# flake8: noqa
+# pylint: disable=broad-exception-raised, raise-missing-from, too-many-arguments, redefined-outer-name
+# pylance: disable=reportMissingImports, reportMissingModuleSource, reportGeneralTypeIssues
+# type: ignore
+
+"""Parser variants for a few currencies, and the per-chat profiles that choose them.
+
+A variant may run fewer rows, never answer differently: whatever it returns without
+flagging a possible miss has to be exactly what the full table returns.
+"""
+
+import itertools
+import random
+
+import pytest
+
+from src.chat_profiles import MAX_PROFILE_CURRENCIES, ChatProfiles
+from src.currency_parser import ENGINES, PSEUDO_CURRENCIES, VARIANT_LIMIT, CurrencyParser
+from src.parser_benchmark import build_corpus
+
+
+@pytest.fixture(scope="module")
+def full():
+    return CurrencyParser()
+
+
+def test_a_variant_has_the_rows_of_its_currencies_in_table_order(full):
+    variant = full.variant({'USD', 'RUB'})
+    assert variant.currencies == {'USD', 'RUB'}
+    assert variant.patterns == [row for row in full.patterns if PSEUDO_CURRENCIES.get(row[0], row[0]) in ('USD', 'RUB')]
+    # The cent and "кило…" rows come along with their currency.
+    assert {'USDK', 'USDCENT', 'RUBK'} <= {currency for currency, _ in variant.patterns}
+    assert full.variant(['RUB', 'USD']) is variant
+
+
+def test_variants_are_bounded(full):
+    codes = sorted({PSEUDO_CURRENCIES.get(currency, currency) for currency, _ in full.patterns})
+    subsets = itertools.islice(itertools.combinations(codes, 2), VARIANT_LIMIT + 1)
+    first = full.variant(next(subsets))
+    for subset in subsets:
+        full.variant(subset)
+    assert full.variant(first.currencies) is not first
+
+
+def test_a_variant_is_cut_from_the_compiled_table(full):
+    variant = full.variant({'USD', 'RUB'})
+    compiled = dict((id(pattern), currency) for currency, pattern in full.compiled_patterns)
+    # The very pattern objects of the parser: nothing was compiled again.
+    assert all(id(pattern) in compiled for _, pattern in variant.compiled_patterns)
+
+
+def test_a_variant_cannot_be_empty_or_wider_than_its_parser(full):
+    with pytest.raises(ValueError, match="No row"):
+        full.variant({'XXX'})
+    with pytest.raises(ValueError, match="cannot have"):
+        full.variant({'USD'}).variant({'EUR'})
+
+
+@pytest.mark.parametrize("text", [
+    "5 евро", "100 CHF", "5 лв", "2,5к bgn", "300к драм", "€5", "килоевро", "5 долларов и 5 евро",
+])
+def test_a_left_out_currency_is_suspected(full, text):
+    variant = full.variant({'USD', 'RUB'})
+    assert variant.may_have_missed(text, variant.find_currency_matches(text))
+
+
+@pytest.mark.parametrize("text", [
+    "100 долларов", "5к$", "$5", "500 рублей и 3 бакса", "в 15:30 буду", "ничего", "версия 3.11.7",
+])
+def test_the_variants_own_currencies_are_not_suspected(full, text):
+    variant = full.variant({'USD', 'RUB'})
+    matches = variant.find_currency_matches(text)
+    assert not variant.may_have_missed(text, matches)
+    assert matches == full.find_currency_matches(text)
+
+
+@pytest.mark.parametrize("text", ["продам за 5крон", "5 КРОН", "2,5к крон"])
+def test_a_unit_behind_the_thousands_suffix_is_suspected(full, text):
+    # "5крон" is 5 CZK to the full table, and 5к "рон" (5000 RON) to a RON variant.
+    variant = full.variant(['RON'])
+    assert variant.may_have_missed(text, variant.find_currency_matches(text))
+    profiles = ChatProfiles(full, max_chats=4, min_matches=1)
+    profiles.find_currency_matches(1, "100 рон")
+    assert profiles.find_currency_matches(1, text) == full.find_currency_matches(text)
+
+
+def test_a_variant_shares_the_cache_of_its_parser():
+    parser = CurrencyParser(cache_entries=16, cache_bytes=1 << 20)
+    variant = parser.variant({'USD'})
+    assert variant.find_currency_matches("5 евро") == []
+    # The variant's "nothing" is its own, not the answer for the whole table.
+    assert [match.currency_code for match in parser.find_currency_matches("5 евро")] == ['EUR']
+    assert variant.find_currency_matches("5 евро") == []
+    stats = parser.cache_stats()
+    assert (stats['entries'], stats['hits']) == (2, 1)
+
+
+def test_the_full_parser_never_suspects_itself(full):
+    assert not full.may_have_missed("5 евро", [])
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_a_variant_that_suspects_nothing_answers_like_the_full_table(engine):
+    parser = CurrencyParser(engine=engine)
+    rng = random.Random(14)
+    subsets = [{'RUB'}, {'RUB', 'USD'}, {'USD', 'EUR'}, {'EUR', 'GEL', 'AMD'}, {'KZT', 'RUB', 'USD', 'EUR'}]
+    for text in build_corpus(1500, seed=14):
+        variant = parser.variant(rng.choice(subsets))
+        matches = variant.find_currency_matches(text)
+        if not variant.may_have_missed(text, matches):
+            assert matches == parser.find_currency_matches(text), (sorted(variant.currencies), text)
+
+
+def test_a_chat_is_parsed_in_full_until_its_profile_is_learned(full):
+    profiles = ChatProfiles(full, max_chats=4, refresh_every=50, min_matches=2)
+    profiles.find_currency_matches(1, "100 долларов")
+    profiles.find_currency_matches(1, "200 рублей")
+    assert profiles.currencies(1) == {'USD', 'RUB'}
+    assert profiles.stats()['full_parses'] == 2
+    assert [match[:3] for match in profiles.find_currency_matches(1, "300 рублей")] == [(300.0, 'RUB', '300 рублей')]
+    assert profiles.stats()['subset_parses'] == 1
+
+
+def test_a_suspected_miss_falls_back_to_the_full_table_and_is_learned(full):
+    profiles = ChatProfiles(full, max_chats=4, min_matches=1)
+    profiles.find_currency_matches(1, "100 долларов")
+    assert profiles.find_currencies(1, "5 евро") == [(5.0, 'EUR', '5 евро')]
+    assert profiles.stats()['fallbacks'] == 1
+    assert profiles.currencies(1) == {'USD', 'EUR'}
+
+
+def test_every_refresh_th_message_is_parsed_in_full(full):
+    profiles = ChatProfiles(full, max_chats=4, refresh_every=3, min_matches=1)
+    profiles.find_currency_matches(1, "100 долларов")
+    for _ in range(7):
+        profiles.find_currency_matches(1, "ничего")
+    stats = profiles.stats()
+    assert (stats['full_parses'], stats['subset_parses']) == (3, 5)
+
+
+def test_a_chat_with_many_currencies_stays_on_the_full_table(full):
+    profiles = ChatProfiles(full, max_chats=4, min_matches=1)
+    codes = ['USD', 'EUR', 'RUB', 'GBP', 'JPY', 'CNY', 'KZT', 'GEL', 'AMD', 'TRY']
+    assert len(codes) > MAX_PROFILE_CURRENCIES
+    profiles.find_currency_matches(1, ' '.join(f"5 {code}" for code in codes))
+    profiles.find_currency_matches(1, "5 USD")
+    assert profiles.stats()['subset_parses'] == 0
+
+
+def test_the_least_recently_active_chat_is_forgotten(full):
+    profiles = ChatProfiles(full, max_chats=2)
+    for chat in (1, 2, 1, 3):
+        profiles.find_currency_matches(chat, "100 долларов")
+    assert len(profiles) == 2
+    assert profiles.currencies(2) == set()
+    assert profiles.currencies(1) == {'USD'}
+
+
+def test_profile_bounds_must_be_positive(full):
+    with pytest.raises(ValueError, match="must be positive"):
+        ChatProfiles(full, max_chats=0)
+    with pytest.raises(ValueError, match="must be positive"):
+        ChatProfiles(full, max_chats=1, refresh_every=0)
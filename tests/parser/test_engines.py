@@ -0,0 +1,60 @@
+# flake8: noqa
+# pylint: disable=broad-exception-raised, raise-missing-from, too-many-arguments, redefined-outer-name
+# pylance: disable=reportMissingImports, reportMissingModuleSource, reportGeneralTypeIssues
+# type: ignore
+
+"""The matching engines: different walks over the text, one answer.
+
+'scan' runs every pattern of the table over the text separately and is the
+reference. Every other engine is only allowed to be faster, so each of them is held
+to the scan's exact CurrencyMatch list — amounts, codes, texts and offsets — over a
+corpus built from the cases where the walk order decides the outcome.
+"""
+
+import pytest
+
+from src.currency_parser import ENGINE_SCAN, ENGINES, CurrencyParser
+
+
+CORPUS = [
+    "100 долларов",
+    "дай 100$ и еще 100$",
+    "взял 1100$ и 100$",
+    "£800 и 700£ и €50",
+    "5 килобаксов и 5килобаксов",
+    "1 000 000 рублей и 2,5к евро",
+    "1.2345 евро, 1.234 евро",
+    "$1 000 000abc",
+    "5крон и 5к баксов",
+    "10 000к рублей",
+    "1234 долларов",
+    # A match rejected by the boundary check still consumes its stretch for its own
+    # pattern: the scan does not find "500 долларов" inside it afterwards.
+    "#100 500 долларов",
+    "@100$ и 100$",
+    "100 USD 200 EUR 300 RUB",
+    # IGNORECASE folds more than upper and lower case: the old Cyrillic "ᲁ" matches
+    # "д", and an engine that indexes units by their first letter has to know it.
+    "100 ДОЛЛАРОВ, 100 ᲁолларов, 100 usd и 100 Usd",
+    "3 top и 5 mad — не валюты",
+    "встреча в 10:30, 5 человек",
+    "123 456 789 " * 20,
+    "ничего тут нет",
+    "",
+]
+
+
+@pytest.fixture(scope="module")
+def engines():
+    return {engine: CurrencyParser(engine=engine) for engine in ENGINES}
+
+
+@pytest.mark.parametrize("engine", [engine for engine in ENGINES if engine != ENGINE_SCAN])
+@pytest.mark.parametrize("text", CORPUS)
+def test_every_engine_returns_exactly_what_the_scan_returns(engines, engine, text):
+    assert engines[engine].find_currency_matches(text) == engines[ENGINE_SCAN].find_currency_matches(text)
+
+
+def test_an_unknown_engine_is_refused():
+    with pytest.raises(ValueError, match="Unknown parser engine"):
+        CurrencyParser(engine="regex")
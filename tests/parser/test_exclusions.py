@@ -0,0 +1,81 @@
+# flake8: noqa
+# pylint: disable=broad-exception-raised, raise-missing-from, too-many-arguments, redefined-outer-name
+# pylance: disable=reportMissingImports, reportMissingModuleSource, reportGeneralTypeIssues
+# type: ignore
+
+"""Parsing around excluded spans: the links, code and mentions of a message.
+
+Every part between the spans is parsed as a text of its own, and the matches still
+index the whole text.
+"""
+
+import random
+
+import pytest
+
+from src.chat_profiles import ChatProfiles
+from src.currency_parser import CurrencyParser, text_segments
+from src.parser_benchmark import build_corpus
+
+
+@pytest.mark.parametrize("spans, segments", [
+    ([], [(0, 10)]),
+    ([(0, 10)], []),
+    ([(2, 4)], [(0, 2), (4, 10)]),
+    ([(6, 8), (2, 4)], [(0, 2), (4, 6), (8, 10)]),
+    ([(2, 6), (4, 8)], [(0, 2), (8, 10)]),
+    ([(2, 2)], [(0, 2), (2, 10)]),
+    ([(-5, 3), (8, 50)], [(3, 8)]),
+])
+def test_the_segments_are_what_the_spans_leave(spans, segments):
+    assert text_segments(10, spans) == segments
+
+
+def test_nothing_is_found_inside_an_excluded_span(parser):
+    text = "ссылка https://shop.example/?price=100$ и ещё 5 евро"
+    url = text.index("https"), text.index(" и")
+    assert [match.currency_code for match in parser.find_currency_matches(text)] == ['USD', 'EUR']
+    matches = parser.find_currency_matches(text, [url])
+    assert [(match.original_text, text[match.start:match.end]) for match in matches] == [('5 евро', '5 евро')]
+
+
+def test_a_match_cannot_reach_across_an_excluded_span(parser):
+    text = "100 `x` долларов"
+    assert parser.find_currencies(text, [(4, 7)]) == []
+
+
+def test_the_parts_are_parsed_as_texts_of_their_own(parser):
+    rng = random.Random(17)
+    corpus = build_corpus(300, seed=17)
+    for _ in range(200):
+        parts = [rng.choice(corpus) for _ in range(3)]
+        text = ' '.join(parts)
+        first = len(parts[0]) + 1
+        span = (first, first + len(parts[1]))
+        expected = parser.find_currency_matches(parts[0] + ' ') + [
+            match._replace(start=match.start + span[1], end=match.end + span[1])
+            for match in parser.find_currency_matches(' ' + parts[2])
+        ]
+        assert parser.find_currency_matches(text, [span]) == expected
+
+
+def test_no_exclusions_is_a_plain_parse(parser):
+    for text in build_corpus(100, seed=18):
+        assert parser.find_currency_matches(text, []) == parser.find_currency_matches(text)
+
+
+def test_a_variant_does_not_suspect_what_is_excluded():
+    full = CurrencyParser()
+    variant = full.variant({'USD'})
+    text = "100 долларов, см. https://example.com/?q=5€"
+    url = (text.index("https"), len(text))
+    assert variant.may_have_missed(text, variant.find_currency_matches(text))
+    assert not variant.may_have_missed(text, variant.find_currency_matches(text, [url]), [url])
+
+
+def test_chat_profiles_pass_the_exclusions_on():
+    profiles = ChatProfiles(CurrencyParser(), max_chats=4, min_matches=1)
+    text = "5 евро `100 долларов`"
+    code = (text.index("`"), len(text))
+    assert profiles.find_currencies(1, text, [code]) == [(5.0, 'EUR', '5 евро')]
+    assert profiles.currencies(1) == {'EUR'}
@@ -0,0 +1,109 @@
+# flake8: noqa
+# pylint: disable=broad-exception-raised, raise-missing-from, too-many-arguments, redefined-outer-name
+# pylance: disable=reportMissingImports, reportMissingModuleSource, reportGeneralTypeIssues
+# type: ignore
+
+"""Incremental parsing of inline queries: keystroke by keystroke, the same answer.
+
+parse_incremental() is only allowed to skip work, so every step of a typed, edited
+and backspaced query is held to the full parse of the same text.
+"""
+
+import pytest
+
+from src.currency_parser import ENGINES, MAX_TEXT_LENGTH, CurrencyParser
+from src.parse_cache import ParseStateTable
+
+
+TYPED = [
+    "скинь 100 долларов и 5к рублей, а ещё $20 и 3 килобакса до пятницы",
+    "1 000 000 рублей и 2,5к евро",
+    "#100 500 долларов и 100 500 долларов",
+    "реал 5 реалов 5 реал-мадрид 5 реалов",
+]
+
+
+def _keystrokes(text):
+    """Every prefix, then a backspace, a retype and an edit in the middle."""
+    for end in range(1, len(text) + 1):
+        yield text[:end]
+    yield text[:-1]
+    yield text
+    yield text[:5] + "7" + text[5:]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("text", TYPED)
+def test_every_keystroke_gives_the_full_parse(engine, text):
+    parser = CurrencyParser(engine=engine)
+    state = None
+    for typed in _keystrokes(text):
+        state = parser.parse_incremental(typed, state)
+        assert state.matches == parser.find_currency_matches(typed)
+
+
+def test_a_long_query_really_reuses_its_beginning():
+    parser = CurrencyParser()
+    text = "100 долларов, " * 10
+    state = parser.parse_incremental(text)
+    assert parser._reusable_prefix(text + "5", state) > len(text) // 2
+
+
+def test_a_state_over_the_length_limit_is_not_reused():
+    # Its spans are unknown: reusing it once the text is short enough again dropped
+    # every match before the edit.
+    parser = CurrencyParser()
+    text = "100 долларов " + "x" * MAX_TEXT_LENGTH
+    state = parser.parse_incremental(text)
+    shortened = text[:100]
+    assert parser.parse_incremental(shortened, state).matches == parser.find_currency_matches(shortened) != []
+
+
+def test_a_query_goes_through_the_cache():
+    parser = CurrencyParser(cache_entries=16, cache_bytes=1 << 20)
+    text = "100 долларов и 5 евро"
+    state = parser.parse_incremental(text)
+    assert parser.find_currency_matches(text) == state.matches
+    assert parser.cache_stats()['hits'] == 1
+    assert parser.parse_incremental(text + " и", state).matches == parser.find_currency_matches(text + " и")
+
+
+def test_a_query_without_an_amount_counts_as_a_prefilter_rejection():
+    parser = CurrencyParser()
+    assert parser.parse_incremental("привет").matches == []
+    assert parser.prefilter_rejections() == 1
+
+
+def test_a_different_query_reuses_nothing():
+    parser = CurrencyParser()
+    state = parser.parse_incremental("100 долларов, " * 10)
+    assert parser._reusable_prefix("200 евро", state) == 0
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_states_expire():
+    clock = FakeClock()
+    table = ParseStateTable(max_entries=10, ttl=60, clock=clock)
+    table.put(1, "state")
+    clock.now += 59
+    assert table.get(1) == "state"
+    clock.now += 2
+    assert table.get(1) is None
+    assert len(table) == 0
+
+
+def test_the_least_recently_active_user_is_dropped():
+    table = ParseStateTable(max_entries=2, ttl=60, clock=FakeClock())
+    table.put(1, "a")
+    table.put(2, "b")
+    table.put(1, "a2")
+    table.put(3, "c")
+    assert table.get(2) is None
+    assert (table.get(1), table.get(3)) == ("a2", "c")
@@ -0,0 +1,80 @@
+# flake8: noqa
+# pylint: disable=broad-exception-raised, raise-missing-from, too-many-arguments, redefined-outer-name
+# pylance: disable=reportMissingImports, reportMissingModuleSource, reportGeneralTypeIssues
+# type: ignore
+
+"""The precomputed pattern table and lazy compilation.
+
+The artifact is only allowed to save time: a parser built from it has to have the
+very table probing would give, and an artifact that does not match the patterns has
+to be ignored rather than trusted.
+"""
+
+import json
+
+import pytest
+
+from src import regex_backends
+from src.currency_parser import ENGINE_SCAN, ENGINES, CurrencyParser, write_pattern_table
+from src.regex_backends import BACKEND_RE2
+
+
+@pytest.fixture
+def table_path(tmp_path):
+    path = tmp_path / "pattern_table.json"
+    write_pattern_table(str(path))
+    return path
+
+
+def test_a_parser_built_from_the_artifact_has_the_probed_table(table_path):
+    probed = CurrencyParser(pattern_table_path=None)
+    loaded = CurrencyParser(pattern_table_path=str(table_path))
+    assert loaded.patterns == probed.patterns
+    assert json.loads(table_path.read_text(encoding="utf-8"))["key"] == probed.pattern_table_key
+
+
+def test_the_artifact_is_what_the_parser_uses(table_path):
+    table = json.loads(table_path.read_text(encoding="utf-8"))
+    table["fallback_codes"] = ["KWD"]
+    table_path.write_text(json.dumps(table), encoding="utf-8")
+    assert CurrencyParser(pattern_table_path=str(table_path)).fallback_codes == ["KWD"]
+
+
+@pytest.mark.parametrize("content", [
+    json.dumps({"key": "0" * 64, "fallback_codes": ["KWD"]}),
+    json.dumps({"fallback_codes": ["KWD"]}),
+    "{not json",
+])
+def test_a_stale_or_broken_artifact_is_ignored(table_path, content):
+    table_path.write_text(content, encoding="utf-8")
+    parser = CurrencyParser(pattern_table_path=str(table_path))
+    assert parser.fallback_codes == CurrencyParser(pattern_table_path=None).fallback_codes
+
+
+def test_the_re2_backend_takes_its_translations_from_the_artifact(table_path, monkeypatch):
+    pytest.importorskip("re2")
+    text = "100 долларов, $20 и 5 лв"
+    expected = CurrencyParser(engine=ENGINE_SCAN).find_currency_matches(text)
+
+    def translate(*args):
+        raise AssertionError("translated at startup although the artifact has every row")
+
+    monkeypatch.setattr(regex_backends, "translate_for_re2", translate)
+    parser = CurrencyParser(engine=ENGINE_SCAN, regex_backend=BACKEND_RE2, pattern_table_path=str(table_path))
+    assert parser.find_currency_matches(text) == expected
+
+
+def test_a_missing_artifact_means_probing(tmp_path):
+    parser = CurrencyParser(pattern_table_path=str(tmp_path / "absent.json"))
+    assert parser.fallback_codes == CurrencyParser(pattern_table_path=None).fallback_codes
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_nothing_is_compiled_until_a_text_needs_it(engine):
+    parser = CurrencyParser(engine=engine)
+    assert parser._compiled is None
+    # Rejected by the prefilter: still nothing to compile.
+    assert parser.find_currency_matches("ничего тут нет") == []
+    assert parser._compiled is None
+    assert parser.find_currencies("100 долларов") == [(100.0, "USD", "100 долларов")]
+    assert parser._compiled is not None
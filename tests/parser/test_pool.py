@@ -0,0 +1,148 @@
+# flake8: noqa
+# pylint: disable=broad-exception-raised, raise-missing-from, too-many-arguments, redefined-outer-name
+# pylance: disable=reportMissingImports, reportMissingModuleSource, reportGeneralTypeIssues
+# type: ignore
+
+"""The worker-process pool: the same answers, a deadline, and a way back in-process."""
+
+import logging
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from src.currency_parser import CurrencyParser
+from src.parse_pool import ParsePool, ParseTimeout
+
+from tests.logcapture import capture_logs
+
+
+@pytest.fixture(scope="module")
+def pooled():
+    # Module scope: spawning a worker and compiling its parser takes a moment.
+    parser = CurrencyParser(workers=1, deadline=30)
+    yield parser
+    parser.close()
+
+
+def test_a_pooled_parse_matches_the_in_process_one(pooled, parser):
+    text = "100 долларов, $20 и 5к рублей"
+    assert pooled.find_currency_matches(text) == parser.find_currency_matches(text)
+    assert pooled.pool_stats()['submitted'] >= 1
+
+
+def test_a_variant_parses_in_the_pool_of_its_parser(pooled, parser):
+    text = "100 долларов и 5 евро"
+    submitted = pooled.pool_stats()['submitted']
+    variant = pooled.variant({'USD'})
+    assert variant.find_currency_matches(text) == parser.variant({'USD'}).find_currency_matches(text)
+    assert pooled.pool_stats()['submitted'] == submitted + 1
+    variant.close()
+    assert pooled.pool_stats()['healthy'] == 1
+
+
+def test_an_inline_query_parses_in_the_pool(pooled, parser):
+    submitted = pooled.pool_stats()['submitted']
+    state = pooled.parse_incremental("100 долларов и 5")
+    state = pooled.parse_incremental("100 долларов и 5 евро", state)
+    assert state.matches == parser.find_currency_matches("100 долларов и 5 евро")
+    assert pooled.pool_stats()['submitted'] == submitted + 2
+
+
+def test_a_parse_past_the_deadline_has_no_matches():
+    parser = CurrencyParser(workers=1, deadline=30)
+    try:
+        parser.find_currency_matches("1 евро")  # wait for the worker to come up
+        parser._pool.deadline = 1e-6
+        with capture_logs("parse_pool", logging.WARNING) as logs:
+            assert parser.find_currency_matches("100 долларов") == []
+        assert parser.pool_stats()['timeouts'] == 1
+        assert not any("100 долларов" in line for line in logs.output)
+    finally:
+        parser.close()
+
+
+def test_a_timed_out_text_is_parsed_on_the_next_call(parser):
+    pooled = CurrencyParser(workers=1, deadline=30, cache_entries=16, cache_bytes=1 << 20)
+    try:
+        pooled.find_currency_matches("1 евро")
+        pooled._pool.deadline = 1e-6
+        with capture_logs("parse_pool", logging.WARNING):
+            assert pooled.find_currency_matches("100 долларов") == []
+        pooled._pool.deadline = 30
+        # The miss was not cached as "no currencies".
+        assert pooled.find_currency_matches("100 долларов") == parser.find_currency_matches("100 долларов")
+        assert pooled.cache_stats()['hits'] == 0
+    finally:
+        pooled.close()
+
+
+class StuckExecutor:
+    """Starts every task and never finishes one, like a worker deep in a slow scan."""
+
+    def __init__(self):
+        self.shut_down = False
+
+    def submit(self, *args):
+        future = Future()
+        future.set_running_or_notify_cancel()
+        return future
+
+    def shutdown(self, **kwargs):
+        self.shut_down = True
+
+
+def test_a_pool_stuck_on_abandoned_parses_is_recycled():
+    pool = ParsePool(workers=2, deadline=0.01, engine="combined")
+    try:
+        pool._executor.shutdown()
+        stuck = pool._executor = StuckExecutor()
+        with capture_logs("parse_pool", logging.WARNING):
+            with pytest.raises(ParseTimeout):
+                pool.parse("100 долларов")
+            assert not stuck.shut_down  # one worker of two is still free
+            with pytest.raises(ParseTimeout):
+                pool.parse("200 долларов")
+        assert stuck.shut_down
+        assert pool.stats()['recycles'] == 1
+        pool.deadline = 30
+        assert pool.parse("100 долларов")
+    finally:
+        pool.close()
+
+
+class BrokenExecutor:
+    def submit(self, *args):
+        raise BrokenProcessPool("worker died")
+
+    def shutdown(self, **kwargs):
+        pass
+
+
+def test_a_broken_pool_falls_back_to_in_process_and_is_rebuilt_later():
+    now = [0.0]
+    pool = ParsePool(workers=1, deadline=30, engine="combined", retry_after=10, clock=lambda: now[0])
+    try:
+        pool._executor.shutdown()
+        pool._executor = BrokenExecutor()
+        with capture_logs("parse_pool", logging.ERROR):
+            assert pool.parse("100 долларов") is None
+        assert pool.stats()['healthy'] == 0
+        assert pool.parse("100 долларов") is None  # still cooling down
+
+        now[0] = 10.0
+        assert pool.parse("100 долларов") is not None
+        assert pool.stats()['restarts'] == 1
+    finally:
+        pool.close()
+
+
+def test_the_parser_answers_when_the_pool_is_broken(parser):
+    pooled = CurrencyParser(workers=1, deadline=30)
+    try:
+        pooled._pool._executor.shutdown()
+        pooled._pool._executor = BrokenExecutor()
+        with capture_logs("parse_pool", logging.ERROR):
+            assert pooled.find_currency_matches("100 долларов") == parser.find_currency_matches("100 долларов")
+    finally:
+        pooled.close()
@@ -0,0 +1,58 @@
+# flake8: noqa
+# pylint: disable=broad-exception-raised, raise-missing-from, too-many-arguments, redefined-outer-name
+# pylance: disable=reportMissingImports, reportMissingModuleSource, reportGeneralTypeIssues
+# type: ignore
+
+"""The prefilter: texts that cannot contain an amount never reach a regex.
+
+It is only allowed to be a shortcut. Whatever it lets through is parsed as before,
+and whatever it rejects must be a text the patterns would not have matched anyway —
+so the rejections are checked against the engine running without it.
+"""
+
+import pytest
+
+from src.currency_parser import CurrencyParser
+
+
+REJECTED = [
+    "ничего тут нет",
+    "Привет, как дела? Встретимся вечером",
+    "$ и € без цифр",
+    "кило яблок",
+    "",
+]
+
+PASSED = [
+    "100 долларов",
+    "5 килобаксов",
+    # The amount-less forms carry no digit, so they are what the word list is for.
+    "килобакс",
+    "КИЛОРУБЛЬ",
+    "пара килоевро",
+    # `\d` is any Unicode decimal digit, not only 0-9.
+    "١٠٠ долларов",
+]
+
+
+@pytest.fixture
+def fresh_parser():
+    # Function scope: the rejection counter is per instance and the tests count it.
+    return CurrencyParser()
+
+
+@pytest.mark.parametrize("text", REJECTED)
+def test_a_text_without_digits_or_amountless_words_is_rejected_and_counted(fresh_parser, text):
+    assert fresh_parser.find_currency_matches(text) == []
+    assert fresh_parser.prefilter_rejections() == 1
+
+
+@pytest.mark.parametrize("text", PASSED)
+def test_a_text_that_may_hold_an_amount_is_parsed(fresh_parser, text):
+    fresh_parser.find_currency_matches(text)
+    assert fresh_parser.prefilter_rejections() == 0
+
+
+@pytest.mark.parametrize("text", REJECTED)
+def test_nothing_rejected_would_have_matched(parser, text):
+    assert list(parser._raw_matches(text)) == []
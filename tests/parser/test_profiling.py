@@ -0,0 +1,42 @@
+# flake8: noqa
+# pylint: disable=broad-exception-raised, raise-missing-from, too-many-arguments, redefined-outer-name
+# pylance: disable=reportMissingImports, reportMissingModuleSource, reportGeneralTypeIssues
+# type: ignore
+
+"""Opt-in per-pattern profiling: counters per row of the table, never message text."""
+
+import pytest
+
+from src.currency_parser import ENGINES, CurrencyParser
+
+
+def _rows(profile, currency):
+    return [row for row in profile if row['currency'] == currency]
+
+
+def test_profiling_is_off_by_default(parser):
+    assert parser.pattern_profile() is None
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_matches_and_survivors_are_counted_per_row(engine):
+    parser = CurrencyParser(engine=engine, profile=True)
+    # "100 долларов" is kept; "#5 евро" is a match the boundary check throws away.
+    assert len(parser.find_currency_matches("100 долларов и #5 евро")) == 1
+
+    profile = parser.pattern_profile()
+    assert [row['row'] for row in profile] == list(range(len(parser.patterns)))
+    assert sum(row['matches'] for row in _rows(profile, 'USD')) == 1
+    assert sum(row['survived'] for row in _rows(profile, 'USD')) == 1
+    assert sum(row['matches'] for row in _rows(profile, 'EUR')) == 1
+    assert sum(row['survived'] for row in _rows(profile, 'EUR')) == 0
+    assert sum(row['seconds'] for row in profile) > 0
+
+
+def test_no_message_text_is_recorded():
+    parser = CurrencyParser(profile=True)
+    text = "секретные 12345 долларов"
+    parser.find_currency_matches(text)
+    recorded = repr(parser.pattern_profile())
+    assert "12345" not in recorded
+    assert "секретные" not in recorded
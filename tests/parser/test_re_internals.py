@@ -0,0 +1,97 @@
+# flake8: noqa
+# pylint: disable=broad-exception-raised, raise-missing-from, too-many-arguments, redefined-outer-name
+# pylance: disable=reportMissingImports, reportMissingModuleSource, reportGeneralTypeIssues
+# type: ignore
+
+"""The private parts of `re` the parser is built on.
+
+src/regex_backends.py, src/currency_parser.py and src/case_folding.py read parsed
+patterns through re._parser and re._constants, fold case with _sre.unicode_tolower and
+re._casefix, and compile parsed items with re._compiler. None of it is a public API,
+so a Python upgrade may move or reshape any of it; these tests say which part did,
+instead of leaving it to an ImportError at startup or a wrong translation. The
+interpreter it is known to work on is pinned in the Dockerfile and .python-version.
+"""
+
+import importlib
+import os
+import re
+import sys
+
+import pytest
+
+USERS = "src/regex_backends.py, src/currency_parser.py and src/case_folding.py"
+
+CONSTANTS = [
+    'ANY', 'ASSERT', 'ASSERT_NOT', 'AT', 'ATOMIC_GROUP', 'AT_BEGINNING_STRING', 'AT_BOUNDARY',
+    'AT_END_STRING', 'AT_NON_BOUNDARY', 'BRANCH', 'CATEGORY', 'CATEGORY_DIGIT', 'CATEGORY_WORD',
+    'GROUPREF', 'GROUPREF_EXISTS', 'IN', 'LITERAL', 'MAXREPEAT', 'MAX_REPEAT', 'MIN_REPEAT',
+    'NEGATE', 'NOT_LITERAL', 'POSSESSIVE_REPEAT', 'RANGE', 'SUBPATTERN',
+]
+
+
+def _private(module, name=None):
+    try:
+        found = importlib.import_module(module)
+    except ImportError:
+        pytest.fail(f"Python {sys.version.split()[0]} has no {module}, which {USERS} import")
+    if name is not None and not hasattr(found, name):
+        pytest.fail(f"Python {sys.version.split()[0]} has no {module}.{name}, which {USERS} use")
+    return found if name is None else getattr(found, name)
+
+
+@pytest.mark.parametrize("name", CONSTANTS)
+def test_the_opcodes_are_there(name):
+    _private('re._constants', name)
+
+
+@pytest.mark.parametrize("module, name", [
+    ('re._parser', 'parse'), ('re._parser', 'State'), ('re._parser', 'SubPattern'),
+    ('re._compiler', 'compile'), ('re._casefix', '_EXTRA_CASES'), ('_sre', 'unicode_tolower'),
+])
+def test_the_functions_are_there(module, name):
+    _private(module, name)
+
+
+def test_a_parsed_pattern_still_has_the_shape_the_translation_reads():
+    constants = _private('re._constants')
+    parsed = _private('re._parser', 'parse')(r'(?P<amount>\d{1,3})(?:\s|xy)(?!\w)', re.IGNORECASE)
+    ops = [op for op, _ in parsed.data]
+    assert ops == [constants.SUBPATTERN, constants.BRANCH, constants.ASSERT_NOT], \
+        f"re._parser.parse() output changed shape: {parsed.data}; {USERS} walk it"
+    group, add_flags, del_flags, sub = parsed.data[0][1]
+    assert (group, parsed.state.groupdict) == (1, {'amount': 1}), "SUBPATTERN values changed shape"
+    low, high, _ = sub.data[0][1]
+    assert (low, high) == (1, 3), "MAX_REPEAT values changed shape"
+    direction, _ = parsed.data[2][1]
+    assert direction == 1, "ASSERT_NOT values changed shape"
+    assert parsed.getwidth() == (2, 5), "SubPattern.getwidth() changed"
+
+
+def test_a_parsed_item_still_compiles_on_its_own():
+    parser = _private('re._parser')
+    constants = _private('re._constants')
+    state = parser.State()
+    state.flags = re.UNICODE
+    item = (constants.IN, [(constants.CATEGORY, constants.CATEGORY_DIGIT)])
+    compiled = _private('re._compiler', 'compile')(parser.SubPattern(state, [item]), re.UNICODE)
+    assert compiled.findall("a1٣") == ["1", "٣"], "re._compiler.compile() no longer compiles a parsed item"
+
+
+def test_case_folding_still_works_the_way_it_is_read():
+    tolower = _private('_sre', 'unicode_tolower')
+    assert tolower(ord('Д')) == ord('д') and tolower(0x212A) == ord('k'), "_sre.unicode_tolower() changed"
+    extra = _private('re._casefix', '_EXTRA_CASES')
+    assert isinstance(extra, dict) and ord('s') in extra, "re._casefix._EXTRA_CASES changed shape"
+    assert all(isinstance(codes, tuple) for codes in extra.values()), "re._casefix._EXTRA_CASES changed shape"
+
+
+def test_the_pinned_python_is_the_same_everywhere():
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    with open(os.path.join(root, "Dockerfile"), encoding="utf-8") as f:
+        docker = re.search(r"^ARG PYTHON_VERSION=(\S+)$", f.read(), re.MULTILINE).group(1)
+    with open(os.path.join(root, ".python-version"), encoding="utf-8") as f:
+        local = f.read().strip()
+    with open(os.path.join(root, "requirements.txt"), encoding="utf-8") as f:
+        assert f"Python {docker}," in f.read(), "requirements.txt names another Python than the Dockerfile"
+    assert docker == local, f"The Dockerfile pins Python {docker}, .python-version {local}"
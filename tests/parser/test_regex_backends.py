@@ -0,0 +1,105 @@
+# flake8: noqa
+# pylint: disable=broad-exception-raised, raise-missing-from, too-many-arguments, redefined-outer-name
+# pylance: disable=reportMissingImports, reportMissingModuleSource, reportGeneralTypeIssues
+# type: ignore
+
+"""The regex backends: the same table on `re` and on RE2, one answer.
+
+The re2 backend does not get the patterns as written but a translation of them, and
+the amount in its linear form. Both are only allowed to change how the text is
+searched, so it is held to the stdlib scan's exact CurrencyMatch list. The
+compatibility check runs without google-re2; running the backend needs it.
+"""
+
+import re
+import time
+
+import pytest
+
+from src.currency_parser import ENGINE_COMBINED, ENGINE_SCAN, CurrencyParser
+from src.regex_backends import BACKEND_RE, BACKEND_RE2, re2_incompatibility
+
+from tests.parser.test_engines import CORPUS
+
+
+RE2_CORPUS = CORPUS + [
+    "5 лв, 5лв, 5 лвл и 1 000 лв",
+    "$100$200 и €5€6",
+    "5 реал-мадрид и 5 реалов",
+    "1.2345 евро и $1.2345",
+    "1 234567 рублей",
+    "5 лв и 100$ 𝟙𝟘 долларов",
+    "١٠٠ долларов и ０ евро",
+    "10 CHF, 10 chf, 10 Chf",
+    "100 долларов\n200 евро\t300 ₽",
+]
+
+
+@pytest.fixture(scope="module")
+def re2_parser():
+    pytest.importorskip("re2")
+    return CurrencyParser(engine=ENGINE_SCAN, regex_backend=BACKEND_RE2)
+
+
+@pytest.fixture(scope="module")
+def scan_parser():
+    return CurrencyParser(engine=ENGINE_SCAN)
+
+
+def test_the_re2_backend_can_run_every_row_of_the_table(parser):
+    assert parser.regex_backend_report(BACKEND_RE2) == []
+    assert parser.regex_backend_report(BACKEND_RE) == []
+
+
+@pytest.mark.parametrize("pattern, reason", [
+    (r"(?<!\w)лв", "lookbehind"),
+    (r"\d++ долларов", "possessive"),
+    (r"(\d+) \1", "backreference"),
+    (r"\bдоллар", "AT_BOUNDARY that does not end"),
+    (r"(?!\d)\d", "lookahead that does not end"),
+])
+def test_what_re2_cannot_express_is_reported(pattern, reason):
+    assert reason in re2_incompatibility(pattern)
+
+
+@pytest.mark.parametrize("pattern", [r"[., ]", r"[^а-яё]", r"[\ud700-\ue100x]", r"[^\ud800]"])
+def test_a_listed_class_is_read_off_the_pattern_as_re_would_match_it(pattern):
+    from src.regex_backends import _all_characters, _leaf, _ranges, _sre_parser
+    (item,) = _sre_parser.parse(pattern).data
+    assert _leaf(item, 0) == _ranges(map(ord, re.findall(pattern, ''.join(_all_characters()))), ascending=True)
+
+
+def test_a_trailing_boundary_is_expressible():
+    assert re2_incompatibility(r"\d+ лв\b") is None
+
+
+@pytest.mark.parametrize("text", RE2_CORPUS)
+def test_the_re2_backend_returns_exactly_what_re_returns(re2_parser, scan_parser, text):
+    assert re2_parser.find_currency_matches(text) == scan_parser.find_currency_matches(text)
+
+
+def test_a_lone_surrogate_does_not_shift_the_offsets(re2_parser, scan_parser):
+    # Not UTF-8 encodable, so RE2 sees U+FFFD in its place (and pytest could not
+    # put it in a test id).
+    text = "5 лв \ud800 и 100$ \ud83d 𝟙𝟘 долларов"
+    assert re2_parser.find_currency_matches(text) == scan_parser.find_currency_matches(text)
+    assert re2_parser.find_currency_matches(text)
+
+
+def test_the_re2_backend_stays_linear_where_re_backtracks(re2_parser):
+    # Exponential for `re`; one pass for the automaton.
+    from src.regex_backends import Re2Pattern
+    pattern = Re2Pattern(r"(?:a+)+b")
+    started = time.perf_counter()
+    assert list(pattern.finditer("a" * 4096)) == []
+    assert time.perf_counter() - started < 1.0
+
+
+def test_the_re2_backend_runs_the_scan_only():
+    with pytest.raises(ValueError, match="runs the 'scan' engine only"):
+        CurrencyParser(engine=ENGINE_COMBINED, regex_backend=BACKEND_RE2)
+
+
+def test_an_unknown_backend_is_refused():
+    with pytest.raises(ValueError, match="Unknown regex backend"):
+        CurrencyParser(regex_backend="pcre")
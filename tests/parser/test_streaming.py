@@ -0,0 +1,94 @@
+# flake8: noqa
+# pylint: disable=broad-exception-raised, raise-missing-from, too-many-arguments, redefined-outer-name
+# pylance: disable=reportMissingImports, reportMissingModuleSource, reportGeneralTypeIssues
+# type: ignore
+
+"""Streaming parse of texts past MAX_TEXT_LENGTH: the windows must not show.
+
+Whatever the window size and however the input is split into pieces, the stream has
+to yield exactly the matches one parse of the whole text gives (_parse, which has no
+length limit), with offsets into the whole text.
+"""
+
+import random
+
+import pytest
+
+from src.currency_parser import ENGINES, MAX_TEXT_LENGTH, CurrencyParser
+from src.parser_benchmark import build_corpus
+
+
+@pytest.fixture(scope="module", params=ENGINES)
+def engine_parser(request):
+    return CurrencyParser(engine=request.param)
+
+
+def _pieces(text, rng, count):
+    cuts = sorted(rng.sample(range(1, len(text)), count))
+    return [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+
+def test_long_texts_parse_as_one_text(engine_parser):
+    corpus = build_corpus(800, seed=15)
+    rng = random.Random(15)
+    for _ in range(40):
+        text = rng.choice(['\n', ' ', '']).join(rng.choice(corpus) for _ in range(rng.randint(5, 60)))
+        window = rng.choice([160, 300, 1000, MAX_TEXT_LENGTH])
+        expected = engine_parser._parse(text)
+        assert list(engine_parser.stream_currency_matches(text, window=window)) == expected
+        assert list(engine_parser.stream_currency_matches(_pieces(text, rng, 15), window=window)) == expected
+
+
+def test_a_match_across_a_window_boundary_comes_out_once(parser):
+    # "100 долларов" at every position around the end of the first window.
+    for shift in range(-15, 15):
+        text = 'x ' * ((200 + shift) // 2) + '100 долларов и 5 €' + ' y' * 200
+        matches = list(parser.stream_currency_matches(text, window=200))
+        assert [(match.original_text, text[match.start:match.end]) for match in matches] == \
+            [('100 долларов', '100 долларов'), ('5 €', '5 €')]
+
+
+def test_short_texts_parse_as_find_currency_matches_does(parser):
+    for text in build_corpus(300, seed=16):
+        assert list(parser.stream_currency_matches(text)) == parser.find_currency_matches(text)
+
+
+def test_pieces_are_read_as_they_are_needed(parser):
+    read = []
+
+    def pieces():
+        for index in range(1000):
+            read.append(index)
+            yield f"строка {index}: 100 долларов\n"
+
+    stream = parser.stream_currency_matches(pieces(), window=500)
+    first = next(stream)
+    assert first.original_text == '100 долларов'
+    assert len(read) < 50
+
+
+def test_the_stream_stops_at_the_match_limit(parser):
+    text = '100 долларов, ' * 2000
+    matches = list(parser.stream_currency_matches(text, max_matches=7))
+    assert len(matches) == 7
+    assert list(parser.stream_currency_matches(text, max_matches=0)) == []
+
+
+def test_the_stream_stops_when_its_time_is_spent(parser):
+    text = '100 долларов, ' * 2000
+    matches = list(parser.stream_currency_matches(text, window=1000, time_budget=0))
+    # One window is always parsed; the budget is checked between windows.
+    assert 0 < len(matches) < 100
+
+
+def test_a_run_without_a_safe_cut_still_moves_on(parser):
+    # Nothing but amount characters and whitespace: no cut the windows could keep.
+    text = '1 2 3 4 5 ' * 2000 + '100 долларов'
+    matches = list(parser.stream_currency_matches(text, window=500))
+    assert matches[-1].original_text.endswith('100 долларов')
+    assert all(first.end <= second.start for first, second in zip(matches, matches[1:]))
+
+
+def test_a_window_narrower_than_a_match_is_refused(parser):
+    with pytest.raises(ValueError, match="at least"):
+        list(parser.stream_currency_matches('100 долларов', window=20))
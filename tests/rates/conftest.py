@@ -21,6 +21,12 @@ from tests.rates.doubles import ScriptedRatesManager
 @pytest.fixture
 def cache_path(tmp_path):
     """The cache file every manager in a test writes to, inside its private directory."""
+    return tmp_path / "exchange_rates_cache.bin"
+
+
+@pytest.fixture
+def legacy_cache_path(tmp_path):
+    """Where an earlier release left its JSON cache: next to the binary one."""
     return tmp_path / "exchange_rates_cache.json"
 
 
@@ -35,6 +41,7 @@ def make_manager(cache_path):
 
     def _make_manager(**kwargs):
         kwargs.setdefault("cache_file", str(cache_path))
+        kwargs.setdefault("history_file", str(cache_path.with_name("rates_history.bin")))
         # The background thread is off unless a test explicitly asks for it, so the
         # rest of the suite stays deterministic.
         kwargs.setdefault("start_update_thread", False)
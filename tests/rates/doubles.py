@@ -37,4 +37,5 @@ class ScriptedRatesManager(ExchangeRatesManager):
         self.calls += 1
         if self.calls <= self.failures:
             raise RuntimeError("apilayer is unreachable")
-        return dict(self.quotes)
+        # The quotes are written as apilayer names them ("USDEUR"); providers return codes.
+        return {key[3:]: value for key, value in self.quotes.items()}
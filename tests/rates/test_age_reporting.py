@@ -15,7 +15,7 @@ from tests.rates.doubles import LOGGER_NAME
 
 def test_rates_older_than_the_threshold_are_warned_about(make_manager):
     manager = make_manager()
-    manager._last_update = datetime.now() - timedelta(seconds=STALE_RATES_MAX_AGE + 60)
+    manager._snapshot = manager._snapshot._replace(last_update=datetime.now() - timedelta(seconds=STALE_RATES_MAX_AGE + 60))
 
     with capture_logs(LOGGER_NAME, logging.WARNING) as captured:
         manager._log_rates_age()
@@ -0,0 +1,56 @@
+# flake8: noqa
+# pylint: disable=broad-exception-raised, raise-missing-from, too-many-arguments, redefined-outer-name
+# pylance: disable=reportMissingImports, reportMissingModuleSource, reportGeneralTypeIssues
+# type: ignore
+
+"""get_rates(): all the pairs of a reply in one call, as a RateTable."""
+
+import logging
+
+import pytest
+
+from src.rate_table import RateTable, lookup_rate
+from tests.logcapture import capture_logs
+from tests.rates.doubles import LOGGER_NAME
+
+QUOTES = {"USDEUR": 0.9215, "USDRUB": 92.37, "USDGEL": 2.6915, "USDJPY": 151.83}
+
+
+def test_every_pair_is_what_get_rate_gives(make_manager):
+    manager = make_manager(quotes=QUOTES)
+    currencies = ["USD", "EUR", "RUB", "GEL", "JPY"]
+    table = manager.get_rates(currencies[:3], currencies)
+    for source in currencies[:3]:
+        for target in currencies:
+            assert table.rate(source, target) == manager.get_rate(source, target)
+    assert table.revision == manager.snapshot().revision
+    assert len(table) == 15
+
+
+def test_unknown_currencies_leave_their_pairs_empty_with_one_log_line(make_manager):
+    manager = make_manager(quotes=QUOTES)
+    with capture_logs(LOGGER_NAME, logging.WARNING) as captured:
+        table = manager.get_rates(["RUB", "XXX"], ["EUR", "YYY", "USD"])
+    assert len(captured.output) == 1
+    assert "XXX, YYY" in captured.output[0]
+    assert table.rate("RUB", "EUR") == manager.get_rate("RUB", "EUR")
+    assert table.rate("RUB", "YYY") is None
+    assert table.rate("XXX", "USD") is None
+    assert len(table) == 2
+
+
+def test_a_pair_that_was_not_asked_for_is_none(make_manager):
+    table = make_manager(quotes=QUOTES).get_rates(["RUB", "RUB"], ["EUR"])
+    assert table.sources == ("RUB",)
+    assert table.rate("EUR", "RUB") is None
+
+
+def test_a_table_needs_a_rate_per_pair():
+    with pytest.raises(ValueError, match="needs 4 rates"):
+        RateTable(["A", "B"], ["C", "D"], [1.0], revision=0)
+
+
+def test_lookup_reads_tables_and_plain_dicts_alike():
+    table = RateTable(["RUB"], ["EUR", "USD"], [0.01, None], revision=3)
+    assert lookup_rate(table, "RUB", "EUR") == lookup_rate({"RUB_EUR": 0.01}, "RUB", "EUR") == 0.01
+    assert lookup_rate(table, "RUB", "USD") is None
@@ -0,0 +1,166 @@
+# flake8: noqa
+# pylint: disable=broad-exception-raised, raise-missing-from, too-many-arguments, redefined-outer-name
+# pylance: disable=reportMissingImports, reportMissingModuleSource, reportGeneralTypeIssues
+# type: ignore
+
+"""The USD vector the manager keeps, and the cache file it is stored in.
+
+Only one number per currency is kept; every pair is derived from two of them, and has
+to come out exactly as the full cross-rate table of the old format had it. The file is
+the binary snapshot of src/rates_cache.py; the JSON files of earlier releases are read
+once and converted.
+"""
+
+import json
+import logging
+import struct
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.rates_cache import (
+    FORMAT_VERSION, MAGIC, decode_rates_cache, encode_rates_cache, read_rates_cache,
+)
+from tests.logcapture import capture_logs
+from tests.rates.doubles import LOGGER_NAME
+
+QUOTES = {"USDEUR": 0.9215, "USDRUB": 92.37, "USDGEL": 2.6915, "USDJPY": 151.83}
+USD_RATES = {"USD": 1.0, "EUR": 0.9215, "RUB": 92.37, "GEL": 2.6915, "JPY": 151.83}
+
+
+def _cross_rate_table(usd_rates):
+    """The cache of the oldest format, built the way the old update built it."""
+    return {
+        base: {target: usd_rates[target] * (1.0 / usd_rates[base]) for target in usd_rates if target != base}
+        for base in usd_rates
+    }
+
+
+def test_pairs_come_out_as_the_cross_rate_table_had_them(make_manager):
+    manager = make_manager(quotes=QUOTES)
+    for base, row in _cross_rate_table(USD_RATES).items():
+        for target, rate in row.items():
+            assert manager.get_rate(base, target) == rate
+    assert manager.get_rate("RUB", "RUB") == 1.0
+
+
+def test_the_file_is_the_binary_snapshot(cache_path, make_manager):
+    manager = make_manager(quotes=QUOTES)
+    content = cache_path.read_bytes()
+    assert content.startswith(MAGIC)
+    # Header, four bytes a code padded to eight, eight a rate.
+    assert len(content) == 40 + 24 + 8 * len(USD_RATES)
+    cached = read_rates_cache(cache_path)
+    assert cached.usd_rates == USD_RATES
+    assert list(cached.usd_rates) == list(USD_RATES)
+    assert cached.last_update == manager.snapshot().last_update
+    assert cached.revision == manager.snapshot().revision
+    assert not cached.legacy
+
+
+def test_a_snapshot_survives_the_round_trip_bit_for_bit():
+    usd_rates = {"USD": 1.0, "EUR": 0.1 + 0.2, "XAU": 1 / 2400.123, "BTC": 1.5e-5, "VND": 25455.123456789}
+    last_update = datetime(2026, 3, 29, 2, 30, 15, 123457)
+    cached = decode_rates_cache(encode_rates_cache(usd_rates, last_update, 41))
+    assert (cached.usd_rates, cached.last_update, cached.revision) == (usd_rates, last_update, 41)
+
+
+def test_a_restart_reads_the_binary_cache_without_a_request(make_manager):
+    first = make_manager(quotes=QUOTES)
+    second = make_manager()
+    assert second.calls == 0
+    assert second.get_rate("EUR", "RUB") == first.get_rate("EUR", "RUB")
+    assert second.snapshot().last_update == first.snapshot().last_update
+
+
+@pytest.mark.parametrize("damage, reason", [
+    (lambda content: content[:-3], "need"),
+    (lambda content: content[:10], "shorter than its header"),
+    (lambda content: content[:41] + b"X" + content[42:], "checksum"),
+    (lambda content: content[:4] + struct.pack("<H", FORMAT_VERSION + 1) + content[6:], "format version"),
+])
+def test_a_damaged_file_is_refused_and_replaced(cache_path, make_manager, damage, reason):
+    make_manager(quotes=QUOTES)
+    cache_path.write_bytes(damage(cache_path.read_bytes()))
+    with pytest.raises(ValueError, match=reason):
+        read_rates_cache(cache_path)
+
+    with capture_logs(LOGGER_NAME, logging.ERROR) as captured:
+        manager = make_manager()
+    assert any("Failed to load rates cache" in line for line in captured.output)
+    assert manager.calls == 1
+    assert read_rates_cache(cache_path).usd_rates["EUR"] == 0.5
+
+
+def test_a_json_vector_is_converted_and_removed(cache_path, legacy_cache_path, make_manager):
+    last_update = datetime.now() - timedelta(minutes=5)
+    legacy_cache_path.write_text(json.dumps({
+        "base": "USD", "usd_rates": USD_RATES, "last_update": last_update.isoformat(),
+    }, indent=2), encoding="utf-8")
+
+    manager = make_manager()
+
+    assert manager.calls == 0
+    assert manager.get_rate("EUR", "RUB") == 92.37 * (1.0 / 0.9215)
+    assert not legacy_cache_path.exists()
+    cached = read_rates_cache(cache_path)
+    assert (cached.usd_rates, cached.last_update) == (USD_RATES, last_update)
+
+
+def test_a_cross_rate_table_is_converted(cache_path, legacy_cache_path, make_manager):
+    usd_rates = {"USD": 1.0, "EUR": 0.9, "RUB": 90.0}
+    legacy_cache_path.write_text(json.dumps({
+        "rates": _cross_rate_table(usd_rates),
+        "last_update": (datetime.now() - timedelta(minutes=5)).isoformat(),
+    }, indent=2), encoding="utf-8")
+
+    manager = make_manager()
+
+    # Fresh enough: no API request, the old snapshot is served as it was.
+    assert manager.calls == 0
+    assert manager.get_rate("EUR", "RUB") == 90.0 * (1.0 / 0.9)
+    assert sorted(manager.get_available_currencies()) == ["EUR", "RUB", "USD"]
+    assert read_rates_cache(cache_path).usd_rates == usd_rates
+
+    # And the next start reads the binary file.
+    assert make_manager().get_rate("EUR", "RUB") == 90.0 * (1.0 / 0.9)
+
+
+def test_a_json_cache_at_the_cache_path_itself_is_converted_in_place(tmp_path, make_manager):
+    """EXCHANGE_RATES_CACHE_PATH set to the old .json path: the file is told by its content."""
+    path = tmp_path / "rates.json"
+    path.write_text(json.dumps({
+        "base": "USD", "usd_rates": {"USD": 1.0, "EUR": 0.9}, "last_update": datetime.now().isoformat(),
+    }), encoding="utf-8")
+    manager = make_manager(cache_file=str(path))
+    assert manager.calls == 0
+    assert path.read_bytes().startswith(MAGIC)
+    assert read_rates_cache(path).usd_rates == {"USD": 1.0, "EUR": 0.9}
+
+
+def test_the_binary_cache_wins_over_a_leftover_json(cache_path, legacy_cache_path, make_manager):
+    make_manager(quotes=QUOTES)
+    legacy_cache_path.write_text(json.dumps({
+        "base": "USD", "usd_rates": {"USD": 1.0, "EUR": 5.0}, "last_update": datetime.now().isoformat(),
+    }), encoding="utf-8")
+    assert make_manager().get_rate("USD", "EUR") == 0.9215
+
+
+def test_an_old_table_without_a_usd_row_is_read_through_another_row(legacy_cache_path, make_manager):
+    legacy_cache_path.write_text(json.dumps({
+        "rates": {"EUR": {"USD": 2.0, "RUB": 180.0}},
+        "last_update": datetime.now().isoformat(),
+    }), encoding="utf-8")
+    manager = make_manager()
+    assert manager.calls == 0
+    assert manager.get_rate("USD", "EUR") == 0.5
+    assert manager.get_rate("USD", "RUB") == 90.0
+
+
+def test_a_cache_with_a_rate_nothing_can_be_divided_by_is_rejected(cache_path, make_manager):
+    cache_path.write_bytes(encode_rates_cache({"USD": 1.0, "EUR": 0.0}, datetime.now(), 1))
+    with capture_logs(LOGGER_NAME, logging.ERROR) as captured:
+        manager = make_manager()
+    assert any("Failed to load rates cache" in line for line in captured.output)
+    assert manager.calls == 1
+    assert manager.get_rate("USD", "EUR") == 0.5
@@ -12,6 +12,7 @@ import logging
 from datetime import datetime, timedelta, timezone
 
 from src.exchange_rates_manager import CLOCK_SKEW_TOLERANCE, _future_skew
+from src.rates_cache import read_rates_cache
 from tests.logcapture import capture_logs
 from tests.rates.doubles import LOGGER_NAME
 
@@ -27,8 +28,8 @@ class TestClockGoingBackwards:
             "last_update": (datetime.now() + timedelta(hours=hours)).isoformat(),
         }), encoding="utf-8")
 
-    def test_a_cache_stamped_in_the_future_is_refreshed_at_startup(self, cache_path, make_manager):
-        self._write_cache_from_the_future(cache_path)
+    def test_a_cache_stamped_in_the_future_is_refreshed_at_startup(self, legacy_cache_path, make_manager):
+        self._write_cache_from_the_future(legacy_cache_path)
 
         with capture_logs(LOGGER_NAME, logging.WARNING) as captured:
             manager = make_manager()
@@ -39,21 +40,21 @@ class TestClockGoingBackwards:
         assert manager.calls == 1
         assert manager.get_rate("USD", "EUR") == 0.5
 
-    def test_a_newer_snapshot_on_disk_does_not_block_the_write(self, cache_path, make_manager):
+    def test_a_newer_snapshot_on_disk_does_not_block_the_write(self, cache_path, legacy_cache_path, make_manager):
         """The write guard orders the savers of THIS process; a file claiming to be
         from the future used to veto every cache write for as long as the clock stayed
         behind it, while the log cheerfully said "Successfully updated rates"."""
-        self._write_cache_from_the_future(cache_path)
+        self._write_cache_from_the_future(legacy_cache_path)
 
         manager = make_manager()
 
-        on_disk = json.loads(cache_path.read_text(encoding="utf-8"))
-        assert on_disk["rates"]["USD"]["EUR"] == 0.5
-        assert on_disk["rates"]["USD"]["EUR"] == manager.get_rate("USD", "EUR")
+        on_disk = read_rates_cache(cache_path)
+        assert on_disk.usd_rates["EUR"] == 0.5
+        assert on_disk.usd_rates["EUR"] == manager.get_rate("USD", "EUR")
 
     def test_the_reported_age_is_never_negative(self, make_manager):
         manager = make_manager()
-        manager._last_update = datetime.now() + timedelta(hours=3)
+        manager._snapshot = manager._snapshot._replace(last_update=datetime.now() + timedelta(hours=3))
 
         with capture_logs(LOGGER_NAME, logging.WARNING) as captured:
             age = manager.rates_age()
@@ -63,7 +64,7 @@ class TestClockGoingBackwards:
 
     def test_a_small_skew_is_not_worth_a_warning(self, make_manager):
         manager = make_manager()
-        manager._last_update = datetime.now() + timedelta(seconds=30)
+        manager._snapshot = manager._snapshot._replace(last_update=datetime.now() + timedelta(seconds=30))
 
         with capture_logs(LOGGER_NAME, logging.INFO) as captured:
             manager._log_rates_age()
@@ -79,11 +80,11 @@ class TestBrokenCacheTimestamp:
     cannot start — and `restart: always` then loops on it forever, because the offending
     file sits on the data volume and a restart changes nothing about it."""
 
-    def test_a_timestamp_with_an_offset_does_not_kill_the_constructor(self, cache_path, make_manager):
+    def test_a_timestamp_with_an_offset_does_not_kill_the_constructor(self, legacy_cache_path, make_manager):
         """The realistic trigger is not a hand-edited file: the day _save_cache starts
         writing datetime.now(timezone.utc), every cache left by the previous release
         becomes one of these."""
-        cache_path.write_text(json.dumps({
+        legacy_cache_path.write_text(json.dumps({
             "rates": {"USD": {"EUR": 0.9}, "EUR": {"USD": 1.1}},
             "last_update": (datetime.now(timezone.utc) - timedelta(hours=5)).isoformat(),
         }), encoding="utf-8")
@@ -91,7 +92,7 @@ class TestBrokenCacheTimestamp:
         manager = make_manager()
 
         # Normalised at load, so nothing downstream can hit the mixed subtraction again.
-        assert manager._last_update.tzinfo is None
+        assert manager.snapshot().last_update.tzinfo is None
         # Five hours is past the two-hour threshold, and the instant survives the
         # conversion, so the stamp is read as old rather than as broken.
         assert manager.calls == 1
@@ -113,7 +114,7 @@ class TestBrokenCacheTimestamp:
         update thread, which has no handler around its loop — one such timestamp ended
         the periodic updates for the rest of the process' life."""
         manager = make_manager()
-        manager._last_update = datetime.now(timezone.utc)
+        manager._snapshot = manager._snapshot._replace(last_update=datetime.now(timezone.utc))
 
         with capture_logs(LOGGER_NAME, logging.WARNING):
             assert manager.rates_age() == timedelta(0)
@@ -121,12 +122,12 @@ class TestBrokenCacheTimestamp:
         with capture_logs(LOGGER_NAME, logging.WARNING):
             manager._log_rates_age()
 
-    def test_an_unparsable_timestamp_leaves_no_half_loaded_state(self, cache_path, make_manager):
+    def test_an_unparsable_timestamp_leaves_no_half_loaded_state(self, legacy_cache_path, make_manager):
         """The cache is rejected AND the update fails, so all three answers have to agree
         on "there are no rates". Serving 0.9 while rates_age() says None means the bot
         converts with numbers the log insists do not exist — and keeps at it until some
         later update happens to succeed."""
-        cache_path.write_text(json.dumps({
+        legacy_cache_path.write_text(json.dumps({
             "rates": {"USD": {"EUR": 0.9}, "EUR": {"USD": 1.1}},
             "last_update": "not a date at all",
         }), encoding="utf-8")
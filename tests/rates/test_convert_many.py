@@ -0,0 +1,119 @@
+# flake8: noqa
+# pylint: disable=broad-exception-raised, raise-missing-from, too-many-arguments, redefined-outer-name
+# pylance: disable=reportMissingImports, reportMissingModuleSource, reportGeneralTypeIssues
+# type: ignore
+
+"""The rates as a float64 vector, and convert_many() over it.
+
+Every element has to be what amount * get_rate() gives, bit for bit, and a position
+has to keep meaning the same currency across updates.
+"""
+
+import logging
+import os
+import random
+import subprocess
+import sys
+import textwrap
+
+import numpy
+import pytest
+
+from src.exchange_rates_manager import _NO_RATES
+from tests.logcapture import capture_logs
+from tests.rates.doubles import LOGGER_NAME
+
+QUOTES = {"USDEUR": 0.9215, "USDRUB": 92.37, "USDGEL": 2.6915, "USDJPY": 151.83}
+CURRENCIES = ["USD", "EUR", "RUB", "GEL", "JPY"]
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_the_vector_holds_the_usd_rates(make_manager):
+    snapshot = make_manager(quotes=QUOTES).snapshot()
+    assert snapshot.vector.dtype == numpy.float64
+    assert {currency: snapshot.vector[snapshot.index[currency]] for currency in CURRENCIES} == dict(snapshot.usd_rates)
+    with pytest.raises(ValueError):
+        snapshot.vector[0] = 2.0
+
+
+def test_every_element_is_amount_times_get_rate(make_manager):
+    manager = make_manager(quotes=QUOTES)
+    rng = random.Random(21)
+    amounts = [rng.choice([1, 5, 100, 0.01, 12.5, 1999.99, 3e9]) * rng.random() for _ in range(200)]
+    sources = [rng.choice(CURRENCIES) for _ in amounts]
+    converted = manager.convert_many(amounts, sources, CURRENCIES)
+    assert converted.shape == (200, 5)
+    for row, (amount, source) in enumerate(zip(amounts, sources)):
+        for column, target in enumerate(CURRENCIES):
+            assert converted[row, column] == amount * manager.get_rate(source, target)
+
+
+def test_positions_resolved_once_give_the_same_answer(make_manager):
+    snapshot = make_manager(quotes=QUOTES).snapshot()
+    amounts = [10.0, 20.0, 30.0]
+    sources = ["RUB", "EUR", "RUB"]
+    by_code = snapshot.convert_many(amounts, sources, CURRENCIES)
+    by_position = snapshot.convert_many(amounts, snapshot.positions(sources), snapshot.positions(CURRENCIES))
+    assert numpy.array_equal(by_code, by_position)
+
+
+def test_positions_survive_updates(make_manager):
+    manager = make_manager(quotes=QUOTES)
+    first = manager.snapshot()
+    manager.quotes = {"USDRUB": 95.0, "USDTRY": 32.1}
+    assert manager._update_all_rates()
+    second = manager.snapshot()
+
+    for currency, position in first.index.items():
+        assert second.index[currency] == position
+    assert second.index["TRY"] == len(first.index)
+    assert second.vector[second.index["RUB"]] == 95.0
+    # EUR is no longer quoted: its position stays taken, and converts to nothing.
+    assert numpy.isnan(second.vector[second.index["EUR"]])
+    # The old snapshot is untouched.
+    assert first.vector[first.index["RUB"]] == 92.37
+
+
+def test_unknown_currencies_are_nan_with_one_log_line(make_manager):
+    manager = make_manager(quotes=QUOTES)
+    with capture_logs(LOGGER_NAME, logging.WARNING) as captured:
+        converted = manager.convert_many([1.0, 2.0], ["XXX", "RUB"], ["EUR", "YYY"])
+    assert len(captured.output) == 1
+    assert "XXX, YYY" in captured.output[0]
+    assert numpy.isnan(converted[0]).all()
+    assert numpy.isnan(converted[1, 1])
+    assert converted[1, 0] == 2.0 * manager.get_rate("RUB", "EUR")
+
+
+def test_no_rates_converts_nothing(make_manager):
+    converted = make_manager(failures=99).convert_many([1.0], ["USD"], ["EUR"])
+    assert numpy.isnan(converted).all()
+
+
+def test_each_amount_needs_a_source():
+    with pytest.raises(ValueError, match="one source currency per amount"):
+        _NO_RATES.convert_many([1.0, 2.0], ["USD"], ["EUR"])
+
+
+def test_the_manager_starts_and_converts_without_numpy(tmp_path):
+    # A fresh interpreter: this one has imported numpy already.
+    script = textwrap.dedent(f"""
+        import json, sys
+        sys.modules["numpy"] = None
+        from src.exchange_rates_manager import ExchangeRatesManager
+        from src.rate_providers import FileRatesProvider
+        rates = {str(tmp_path / "rates.json")!r}
+        json.dump({{"base": "USD", "rates": {{"USD": 1, "EUR": 0.5}}}}, open(rates, "w"))
+        manager = ExchangeRatesManager(cache_file={str(tmp_path / "cache.bin")!r}, history_file={str(tmp_path / "history.bin")!r},
+                                       start_update_thread=False, providers=[FileRatesProvider(rates)])
+        assert manager.get_rate("USD", "EUR") == 0.5
+        try:
+            manager.convert_many([1.0], ["USD"], ["EUR"])
+        except ImportError as e:
+            assert "numpy" in str(e)
+        else:
+            raise AssertionError("converted without numpy")
+        manager.close()
+    """)
+    result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
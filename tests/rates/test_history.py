@@ -0,0 +1,117 @@
+# flake8: noqa
+# pylint: disable=broad-exception-raised, raise-missing-from, too-many-arguments, redefined-outer-name
+# pylance: disable=reportMissingImports, reportMissingModuleSource, reportGeneralTypeIssues
+# type: ignore
+
+"""The rates history: every snapshot appended, looked up by time, thinned out with age."""
+
+import logging
+from datetime import datetime, timedelta
+
+from src.rates_history import RatesHistory, retained
+from tests.logcapture import capture_logs
+
+DAY = datetime(2026, 3, 1)
+
+
+def _rates(eur):
+    return {"USD": 1.0, "EUR": eur, "RUB": 90.0}
+
+
+def test_a_lookup_finds_the_snapshot_being_served_then(tmp_path):
+    history = RatesHistory(str(tmp_path / "history.bin"), intraday_days=30)
+    now = DAY + timedelta(days=1)
+    history.append(_rates(0.90), DAY + timedelta(hours=8), now=now)
+    history.append(_rates(0.95), DAY + timedelta(hours=20), now=now)
+
+    assert history.get_rate_at("USD", "EUR", DAY + timedelta(hours=7)) is None
+    assert history.get_rate_at("USD", "EUR", DAY + timedelta(hours=8)) == 0.90
+    assert history.get_rate_at("USD", "EUR", DAY + timedelta(hours=19, minutes=59)) == 0.90
+    assert history.get_rate_at("USD", "EUR", DAY + timedelta(days=40)) == 0.95
+    assert history.get_rate_at("EUR", "RUB", DAY + timedelta(hours=9)) == 90.0 * (1.0 / 0.90)
+    assert history.get_rate_at("USD", "XXX", DAY + timedelta(hours=9)) is None
+
+
+def test_the_history_survives_a_restart(tmp_path):
+    path = str(tmp_path / "history.bin")
+    first = RatesHistory(path, intraday_days=30)
+    for hour in (1, 2, 3):
+        first.append(_rates(hour / 10), DAY + timedelta(hours=hour), now=DAY)
+    second = RatesHistory(path, intraday_days=30)
+    assert len(second) == 3
+    assert second.span() == (DAY + timedelta(hours=1), DAY + timedelta(hours=3))
+    assert second.get_rate_at("USD", "EUR", DAY + timedelta(hours=2, minutes=30)) == 0.2
+
+
+def test_the_same_moment_is_not_appended_twice(tmp_path):
+    history = RatesHistory(str(tmp_path / "history.bin"), intraday_days=30)
+    assert history.append(_rates(0.9), DAY, now=DAY)
+    assert not history.append(_rates(0.9), DAY, now=DAY)
+    assert not history.append(_rates(0.8), DAY - timedelta(hours=1), now=DAY)
+    assert len(history) == 1
+
+
+def test_retention_keeps_recent_snapshots_and_the_last_of_older_days():
+    timestamps = [
+        DAY + timedelta(hours=8), DAY + timedelta(hours=20),
+        DAY + timedelta(days=1, hours=8), DAY + timedelta(days=1, hours=20),
+        DAY + timedelta(days=9, hours=8), DAY + timedelta(days=9, hours=20),
+    ]
+    now = DAY + timedelta(days=10)
+    assert retained(timestamps, now, intraday_days=5) == [False, True, False, True, True, True]
+    assert retained(timestamps, now, intraday_days=0) == [False, True, False, True, False, True]
+
+
+def test_compaction_rewrites_the_file_with_what_is_kept(tmp_path):
+    path = str(tmp_path / "history.bin")
+    history = RatesHistory(path, intraday_days=2)
+    for day in range(5):
+        for hour in (8, 20):
+            history.append(_rates(day + hour / 100), DAY + timedelta(days=day, hours=hour), now=DAY)
+    assert len(history) == 10
+
+    assert history.compact(now=DAY + timedelta(days=5)) == 3
+    assert len(history) == 7
+    # The morning of an old day now answers with the day before's closing rate.
+    assert history.get_rate_at("USD", "EUR", DAY + timedelta(days=1, hours=9)) == 0.20
+    assert history.get_rate_at("USD", "EUR", DAY + timedelta(days=4, hours=9)) == 4.08
+    assert len(RatesHistory(path, intraday_days=2)) == 7
+    assert list(tmp_path.glob("*.tmp")) == []
+
+
+def test_a_torn_append_is_cut_off(tmp_path):
+    path = tmp_path / "history.bin"
+    history = RatesHistory(str(path), intraday_days=30)
+    history.append(_rates(0.9), DAY, now=DAY)
+    good_size = path.stat().st_size
+    history.append(_rates(0.8), DAY + timedelta(hours=1), now=DAY)
+    path.write_bytes(path.read_bytes()[:good_size + 50])
+
+    with capture_logs("rates_history", logging.WARNING) as captured:
+        reopened = RatesHistory(str(path), intraday_days=30)
+    assert any("damaged" in line for line in captured.output)
+    assert len(reopened) == 1
+    assert path.stat().st_size == good_size
+    # The next append lands on a clean boundary.
+    reopened.append(_rates(0.7), DAY + timedelta(hours=2), now=DAY)
+    assert len(RatesHistory(str(path), intraday_days=30)) == 2
+
+
+def test_every_update_is_recorded_and_answerable(make_manager):
+    manager = make_manager(quotes={"USDEUR": 0.9})
+    first = manager.snapshot().last_update
+    manager.quotes = {"USDEUR": 0.8}
+    assert manager._update_all_rates()
+
+    assert manager.get_rate_at("USD", "EUR", first) == 0.9
+    assert manager.get_rate_at("USD", "EUR", datetime.now()) == 0.8
+    assert manager.get_rate_at("USD", "EUR", first - timedelta(seconds=1)) is None
+
+
+def test_the_cached_snapshot_joins_a_new_history_once(cache_path, make_manager):
+    make_manager(quotes={"USDEUR": 0.9})
+    cache_path.with_name("rates_history.bin").unlink()
+    make_manager()
+    restarted = make_manager()
+    assert restarted.calls == 0
+    assert len(restarted._history) == 1
@@ -0,0 +1,82 @@
+# flake8: noqa
+# pylint: disable=broad-exception-raised, raise-missing-from, too-many-arguments, redefined-outer-name
+# pylance: disable=reportMissingImports, reportMissingModuleSource, reportGeneralTypeIssues
+# type: ignore
+
+"""Leader election: several managers on one data directory, one of them fetching."""
+
+import os
+import time
+from datetime import datetime, timedelta
+
+from src.rates_cache import encode_rates_cache
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_only_the_leader_fetches(make_manager):
+    leader = make_manager(leader_election=True, quotes={"USDEUR": 0.9})
+    follower = make_manager(leader_election=True, quotes={"USDEUR": 0.1})
+
+    assert (leader.leadership(), follower.leadership()) == ("leader", "follower")
+    assert (leader.calls, follower.calls) == (1, 0)
+    assert follower.get_rate("USD", "EUR") == 0.9
+    assert follower.snapshot().last_update == leader.snapshot().last_update
+
+
+def test_a_follower_swaps_in_the_leaders_update(make_manager):
+    leader = make_manager(leader_election=True, quotes={"USDEUR": 0.9})
+    # The poll is far off: the watchdog notification is what brings the update in.
+    follower = make_manager(leader_election=True, start_update_thread=True, follower_poll_interval=60)
+    leader.quotes = {"USDEUR": 0.8}
+    assert leader._update_all_rates()
+
+    _wait_for(lambda: follower.get_rate("USD", "EUR") == 0.8)
+    assert follower.calls == 0
+    # The history came along with the cache.
+    assert follower.get_rate_at("USD", "EUR", datetime.now()) == 0.8
+
+
+def test_a_follower_writes_nothing(cache_path, make_manager):
+    make_manager(leader_election=True)
+    before = {path.name: path.stat().st_mtime_ns for path in cache_path.parent.iterdir()}
+    follower = make_manager(leader_election=True)
+    follower._follow_cache()
+    assert {path.name: path.stat().st_mtime_ns for path in cache_path.parent.iterdir()} == before
+
+
+def test_a_follower_takes_over_when_the_leader_stops(cache_path, make_manager):
+    leader = make_manager(leader_election=True, quotes={"USDEUR": 0.9})
+    follower = make_manager(leader_election=True, start_update_thread=True, follower_poll_interval=0.05,
+                            quotes={"USDEUR": 0.7})
+    # The leader's rates go stale, and then the leader goes away.
+    stale = datetime.now() - timedelta(hours=3)
+    cache_path.write_bytes(encode_rates_cache({"USD": 1.0, "EUR": 0.9}, stale, 1))
+    _wait_for(lambda: follower.snapshot().last_update == stale)
+    leader.close()
+
+    _wait_for(lambda: follower.leadership() == "leader")
+    _wait_for(lambda: follower.get_rate("USD", "EUR") == 0.7)
+    assert follower.calls == 1
+    assert f"pid {os.getpid()}" in cache_path.with_name(f"{cache_path.name}.lease").read_text()
+
+
+def test_a_new_leader_with_fresh_rates_does_not_fetch(make_manager):
+    leader = make_manager(leader_election=True)
+    follower = make_manager(leader_election=True, start_update_thread=True, follower_poll_interval=0.05)
+    leader.close()
+
+    _wait_for(lambda: follower.leadership() == "leader")
+    assert follower.calls == 0
+    assert follower.get_rate("USD", "EUR") == 0.5
+
+
+def test_without_election_there_is_no_lease(cache_path, make_manager):
+    manager = make_manager()
+    assert manager.leadership() is None
+    assert not cache_path.with_name(f"{cache_path.name}.lease").exists()
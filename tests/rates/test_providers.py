@@ -0,0 +1,170 @@
+# flake8: noqa
+# pylint: disable=broad-exception-raised, raise-missing-from, too-many-arguments, redefined-outer-name
+# pylance: disable=reportMissingImports, reportMissingModuleSource, reportGeneralTypeIssues
+# type: ignore
+
+"""Rate providers asked together: failover, hedging, and the statistics that order them."""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.exchange_rates_manager import ExchangeRatesManager
+from src.rate_providers import (
+    FileRatesProvider, JsonRatesProvider, ProviderPool, RateProvider, rates_from_payload,
+)
+
+
+class FakeProvider(RateProvider):
+    """Answers `quotes` after `delay` seconds, or raises `error`."""
+
+    def __init__(self, name, quotes=None, delay=0.0, error=None):
+        self.name = name
+        self.quotes = {"EUR": 0.5} if quotes is None else quotes
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    def fetch(self, timeout):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return dict(self.quotes)
+
+
+def _wait_for_requests(pool, count):
+    """The losers of a fetch finish in the background; their statistics come later."""
+    deadline = time.monotonic() + 5
+    while sum(provider['requests'] for provider in pool.stats()) < count:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_a_failure_asks_the_next_provider_at_once():
+    broken = FakeProvider("broken", error=RuntimeError("503"))
+    pool = ProviderPool([broken, FakeProvider("spare", quotes={"EUR": 0.9})], timeout=10, hedge_delay=60)
+    started = time.monotonic()
+    assert pool.fetch() == ("spare", {"EUR": 0.9})
+    assert time.monotonic() - started < 5
+
+
+def test_a_slow_provider_is_overtaken_after_the_hedge_delay():
+    slow = FakeProvider("slow", quotes={"EUR": 0.1}, delay=1.0)
+    fast = FakeProvider("fast", quotes={"EUR": 0.2})
+    pool = ProviderPool([slow, fast], timeout=10, hedge_delay=0.05)
+    started = time.monotonic()
+    assert pool.fetch() == ("fast", {"EUR": 0.2})
+    assert time.monotonic() - started < 0.9
+    # The slow request still ends, and is counted.
+    _wait_for_requests(pool, 2)
+
+
+def test_a_quick_provider_is_not_hedged():
+    spare = FakeProvider("spare")
+    pool = ProviderPool([FakeProvider("quick"), spare], timeout=10, hedge_delay=5)
+    assert pool.fetch()[0] == "quick"
+    assert spare.calls == 0
+
+
+def test_quotes_with_nothing_usable_are_a_failure():
+    pool = ProviderPool([FakeProvider("dead", quotes={"ZWL": 0.0}), FakeProvider("alive")], timeout=10, hedge_delay=5)
+    assert pool.fetch()[0] == "alive"
+    dead = next(provider for provider in pool.stats() if provider['name'] == "dead")
+    assert (dead['requests'], dead['failures']) == (1, 1)
+    assert "no usable quotes" in dead['last_error']
+
+
+def test_every_failure_is_named_when_none_answers():
+    pool = ProviderPool([FakeProvider("a", error=RuntimeError("timeout")), FakeProvider("b", error=ValueError("bad json"))],
+                        timeout=10, hedge_delay=0)
+    with pytest.raises(RuntimeError, match="Every rate provider failed") as caught:
+        pool.fetch()
+    assert "a: timeout" in str(caught.value)
+    assert "b: bad json" in str(caught.value)
+
+
+def test_the_statistics_reorder_the_providers():
+    flaky = FakeProvider("flaky", error=RuntimeError("503"))
+    steady = FakeProvider("steady")
+    pool = ProviderPool([flaky, steady], timeout=10, hedge_delay=5)
+    assert [provider.name for provider in pool.ranked()] == ["flaky", "steady"]
+    pool.fetch()
+    assert [provider.name for provider in pool.ranked()] == ["steady", "flaky"]
+    flaky.error = None
+    pool.fetch()
+    # Asked first now, the steady one answers and the flaky one is not asked again.
+    assert flaky.calls == 1
+    assert [provider['wins'] for provider in pool.stats()] == [2, 0]
+
+
+def test_a_provider_not_asked_yet_keeps_its_place_behind_a_quick_one():
+    spare = FakeProvider("spare")
+    pool = ProviderPool([FakeProvider("primary"), spare], timeout=10, hedge_delay=5)
+    for _ in range(3):
+        assert pool.fetch()[0] == "primary"
+    assert [provider.name for provider in pool.ranked()] == ["primary", "spare"]
+    assert spare.calls == 0
+
+
+def test_a_provider_not_asked_yet_goes_before_one_slower_than_the_hedge_delay():
+    slow = FakeProvider("slow", delay=0.2)
+    pool = ProviderPool([slow, FakeProvider("spare")], timeout=10, hedge_delay=0.1)
+    pool._stats["slow"].latency = 0.2
+    assert [provider.name for provider in pool.ranked()] == ["spare", "slow"]
+
+
+def test_no_hedge_delay_asks_everyone_at_once():
+    providers = [FakeProvider(name, delay=0.2) for name in ("a", "b", "c")]
+    pool = ProviderPool(providers, timeout=10, hedge_delay=0)
+    pool.fetch()
+    _wait_for_requests(pool, 3)
+    assert [provider.calls for provider in providers] == [1, 1, 1]
+
+
+def test_a_payload_against_another_base_is_converted():
+    quotes = rates_from_payload({"base": "EUR", "rates": {"USD": 2.0, "RUB": 180.0}})
+    assert quotes == {"RUB": 90.0, "EUR": 0.5}
+    with pytest.raises(RuntimeError, match="failed"):
+        rates_from_payload({"result": "error", "error-type": "invalid-key"})
+
+
+def test_a_manager_runs_from_a_local_file(tmp_path):
+    rates_file = tmp_path / "rates.json"
+    rates_file.write_text(json.dumps({"base": "USD", "rates": {"USD": 1, "EUR": 0.9, "RUB": 90.0}}), encoding="utf-8")
+    manager = ExchangeRatesManager(cache_file=str(tmp_path / "cache.bin"), history_file=str(tmp_path / "history.bin"),
+                                   start_update_thread=False, providers=[FileRatesProvider(str(rates_file))])
+    try:
+        assert manager.get_rate("EUR", "RUB") == 90.0 * (1.0 / 0.9)
+        [stats] = manager.provider_stats()
+        assert (stats['name'], stats['requests'], stats['wins']) == (f"file:{rates_file}", 1, 1)
+    finally:
+        manager.close()
+
+
+def test_an_http_stand_in_is_read_like_any_json_source():
+    body = json.dumps({"result": "success", "base_code": "USD", "rates": {"USD": 1, "GEL": 2.7}}).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        provider = JsonRatesProvider(f"http://127.0.0.1:{server.server_port}/latest/USD")
+        assert provider.name == f"127.0.0.1:{server.server_port}"
+        assert provider.fetch(timeout=5) == {"USD": 1, "GEL": 2.7}
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -77,8 +77,8 @@ def test_the_background_thread_actually_retries(make_manager):
     assert not manager._update_thread_handle.is_alive()
 
 
-def test_a_fresh_cache_costs_no_api_request(cache_path, make_manager):
-    cache_path.write_text(json.dumps({
+def test_a_fresh_cache_costs_no_api_request(legacy_cache_path, make_manager):
+    legacy_cache_path.write_text(json.dumps({
         "rates": {"USD": {"EUR": 0.9}, "EUR": {"USD": 1.1}},
         "last_update": datetime.now().isoformat(),
     }), encoding="utf-8")
@@ -90,8 +90,8 @@ def test_a_fresh_cache_costs_no_api_request(cache_path, make_manager):
     assert sorted(manager.get_available_currencies()) == ["EUR", "USD"]
 
 
-def test_a_stale_cache_is_refreshed_at_startup(cache_path, make_manager):
-    cache_path.write_text(json.dumps({
+def test_a_stale_cache_is_refreshed_at_startup(legacy_cache_path, make_manager):
+    legacy_cache_path.write_text(json.dumps({
         "rates": {"USD": {"EUR": 0.9}},
         "last_update": (datetime.now() - timedelta(hours=5)).isoformat(),
     }), encoding="utf-8")
@@ -0,0 +1,63 @@
+# flake8: noqa
+# pylint: disable=broad-exception-raised, raise-missing-from, too-many-arguments, redefined-outer-name
+# pylance: disable=reportMissingImports, reportMissingModuleSource, reportGeneralTypeIssues
+# type: ignore
+
+"""Published rates are immutable snapshots: readers pin one and never take the lock."""
+
+import threading
+
+import pytest
+
+
+def test_a_pinned_snapshot_outlives_the_update(make_manager):
+    manager = make_manager()
+    pinned = manager.snapshot()
+    manager.quotes = {"USDEUR": 0.8}
+    assert manager._update_all_rates()
+
+    assert pinned.get_rate("USD", "EUR") == 0.5
+    assert manager.snapshot().get_rate("USD", "EUR") == 0.8
+    assert manager.get_rate("USD", "EUR") == 0.8
+    assert manager.snapshot().revision == pinned.revision + 1
+
+
+def test_every_published_snapshot_has_a_new_revision(cache_path, make_manager):
+    first = make_manager()
+    assert first.snapshot().revision == 1
+    # Loaded from the cache the first one wrote: a snapshot like any other.
+    second = make_manager()
+    assert second.calls == 0
+    assert second.snapshot().revision == 1
+    assert second._update_all_rates()
+    assert second.snapshot().revision == 2
+
+
+def test_a_snapshot_cannot_be_changed(make_manager):
+    snapshot = make_manager().snapshot()
+    with pytest.raises(TypeError):
+        snapshot.usd_rates["EUR"] = 1.0
+    with pytest.raises(AttributeError):
+        snapshot.revision = 7
+
+
+def test_no_rates_is_an_empty_snapshot(make_manager):
+    snapshot = make_manager(failures=99).snapshot()
+    assert (snapshot.revision, snapshot.last_update, snapshot.currencies) == (0, None, ())
+    assert snapshot.get_rate("USD", "EUR") is None
+
+
+def test_readers_never_wait_for_the_writers_lock(make_manager):
+    manager = make_manager()
+    answers = []
+
+    def read():
+        answers.append((manager.get_rate("USD", "EUR"), manager.snapshot().revision,
+                        manager.get_available_currencies(), manager.rates_age() is not None))
+
+    with manager._lock:
+        reader = threading.Thread(target=read)
+        reader.start()
+        reader.join(timeout=5)
+        assert not reader.is_alive()
+    assert answers == [(0.5, 1, ["USD", "EUR"], True)]
@@ -47,7 +47,7 @@ def _recorded_temp_names(manager):
     with mock.patch.object(os, "replace", side_effect=record):
         for index in (1, 2):
             manager._save_cache(
-                {"USD": {"EUR": float(index)}},
+                {"USD": 1.0, "EUR": float(index)},
                 datetime.now(),
                 manager._rates_revision + index,
             )